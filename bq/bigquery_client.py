@@ -7,19 +7,33 @@
 
 import abc
 import collections
+import copy
+import cStringIO
+import csv
 import datetime
+import fnmatch
+import glob
+import gzip
 import hashlib
+import httplib
 import itertools
 import json
 import logging
+import mmap
+import multiprocessing
 import os
 import pkgutil
+import Queue
 import random
 import re
+import socket
+import sqlite3
 import string
 import sys
 import textwrap
+import threading
 import time
+import zlib
 
 
 import apiclient
@@ -32,12 +46,81 @@ import httplib2
 # To configure apiclient logging.
 import gflags as flags
 
+import table_formatter
+
 # A unique non-None default, for use in kwargs that need to
 # distinguish default from None.
 _DEFAULT = object()
 # The max number of rows requested in a single page if no explicit
 # value is specified.
 _MAX_ROWS_PER_REQUEST = 1000000
+# The number of jobs started concurrently by operations that start
+# more than one job, if no explicit value is specified.
+_MAX_CONCURRENT_JOBS = 4
+# The size of each request of a resumable media upload, if no explicit
+# value is specified. Must be a multiple of _UPLOAD_CHUNK_ALIGNMENT.
+_UPLOAD_CHUNK_SIZE = 8 * 1024 * 1024
+_UPLOAD_CHUNK_ALIGNMENT = 256 * 1024
+# The number of times a failed upload chunk is retried before giving up.
+_UPLOAD_RETRIES = 5
+# The versions of apiclient whose HttpRequest is known to keep the state
+# that _ResumableUpload uses.
+_RESUMABLE_UPLOAD_APICLIENT_VERSIONS = ('1.2',)
+# The number of rows in each shard of a table read by ExtractLocal, and
+# the number of shards read at once, if no explicit value is specified.
+_EXTRACT_SHARD_ROWS = 100000
+_MAX_CONCURRENT_READS = 4
+# The number of recently shown pages a RowPager keeps, so that paging back
+# doesn't read them again.
+_PAGER_CACHED_PAGES = 8
+# The number of seconds that metadata read from the server is reused for,
+# by kind, and the most entries kept, if no explicit values are specified.
+_METADATA_CACHE_TTLS = {
+    'project': 300,
+    'dataset': 60,
+    'table': 30,
+    'datasets': 30,
+    'tables': 30,
+    }
+_METADATA_CACHE_SIZE = 1000
+# The tables of a MetadataIndex. Missing ids are stored as '', so that the
+# listing of all projects is under ('', '').
+_METADATA_INDEX_SCHEMA = """
+CREATE TABLE IF NOT EXISTS objects (
+  project_id TEXT NOT NULL,
+  dataset_id TEXT NOT NULL,
+  table_id TEXT NOT NULL,
+  info TEXT NOT NULL,
+  updated REAL NOT NULL,
+  PRIMARY KEY (project_id, dataset_id, table_id));
+CREATE TABLE IF NOT EXISTS listings (
+  project_id TEXT NOT NULL,
+  dataset_id TEXT NOT NULL,
+  entries TEXT NOT NULL,
+  updated REAL NOT NULL,
+  PRIMARY KEY (project_id, dataset_id));
+"""
+# How long a MetadataIndex waits for another process to finish writing.
+_METADATA_INDEX_TIMEOUT = 10
+# The most source uris the service accepts for one load job.
+_MAX_URIS_PER_JOB = 10000
+# The number of times a failed job of a manifest load is retried, if no
+# explicit value is specified.
+_MANIFEST_RETRIES = 2
+# The options of Load that a manifest entry may set.
+_MANIFEST_LOAD_OPTIONS = frozenset([
+    'schema', 'create_disposition', 'write_disposition', 'field_delimiter',
+    'skip_leading_rows', 'encoding', 'quote', 'max_bad_records',
+    'allow_quoted_newlines', 'source_format', 'allow_jagged_rows',
+    'compression_level'])
+# The smallest chunk of a local file checked by one validation task.
+_VALIDATE_CHUNK_SIZE = 16 * 1024 * 1024
+# The number of records sampled from local files to infer a schema, if
+# no explicit value is specified.
+_SAMPLE_ROWS = 1000
+# Local files up to this size are read in full when sampling records;
+# larger ones are sampled at random offsets instead.
+_SAMPLE_SCAN_SIZE = 64 * 1024 * 1024
 
 
 def _Typecheck(obj, types, message=None, method=None):
@@ -129,6 +212,217 @@ def JsonToInsertEntry(insert_id, json_string):
     raise BigqueryClientError('Could not parse object: %s' % (str(e),))
 
 
+def _ReplaceFile(source, destination):
+  """Atomically moves source to destination, replacing destination."""
+  if os.name == 'nt' and os.path.exists(destination):
+    # os.rename does not replace existing files on Windows.
+    os.remove(destination)
+  os.rename(source, destination)
+
+
+class InsertSpool(object):
+  """A durable, segmented write-ahead log for streaming inserts.
+
+  Records (usually the JSON lines given to insertAll) are appended to
+  segment files in a spool directory before they are sent to the
+  server. Once a batch has been inserted, its records are acknowledged;
+  a later process using the same directory replays only the records
+  that were never acknowledged.
+
+  Positions in the spool are byte offsets into the concatenation of all
+  segments. Each segment is named after the offset of its first byte, so
+  segments lying entirely before the acknowledged offset can simply be
+  removed. Segments are append-only, and appends are not forced to disk
+  until Sync() is called, which lets callers batch fsync calls (for
+  example, once per insertAll request). Anything appended after the
+  last Sync() is discarded when the spool is reopened.
+  """
+
+  _STATE_FILENAME = 'spool.state'
+  _SEGMENT_SUFFIX = '.segment'
+  _REJECTED_SUFFIX = '.rejected'
+
+  def __init__(self, directory, segment_size=64 * 1024 * 1024):
+    """Opens (creating, if needed) the spool in directory.
+
+    Args:
+      directory: Path of the spool directory.
+      segment_size: Approximate size in bytes at which a new segment
+        file is started.
+    """
+    self.directory = directory
+    self.segment_size = segment_size
+    if not os.path.isdir(directory):
+      os.makedirs(directory)
+    state = self._ReadState()
+    self.acknowledged_offset = state.get('acknowledged', 0)
+    self.checkpoint = state.get('checkpoint')
+    self._synced_offset = state.get('synced', 0)
+    self._offset = self._synced_offset
+    self._segment = None
+    self._segment_start = None
+    self._DiscardUnsynced()
+
+  def __repr__(self):
+    return 'InsertSpool(%r)' % (self.directory,)
+
+  @property
+  def offset(self):
+    """The offset just past the last appended record."""
+    return self._offset
+
+  def _SegmentPath(self, start):
+    return os.path.join(self.directory,
+                        '%020d%s' % (start, self._SEGMENT_SUFFIX))
+
+  def _SegmentStarts(self):
+    """Returns the sorted start offsets of all segment files."""
+    return sorted(int(name[:-len(self._SEGMENT_SUFFIX)])
+                  for name in os.listdir(self.directory)
+                  if name.endswith(self._SEGMENT_SUFFIX))
+
+  def _ReadState(self):
+    path = os.path.join(self.directory, self._STATE_FILENAME)
+    if not os.path.exists(path):
+      return {}
+    with open(path) as f:
+      try:
+        return json.load(f)
+      except ValueError, e:
+        raise BigqueryClientError(
+            'Corrupt spool state in %s: %s' % (path, e))
+
+  def _WriteState(self):
+    path = os.path.join(self.directory, self._STATE_FILENAME)
+    temp_path = path + '.tmp'
+    with open(temp_path, 'w') as f:
+      json.dump({
+          'acknowledged': self.acknowledged_offset,
+          'synced': self._synced_offset,
+          'checkpoint': self.checkpoint,
+          }, f)
+      f.flush()
+      os.fsync(f.fileno())
+    _ReplaceFile(temp_path, path)
+
+  def _DiscardUnsynced(self):
+    """Truncates the log to the last synced offset."""
+    for start in self._SegmentStarts():
+      path = self._SegmentPath(start)
+      if start >= self._synced_offset:
+        os.remove(path)
+      elif os.path.getsize(path) > self._synced_offset - start:
+        with open(path, 'r+b') as f:
+          f.truncate(self._synced_offset - start)
+
+  def _OpenSegment(self):
+    """Opens the segment that new records should be appended to."""
+    starts = self._SegmentStarts()
+    if starts and (self._offset - starts[-1]) < self.segment_size:
+      start = starts[-1]
+    else:
+      start = self._offset
+    self._segment = open(self._SegmentPath(start), 'ab')
+    self._segment_start = start
+
+  def Append(self, record):
+    """Appends a record (a string without newlines) to the spool.
+
+    Args:
+      record: The record to append.
+
+    Returns:
+      The offset just past the new record, suitable for Acknowledge().
+    """
+    if (self._segment is not None and
+        self._offset - self._segment_start >= self.segment_size):
+      self._segment.flush()
+      os.fsync(self._segment.fileno())
+      self._segment.close()
+      self._segment = None
+    if self._segment is None:
+      self._OpenSegment()
+    data = record + '\n'
+    self._segment.write(data)
+    self._offset += len(data)
+    return self._offset
+
+  def Sync(self, checkpoint=_DEFAULT):
+    """Forces all appended records to disk.
+
+    Args:
+      checkpoint: Optional JSON-serializable object recorded atomically
+        with the synced records, typically the position in the input
+        that has been consumed so far.
+    """
+    if self._segment is not None:
+      self._segment.flush()
+      os.fsync(self._segment.fileno())
+    if checkpoint is not _DEFAULT:
+      self.checkpoint = checkpoint
+    self._synced_offset = self._offset
+    self._WriteState()
+
+  def Acknowledge(self, offset):
+    """Marks every record before offset as successfully inserted."""
+    if offset > self._synced_offset:
+      raise BigqueryClientError(
+          'Cannot acknowledge unsynced spool offset %d' % (offset,))
+    self.acknowledged_offset = max(offset, self.acknowledged_offset)
+    self._WriteState()
+    starts = self._SegmentStarts()
+    for start, next_start in zip(starts, starts[1:]):
+      if next_start <= self.acknowledged_offset:
+        os.remove(self._SegmentPath(start))
+
+  def Quarantine(self, offset, records):
+    """Moves rejected records out of the spool and acknowledges them.
+
+    The records are written, one per line, to a file in the spool
+    directory named after offset, so that they are not replayed by every
+    later process but can still be inspected and resent.
+
+    Args:
+      offset: The offset just past the last rejected record.
+      records: The rejected records.
+
+    Returns:
+      The path of the file the records were written to.
+    """
+    path = os.path.join(self.directory,
+                        '%020d%s' % (offset, self._REJECTED_SUFFIX))
+    with open(path, 'ab') as f:
+      for record in records:
+        f.write(record + '\n')
+      f.flush()
+      os.fsync(f.fileno())
+    self.Acknowledge(offset)
+    return path
+
+  def ReadPending(self):
+    """Yields (offset, record) for each synced but unacknowledged record.
+
+    The offset is the one just past the record, as returned by Append.
+    """
+    end = self._synced_offset
+    for start in self._SegmentStarts():
+      if start >= end:
+        break
+      with open(self._SegmentPath(start), 'rb') as f:
+        offset = start
+        for line in f:
+          offset += len(line)
+          if offset > end:
+            break
+          if offset > self.acknowledged_offset:
+            yield offset, line[:-1]
+
+  def Close(self):
+    if self._segment is not None:
+      self._segment.close()
+      self._segment = None
+
+
 class BigqueryError(Exception):
 
   @staticmethod
@@ -309,17 +603,1080 @@ class BigqueryHttp(http_request.HttpRequest):
     try:
       return super(BigqueryHttp, self).execute(**kwds)
     except apiclient.errors.HttpError, e:
-      # TODO(user): Remove this when apiclient supports logging
-      # of error responses.
-      self._model._log_response(e.resp, e.content)  # pylint: disable=protected-access
-      if e.resp.get('content-type', '').startswith('application/json'):
-        BigqueryClient.RaiseError(json.loads(e.content))
+      self.RaiseHttpError(e)
+
+  def ExecuteIfModified(self, etag):
+    """Executes the request, unless its object still has the given etag.
+
+    Args:
+      etag: The etag of the object when it was last read.
+
+    Returns:
+      The response, or None if the server says the object is unchanged.
+    """
+    self.headers['If-None-Match'] = etag
+    try:
+      return super(BigqueryHttp, self).execute()
+    except apiclient.errors.HttpError, e:
+      if e.resp.status == httplib.NOT_MODIFIED:
+        return None
+      self.RaiseHttpError(e)
+
+  def RaiseHttpError(self, e):
+    """Raises the BigqueryError corresponding to an HttpError."""
+    # TODO(user): Remove this when apiclient supports logging
+    # of error responses.
+    self._model._log_response(e.resp, e.content)  # pylint: disable=protected-access
+    if e.resp.get('content-type', '').startswith('application/json'):
+      BigqueryClient.RaiseError(json.loads(e.content))
+    else:
+      raise BigqueryCommunicationError(
+          ('Could not connect with BigQuery server.\n'
+           'Http response status: %s\n'
+           'Http response content:\n%s') % (
+               e.resp.get('status', '(unexpected)'), e.content))
+
+
+class _UploadSessionStore(object):
+  """Saves resumable upload sessions so that a later run can resume them.
+
+  Each session is a small JSON object holding the upload URI and the
+  number of bytes the server has acknowledged. It is kept in its own
+  file in directory, named by a key that identifies the upload.
+  """
+
+  def __init__(self, directory):
+    self.directory = os.path.expanduser(directory)
+
+  @staticmethod
+  def Key(*parts):
+    """Returns a session key for an upload identified by parts."""
+    return hashlib.sha1(json.dumps(parts, sort_keys=True)).hexdigest()
+
+  def _Path(self, key):
+    return os.path.join(self.directory, '%s.upload' % (key,))
+
+  def Get(self, key):
+    """Returns the session saved under key, or None if there is none."""
+    try:
+      with open(self._Path(key)) as f:
+        return json.load(f)
+    except (IOError, ValueError):
+      return None
+
+  def Put(self, key, session):
+    if not os.path.isdir(self.directory):
+      # Upload URIs grant access to the upload, so keep them private.
+      os.makedirs(self.directory, 0700)
+    path = self._Path(key)
+    with open(path + '.tmp', 'w') as f:
+      json.dump(session, f)
+    _ReplaceFile(path + '.tmp', path)
+
+  def Delete(self, key):
+    try:
+      os.remove(self._Path(key))
+    except OSError:
+      pass
+
+
+class _ResumableUpload(object):
+  """The resumable upload state of an apiclient HttpRequest.
+
+  Resuming an upload, and asking the server how much of it arrived after
+  a failed chunk, needs HttpRequest state that is not part of apiclient's
+  interface. This is the only code that touches it, and only for the
+  versions in _RESUMABLE_UPLOAD_APICLIENT_VERSIONS. With other versions,
+  supported is False: failed chunks are resent as they are, and uploads
+  are not resumed by later runs.
+  """
+
+  _ATTRIBUTES = ('resumable_uri', 'resumable_progress', '_in_error_state')
+
+  def __init__(self, request, version=None):
+    self._request = request
+    if version is None:
+      version = getattr(apiclient, '__version__', None)
+    self.supported = (
+        version in _RESUMABLE_UPLOAD_APICLIENT_VERSIONS and
+        all(hasattr(request, name) for name in self._ATTRIBUTES))
+
+  @property
+  def uri(self):
+    """The URI of the upload session, or None before it is started."""
+    if not self.supported:
+      return None
+    return self._request.resumable_uri
+
+  @property
+  def progress(self):
+    """The number of bytes the server is known to have."""
+    return getattr(self._request, 'resumable_progress', 0)
+
+  def Resume(self, uri, progress):
+    """Continue the upload session at uri, once the server says where."""
+    # pylint: disable=protected-access
+    self._request.resumable_uri = uri
+    self._request.resumable_progress = progress
+    self._request._in_error_state = True
+
+  def Restart(self):
+    """Forget the upload session, so that the next chunk starts a new one."""
+    # pylint: disable=protected-access
+    self._request.resumable_uri = None
+    self._request.resumable_progress = 0
+    self._request._in_error_state = False
+
+  def Failed(self):
+    """Ask the server how much it has before the next chunk is sent."""
+    # pylint: disable=protected-access
+    if self.supported:
+      self._request._in_error_state = self._request.resumable_uri is not None
+
+
+class UploadStats(object):
+  """The progress of one media upload, for reporting through a WaitPrinter.
+
+  Attributes:
+    name: the name of the file being uploaded.
+    source_bytes: the size of the file, or None if it is not known.
+    compressed: whether the file is compressed as it is uploaded.
+    bytes_read: the number of bytes of the file read so far.
+    bytes_sent: the number of bytes of media handed to the server so far.
+    resumed_bytes: the number of bytes the server already had from an
+      earlier, interrupted run of the same upload.
+    start_time: when the upload began.
+    end_time: when the upload finished, or None if it is in progress.
+  """
+
+  def __init__(self, name, source_bytes=None, compressed=False):
+    self.name = name
+    self.source_bytes = source_bytes
+    self.compressed = compressed
+    self.bytes_read = 0
+    self.bytes_sent = 0
+    self.resumed_bytes = 0
+    self.start_time = time.time()
+    self.end_time = None
+
+  def Finish(self):
+    self.end_time = time.time()
+
+  @property
+  def compression_ratio(self):
+    """The ratio of bytes read to bytes sent, or None if nothing was sent."""
+    if not self.bytes_sent:
+      return None
+    return float(self.bytes_read) / self.bytes_sent
+
+  @property
+  def throughput(self):
+    """The number of bytes sent per second by this run."""
+    elapsed = (self.end_time or time.time()) - self.start_time
+    return max(self.bytes_sent - self.resumed_bytes, 0) / max(elapsed, 1e-3)
+
+  def __str__(self):
+    description = '%s ... %.1f MB sent' % (self.name, self.bytes_sent / 1e6)
+    if self.compressed and self.compression_ratio:
+      description += ' (%.1f MB before compression, ratio %.1f)' % (
+          self.bytes_read / 1e6, self.compression_ratio)
+    if self.resumed_bytes:
+      description += ', resumed at %.1f MB' % (self.resumed_bytes / 1e6,)
+    if self.source_bytes and self.end_time is None:
+      description += ', %d%% read' % (
+          100 * self.bytes_read // self.source_bytes,)
+    return description + ', %.1f MB/s' % (self.throughput / 1e6,)
+
+
+_GZIP_MAGIC = '\x1f\x8b'
+
+
+def _IsGzipFile(fd):
+  """Returns True if the seekable file fd starts with the gzip magic number."""
+  fd.seek(0)
+  magic = fd.read(2)
+  fd.seek(0)
+  return magic == _GZIP_MAGIC
+
+
+class _FileSlice(object):
+  """A read-only, seekable file object for bytes [begin, end) of a file.
+
+  The file is only opened when it is first read, so that many slices of
+  one file can be created up front without holding a descriptor for each.
+  """
+
+  def __init__(self, filename, begin=0, end=None):
+    self.filename = filename
+    if end is None and not begin:
+      self.name = filename
+    else:
+      self.name = '%s[%d:%s]' % (filename, begin, '' if end is None else end)
+    self.begin = begin
+    self.end = os.path.getsize(filename) if end is None else end
+    self._fd = None
+    self._position = 0
+
+  @property
+  def size(self):
+    return self.end - self.begin
+
+  def __repr__(self):
+    return '_FileSlice(%r, %d, %d)' % (self.filename, self.begin, self.end)
+
+  def seek(self, offset, whence=os.SEEK_SET):  # pylint: disable=g-bad-name
+    if whence == os.SEEK_CUR:
+      offset += self._position
+    elif whence == os.SEEK_END:
+      offset += self.size
+    self._position = max(offset, 0)
+
+  def tell(self):  # pylint: disable=g-bad-name
+    return self._position
+
+  def read(self, size=-1):  # pylint: disable=g-bad-name
+    remaining = max(self.size - self._position, 0)
+    if size < 0 or size > remaining:
+      size = remaining
+    if self._fd is None:
+      self._fd = open(self.filename, 'rb')
+    self._fd.seek(self.begin + self._position)
+    data = self._fd.read(size)
+    self._position += len(data)
+    return data
+
+  def close(self):  # pylint: disable=g-bad-name
+    if self._fd is not None:
+      self._fd.close()
+      self._fd = None
+
+
+class _RecordScanner(object):
+  """Finds the ends of newline-terminated records in a memory-mapped file.
+
+  If quote is given, a newline is only the end of a record when an even
+  number of quote characters precede it, since newlines inside quoted
+  fields are part of the field. (An escaped quote is written as two
+  quotes, which leaves the parity unchanged.)
+  """
+
+  _COUNT_SIZE = 1024 * 1024
+
+  def __init__(self, mapped, quote=None):
+    self._mapped = mapped
+    self._quote = quote
+    # Whether an odd number of quotes precede self._scanned.
+    self._in_quotes = False
+    self._scanned = 0
+
+  def _ScanTo(self, position):
+    if self._quote:
+      while self._scanned < position:
+        end = min(position, self._scanned + self._COUNT_SIZE)
+        if self._mapped[self._scanned:end].count(self._quote) % 2:
+          self._in_quotes = not self._in_quotes
+        self._scanned = end
+    self._scanned = max(self._scanned, position)
+
+  def NextRecord(self, position):
+    """Returns the offset just past the first record end at or after position.
+
+    Calls must be made with non-decreasing positions.
+
+    Args:
+      position: The offset to start looking from.
+
+    Returns:
+      The offset of the start of the next record, or the size of the
+      file if no record ends at or after position.
+    """
+    size = len(self._mapped)
+    position = max(position, self._scanned)
+    while position < size:
+      newline = self._mapped.find('\n', position)
+      if newline < 0:
+        break
+      self._ScanTo(newline)
+      position = newline + 1
+      if not self._in_quotes:
+        return position
+    self._ScanTo(size)
+    return size
+
+
+def _SplitFile(filename, split_size, skip_leading_rows=0, quote=None):
+  """Splits a file of newline-terminated records into shards.
+
+  The file is memory-mapped and scanned in place, so it is never read
+  into memory as a whole.
+
+  Args:
+    filename: The file to split.
+    split_size: The approximate size of each shard, in bytes.
+    skip_leading_rows: The number of records at the start of the file to
+      leave out of the shards.
+    quote: If given, the quote character of a CSV file whose quoted
+      fields may contain newlines.
+
+  Returns:
+    A list of _FileSlices of filename, each holding whole records.
+  """
+  if not os.path.getsize(filename):
+    return []
+  with open(filename, 'rb') as f:
+    mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+  try:
+    scanner = _RecordScanner(mapped, quote=quote)
+    begin = 0
+    for _ in xrange(skip_leading_rows or 0):
+      begin = scanner.NextRecord(begin)
+    shards = []
+    while begin < len(mapped):
+      end = scanner.NextRecord(begin + max(split_size, 1) - 1)
+      shards.append(_FileSlice(filename, begin, end))
+      begin = end
+    return shards
+  finally:
+    mapped.close()
+
+
+# Predicates for whether a value read from a CSV or JSON source file can
+# be loaded into a field of each type. They err on the side of accepting
+# values, since their job is to catch rows the server would reject.
+_INTEGER_PATTERN = re.compile(r'^\s*[+-]?\d+\s*$')
+_TIMESTAMP_PATTERN = re.compile(
+    r'^\s*\d{4}-\d{1,2}-\d{1,2}'
+    r'([ T]\d{1,2}:\d{1,2}(:\d{1,2}(\.\d+)?)?)?'
+    r'\s*(UTC|Z|[+-]\d{1,2}(:?\d{2})?)?\s*$')
+_BOOLEAN_STRINGS = frozenset(
+    ['true', 'false', 't', 'f', 'yes', 'no', 'y', 'n', '1', '0'])
+
+
+def _IsInteger(value):
+  if isinstance(value, bool):
+    return False
+  if isinstance(value, basestring):
+    if not _INTEGER_PATTERN.match(value):
+      return False
+    value = int(value)
+  return isinstance(value, (int, long)) and -2 ** 63 <= value < 2 ** 63
+
+
+def _IsFloat(value):
+  if isinstance(value, bool):
+    return False
+  if isinstance(value, basestring):
+    try:
+      float(value)
+    except ValueError:
+      return False
+    return True
+  return isinstance(value, (int, long, float))
+
+
+def _IsBoolean(value):
+  if isinstance(value, basestring):
+    return value.strip().lower() in _BOOLEAN_STRINGS
+  return isinstance(value, bool)
+
+
+def _IsTimestamp(value):
+  if isinstance(value, basestring) and _TIMESTAMP_PATTERN.match(value):
+    return True
+  return _IsFloat(value)
+
+
+def _IsString(value):
+  return not isinstance(value, (dict, list))
+
+
+_TYPE_PREDICATES = {
+    'INTEGER': _IsInteger,
+    'FLOAT': _IsFloat,
+    'BOOLEAN': _IsBoolean,
+    'TIMESTAMP': _IsTimestamp,
+    'STRING': _IsString,
+    }
+
+
+class BadRecord(collections.namedtuple(
+    'BadRecord', ['source', 'offset', 'message'])):
+  """A record of a local source file that would fail to load."""
+  __slots__ = ()
+
+  def __str__(self):
+    return '%s at byte %d: %s' % (self.source, self.offset, self.message)
+
+
+def _CheckValue(value, field, name):
+  """Returns why value can't be loaded into field, or None if it can."""
+  field_type = field.get('type', 'STRING').upper()
+  if field_type == 'RECORD':
+    if not isinstance(value, dict):
+      return 'Expected an object for field %s' % (name,)
+    return _CheckJsonObject(value, field.get('fields', []), name + '.')
+  predicate = _TYPE_PREDICATES.get(field_type)
+  if predicate and not predicate(value):
+    return 'Could not parse %s as %s for field %s' % (
+        json.dumps(value)[:80], field_type, name)
+  return None
+
+
+def _CheckJsonObject(record, fields, prefix=''):
+  """Returns why a JSON object can't be loaded into fields, or None."""
+  fields_by_name = dict((field['name'].lower(), field) for field in fields)
+  for key, value in record.iteritems():
+    field = fields_by_name.pop(key.lower(), None)
+    if field is None:
+      return 'No such field: %s%s' % (prefix, key)
+    name = prefix + field['name']
+    if value is None:
+      if field.get('mode', 'NULLABLE').upper() == 'REQUIRED':
+        return 'Missing required field %s' % (name,)
+      continue
+    if field.get('mode', 'NULLABLE').upper() == 'REPEATED':
+      if not isinstance(value, list):
+        return 'Expected an array for repeated field %s' % (name,)
+      values = value
+    else:
+      values = [value]
+    for value in values:
+      error = _CheckValue(value, field, name)
+      if error:
+        return error
+  for field in fields_by_name.itervalues():
+    if field.get('mode', 'NULLABLE').upper() == 'REQUIRED':
+      return 'Missing required field %s%s' % (prefix, field['name'])
+  return None
+
+
+def _CheckCsvRecord(values, fields, options):
+  """Returns why a parsed CSV record can't be loaded, or None."""
+  if len(values) > len(fields):
+    return 'Too many fields: expected %d, found %d' % (
+        len(fields), len(values))
+  if len(values) < len(fields) and not options['allow_jagged_rows']:
+    return 'Too few fields: expected %d, found %d' % (
+        len(fields), len(values))
+  for i, field in enumerate(fields):
+    value = values[i] if i < len(values) else ''
+    if options['encoding'] == 'UTF-8':
+      try:
+        value.decode('utf-8')
+      except UnicodeDecodeError:
+        return 'Invalid UTF-8 in field %s' % (field['name'],)
+    field_type = field.get('type', 'STRING').upper()
+    if not value:
+      if (field_type != 'STRING' and
+          field.get('mode', 'NULLABLE').upper() == 'REQUIRED'):
+        return 'Missing required field %s' % (field['name'],)
+      continue
+    predicate = _TYPE_PREDICATES.get(field_type)
+    if predicate and not predicate(value):
+      return 'Could not parse %r as %s for field %s' % (
+          value[:80], field_type, field['name'])
+  return None
+
+
+class _LineReader(object):
+  """Iterates over the lines of bytes [begin, end) of an open file."""
+
+  def __init__(self, f, begin, end):
+    self._file = f
+    self._file.seek(begin)
+    self.offset = begin
+    self._end = end
+    self.lines = 0
+
+  def __iter__(self):
+    return self
+
+  def next(self):  # pylint: disable=g-bad-name
+    if self.offset >= self._end:
+      raise StopIteration
+    line = self._file.readline()
+    if not line:
+      raise StopIteration
+    self.offset += len(line)
+    self.lines += 1
+    return line
+
+
+def _CheckJsonRecords(lines, fields):
+  """Yields (offset, error or None) for each record of a JSON source."""
+  for line in lines:
+    if not line.strip():
+      continue
+    offset = lines.offset - len(line)
+    try:
+      record = json.loads(line)
+    except ValueError, e:
+      yield offset, 'Invalid JSON: %s' % (e,)
+      continue
+    if not isinstance(record, dict):
+      yield offset, 'Not a JSON object'
+    else:
+      yield offset, _CheckJsonObject(record, fields)
+
+
+def _CheckCsvRecords(lines, fields, options):
+  """Yields (offset, error or None) for each record of a CSV source."""
+  quote = options['quote']
+  reader = csv.reader(
+      lines, delimiter=options['field_delimiter'], quotechar=quote or None,
+      quoting=csv.QUOTE_MINIMAL if quote else csv.QUOTE_NONE, strict=True)
+  while True:
+    offset = lines.offset
+    first_line = lines.lines
+    try:
+      values = reader.next()
+    except StopIteration:
+      return
+    except csv.Error, e:
+      yield offset, 'Invalid CSV: %s' % (e,)
+      continue
+    if not values:
+      continue
+    if lines.lines - first_line > 1 and not options['allow_quoted_newlines']:
+      yield offset, 'Quoted newline found, but allow_quoted_newlines is off'
+    else:
+      yield offset, _CheckCsvRecord(values, fields, options)
+
+
+def _ValidateShard(shard):
+  """Checks the records in one shard of a local source file.
+
+  This runs in a multiprocessing worker, so it takes a single picklable
+  argument.
+
+  Args:
+    shard: A tuple (filename, begin, end, gzipped, skip, options). The
+      records in bytes [begin, end) of filename, or of its decompressed
+      contents if gzipped, are checked according to the options dict (see
+      BigqueryClient.ValidateLoad), after skipping the first skip records.
+
+  Returns:
+    A tuple (rows, bad_records) of the number of rows checked and a list
+    of BadRecords, stopping after options['limit'] of them.
+  """
+  filename, begin, end, gzipped, skip, options = shard
+  rows = 0
+  bad_records = []
+  if gzipped:
+    f = gzip.open(filename, 'rb')
+  else:
+    f = open(filename, 'rb')
+  try:
+    lines = _LineReader(f, begin, end)
+    if options['source_format'] == 'NEWLINE_DELIMITED_JSON':
+      results = _CheckJsonRecords(lines, options['fields'])
+    else:
+      results = _CheckCsvRecords(lines, options['fields'], options)
+    for offset, error in itertools.islice(results, skip, None):
+      rows += 1
+      if error:
+        bad_records.append(BadRecord(filename, offset, error))
+        if len(bad_records) >= options['limit']:
+          break
+  finally:
+    f.close()
+  return rows, bad_records
+
+
+def _IterRecords(f, quote=None):
+  """Yields the newline-terminated records of a file, as for _RecordScanner."""
+  pending = []
+  in_quotes = False
+  for line in f:
+    pending.append(line)
+    if quote and line.count(quote) % 2:
+      in_quotes = not in_quotes
+    if not in_quotes:
+      yield ''.join(pending)
+      pending = []
+  if pending:
+    yield ''.join(pending)
+
+
+def _SampleRecords(filename, sample_rows, skip_leading_rows=0, quote=None,
+                   rand=random):
+  """Picks a random sample of the records of a local file.
+
+  Files up to _SAMPLE_SCAN_SIZE, and gzipped files, are read in a single
+  pass with reservoir sampling. Larger files are memory-mapped and the
+  records found at sample_rows random offsets are taken instead, so only
+  a small part of the file is read. (With quote, the scan for quotes
+  still touches the whole file, but that is far cheaper than parsing
+  it.) Offset sampling favours records that follow long ones, which is
+  harmless for inferring a schema.
+
+  Args:
+    filename: The file to sample.
+    sample_rows: The most records to return.
+    skip_leading_rows: The number of records at the start of the file to
+      leave out of the sample.
+    quote: If given, the quote character of a CSV file whose quoted
+      fields may contain newlines.
+    rand: The source of randomness, for tests.
+
+  Returns:
+    A tuple (leading, sample) of the list of skipped records and a list of
+    up to sample_rows sampled records, in file order.
+  """
+  skip_leading_rows = skip_leading_rows or 0
+  with open(filename, 'rb') as f:
+    gzipped = _IsGzipFile(f)
+  size = os.path.getsize(filename)
+  if gzipped or size <= _SAMPLE_SCAN_SIZE:
+    if gzipped:
+      f = gzip.open(filename, 'rb')
+    else:
+      f = open(filename, 'rb')
+    try:
+      records = _IterRecords(f, quote=quote)
+      leading = list(itertools.islice(records, skip_leading_rows))
+      sample = []
+      for i, record in enumerate(records):
+        if i < sample_rows:
+          sample.append((i, record))
+        else:
+          j = rand.randint(0, i)
+          if j < sample_rows:
+            sample[j] = (i, record)
+    finally:
+      f.close()
+    return leading, [record for _, record in sorted(sample)]
+
+  with open(filename, 'rb') as f:
+    mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+  try:
+    scanner = _RecordScanner(mapped, quote=quote)
+    leading = []
+    begin = 0
+    for _ in xrange(skip_leading_rows):
+      end = scanner.NextRecord(begin)
+      leading.append(mapped[begin:end])
+      begin = end
+    sample = []
+    last = None
+    offsets = sorted(rand.randrange(begin, size)
+                     for _ in xrange(sample_rows)) if begin < size else []
+    for offset in offsets:
+      # The offset is most likely in the middle of a record, so take the
+      # record that starts after it.
+      start = scanner.NextRecord(offset)
+      if start >= size or start == last:
+        continue
+      end = scanner.NextRecord(start)
+      sample.append(mapped[start:end])
+      last = start
+    return leading, sample
+  finally:
+    mapped.close()
+
+
+# Unlike the _TYPE_PREDICATES used for validation, the predicates used
+# to infer types only accept values the server is sure to parse as the
+# type: there is no surrounding whitespace, and no nan or inf.
+_INFERRED_INTEGER_PATTERN = re.compile(r'[+-]?\d+\Z')
+_INFERRED_FLOAT_PATTERN = re.compile(
+    r'[+-]?(\d+(\.\d*)?|\.\d+)([eE][+-]?\d+)?\Z')
+
+
+def _IsInferredInteger(value):
+  return (bool(_INFERRED_INTEGER_PATTERN.match(value)) and
+          -2 ** 63 <= int(value) < 2 ** 63)
+
+
+def _IsInferredFloat(value):
+  # Exponents such as 1e999 overflow to inf.
+  return (bool(_INFERRED_FLOAT_PATTERN.match(value)) and
+          abs(float(value)) != float('inf'))
+
+
+def _IsInferredTimestamp(value):
+  return value == value.strip() and bool(_TIMESTAMP_PATTERN.match(value))
+
+
+# The types tried, in order, when inferring the type of a CSV column.
+_INFERRED_TYPES = (
+    ('INTEGER', _IsInferredInteger),
+    ('FLOAT', _IsInferredFloat),
+    ('BOOLEAN', lambda value: value.lower() in ('true', 'false')),
+    ('TIMESTAMP', _IsInferredTimestamp),
+    )
+
+
+def _InferFieldName(name, used):
+  """Turns a CSV header into a legal field name not in the set used."""
+  name = re.sub(r'[^A-Za-z0-9_]', '_', name.strip())[:128] or 'field'
+  if name[0].isdigit():
+    name = '_' + name[:127]
+  candidate = name
+  suffix = 2
+  while candidate.lower() in used:
+    candidate = '%s_%d' % (name, suffix)
+    suffix += 1
+  used.add(candidate.lower())
+  return candidate
+
+
+def _InferCsvSchema(header, rows):
+  """Returns schema fields for parsed CSV rows and an optional header."""
+  width = max([len(header or ())] + [len(row) for row in rows])
+  used = set()
+  fields = []
+  for i in xrange(width):
+    if header and i < len(header) and header[i].strip():
+      name = _InferFieldName(header[i], used)
+    else:
+      name = _InferFieldName('field_%d' % (i + 1,), used)
+    values = [row[i] for row in rows if i < len(row) and row[i]]
+    field_type = 'STRING'
+    if values:
+      for candidate, predicate in _INFERRED_TYPES:
+        if all(predicate(value) for value in values):
+          field_type = candidate
+          break
+    fields.append({'name': name, 'type': field_type})
+  return fields
+
+
+def _InferJsonValue(fields, name, value):
+  """Merges what one JSON value says about a field into fields.
+
+  Args:
+    fields: An OrderedDict from lowercased field name to a dict describing
+      what has been seen of that field: its 'name', set of 'types',
+      whether it is 'repeated', and an OrderedDict of its own 'fields'.
+    name: The name of the field.
+    value: A JSON value of the field.
+
+  Raises:
+    BigqueryClientError: if value is an array of arrays.
+  """
+  field = fields.get(name.lower())
+  if field is None:
+    field = fields[name.lower()] = {
+        'name': name,
+        'types': set(),
+        'repeated': False,
+        'fields': collections.OrderedDict(),
+        }
+  if isinstance(value, list):
+    field['repeated'] = True
+    values = value
+  else:
+    values = [value]
+  for value in values:
+    if value is None:
+      continue
+    elif isinstance(value, dict):
+      field['types'].add('RECORD')
+      for key, subvalue in value.iteritems():
+        _InferJsonValue(field['fields'], key, subvalue)
+    elif isinstance(value, list):
+      raise BigqueryClientError(
+          'Cannot infer a schema for nested arrays in field %s' % (name,))
+    elif isinstance(value, bool):
+      field['types'].add('BOOLEAN')
+    elif isinstance(value, (int, long)) and _IsInteger(value):
+      field['types'].add('INTEGER')
+    elif isinstance(value, (int, long, float)):
+      field['types'].add('FLOAT')
+    elif _IsInferredInteger(value):
+      field['types'].add('INTEGER')
+    elif _IsInferredTimestamp(value):
+      field['types'].add('TIMESTAMP')
+    else:
+      field['types'].add('STRING')
+
+
+def _InferJsonSchema(fields):
+  """Returns schema fields for what _InferJsonValue has seen."""
+  schema = []
+  for field in fields.itervalues():
+    types = field['types']
+    if 'RECORD' in types:
+      if len(types) > 1:
+        raise BigqueryClientError(
+            'Cannot infer a schema for field %s, which holds both objects '
+            'and other values' % (field['name'],))
+      entry = {
+          'name': field['name'],
+          'type': 'RECORD',
+          'fields': _InferJsonSchema(field['fields']),
+          }
+    elif len(types) == 1:
+      entry = {'name': field['name'], 'type': iter(types).next()}
+    elif types == set(['INTEGER', 'FLOAT']):
+      entry = {'name': field['name'], 'type': 'FLOAT'}
+    else:
+      entry = {'name': field['name'], 'type': 'STRING'}
+    if field['repeated']:
+      entry['mode'] = 'REPEATED'
+    schema.append(entry)
+  return schema
+
+
+def _FormatTimestamp(value):
+  """Formats a TIMESTAMP value from tabledata.list the way extracts do."""
+  seconds = float(value)
+  date = datetime.datetime(1970, 1, 1) + datetime.timedelta(seconds=seconds)
+  # Not strftime, which refuses years before 1900. isoformat leaves out
+  # the microseconds when there are none.
+  return date.isoformat(' ') + ' UTC'
+
+
+def _ExtractValue(field, value):
+  """Converts a value from tabledata.list into its JSON extract form.
+
+  As in the service's JSON extracts, INTEGER values are kept as strings
+  so that they don't lose precision.
+
+  Args:
+    field: The schema field of the value.
+    value: The value, with nested records still in f,v form.
+
+  Returns:
+    The value as a JSON-serializable object.
+  """
+  if value is None:
+    return None
+  if field.get('mode', 'NULLABLE').upper() == 'REPEATED':
+    field = dict(field, mode='NULLABLE')
+    return [_ExtractValue(field, entry['v']) for entry in value]
+  field_type = field.get('type', 'STRING').upper()
+  if field_type == 'RECORD':
+    return collections.OrderedDict(
+        (subfield['name'], _ExtractValue(subfield, cell['v']))
+        for subfield, cell in zip(field['fields'], value['f']))
+  elif field_type == 'FLOAT':
+    return float(value)
+  elif field_type == 'BOOLEAN':
+    return value.lower() == 'true'
+  elif field_type == 'TIMESTAMP':
+    return _FormatTimestamp(value)
+  return value
+
+
+def _EncodeCsvRows(fields, rows, field_delimiter=','):
+  """Returns rows from tabledata.list as UTF-8 CSV."""
+  timestamps = [field.get('type', 'STRING').upper() == 'TIMESTAMP'
+                for field in fields]
+  output = cStringIO.StringIO()
+  writer = csv.writer(output, delimiter=field_delimiter, lineterminator='\n')
+  for row in rows:
+    values = []
+    for value, timestamp in zip(row, timestamps):
+      if value is None:
+        value = ''
+      elif timestamp:
+        value = _FormatTimestamp(value)
+      elif isinstance(value, unicode):
+        value = value.encode('utf-8')
+      values.append(value)
+    writer.writerow(values)
+  return output.getvalue()
+
+
+def _EncodeJsonRows(fields, rows):
+  """Returns rows from tabledata.list as UTF-8 newline-delimited JSON."""
+  record_field = {'type': 'RECORD', 'fields': fields}
+  lines = []
+  for row in rows:
+    record = _ExtractValue(record_field, {'f': [{'v': v} for v in row]})
+    lines.append(json.dumps(record, separators=(',', ':'), ensure_ascii=False))
+  if not lines:
+    return ''
+  return ('\n'.join(lines) + '\n').encode('utf-8')
+
+
+class _CountingWriter(object):
+  """A file object stand-in that counts the bytes written through it."""
+
+  def __init__(self, output):
+    self._output = output
+    self.bytes_written = 0
+
+  def write(self, data):  # pylint: disable=g-bad-name
+    self._output.write(data)
+    self.bytes_written += len(data)
+
+  def flush(self):  # pylint: disable=g-bad-name
+    self._output.flush()
+
+
+def _ReadInOrder(read, items, max_concurrent_reads):
+  """Yields read(item) for each item, in order, reading ahead in threads.
+
+  At most max_concurrent_reads items are being read, or have been read
+  but not yet yielded, at any time, which bounds memory use.
+
+  Args:
+    read: A function of one item.
+    items: The items to read.
+    max_concurrent_reads: The number of items to read at once.
+
+  Yields:
+    The result of read for each item, in the order of items.
+  """
+
+  def Read(item, result):
+    try:
+      result.put((True, read(item)))
+    except Exception:  # pylint: disable=broad-except
+      result.put((False, sys.exc_info()))
+
+  def Start(item):
+    result = Queue.Queue(1)
+    thread = threading.Thread(target=Read, args=(item, result))
+    thread.daemon = True
+    thread.start()
+    return result
+
+  items = iter(items)
+  window = collections.deque(
+      Start(item) for item in itertools.islice(items, max_concurrent_reads))
+  while window:
+    result = window.popleft()
+    while True:
+      # Queue.get without a timeout can't be interrupted.
+      try:
+        ok, value = result.get(timeout=1)
+        break
+      except Queue.Empty:
+        pass
+    for item in itertools.islice(items, 1):
+      window.append(Start(item))
+    if not ok:
+      raise value[0], value[1], value[2]
+    yield value
+
+
+class _StreamingUpload(http_request.MediaUpload):
+  """A resumable media upload that reads a file object front to back.
+
+  The file is read, and gzipped if compression_level is given, as the
+  upload asks for bytes, so it need not be seekable: it can be a pipe or
+  standard input. Only about two chunks of data are held in memory, and
+  no copy is written to disk. The size of the upload is not known until
+  the whole file has been read, so size() returns None until then. A
+  file that turns out to be gzipped already is not compressed again.
+  """
+
+  _READ_SIZE = 1024 * 1024
+
+  def __init__(self, fd, compression_level=None,
+               mimetype='application/octet-stream',
+               chunksize=http_request.DEFAULT_CHUNK_SIZE, stats=None):
+    super(_StreamingUpload, self).__init__()
+    self._fd = fd
+    self._compressor = None
+    if compression_level is not None:
+      self._compressor = zlib.compressobj(
+          compression_level, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+    self._mimetype = mimetype
+    self._chunksize = chunksize
+    # Compressed bytes, starting at offset self._buffer_start of the
+    # compressed stream.
+    self._buffer = bytearray()
+    self._buffer_start = 0
+    # Each chunk starts where the server says the previous one left off,
+    # so nothing before the start of the last chunk will be asked for
+    # again. The next chunk is expected to start at self._next_begin.
+    self._acknowledged = 0
+    self._next_begin = 0
+    self._size = None
+    self.stats = stats or UploadStats(getattr(fd, 'name', '<stream>'))
+    self.stats.compressed = self._compressor is not None
+
+  def chunksize(self):  # pylint: disable=g-bad-name
+    return self._chunksize
+
+  def mimetype(self):  # pylint: disable=g-bad-name
+    return self._mimetype
+
+  def resumable(self):  # pylint: disable=g-bad-name
+    return True
+
+  def has_stream(self):  # pylint: disable=g-bad-name
+    return False
+
+  def size(self):  # pylint: disable=g-bad-name
+    # The upload treats a short chunk as the end of the media, so make
+    # sure that either the next chunk is full and more follows it, or
+    # the total size is known before the next chunk is sent.
+    self._FillTo(self._next_begin + self._chunksize + 1)
+    return self._size
+
+  def getbytes(self, begin, length):  # pylint: disable=g-bad-name
+    if begin < self._buffer_start:
+      raise BigqueryClientError(
+          'Cannot rewind compressed upload of %s to byte %d.' % (
+              self.stats.name, begin))
+    self._acknowledged = begin
+    self._FillTo(begin + length)
+    data = str(self._buffer[
+        begin - self._buffer_start:begin - self._buffer_start + length])
+    self._next_begin = begin + len(data)
+    self.stats.bytes_sent = max(self.stats.bytes_sent, self._next_begin)
+    return data
+
+  def _FillTo(self, end):
+    """Read more of the file until end is buffered or it is exhausted."""
+    self._Discard()
+    while (self._size is None and
+           self._buffer_start + len(self._buffer) < end):
+      data = self._fd.read(self._READ_SIZE)
+      if (self._compressor and not self.stats.bytes_read and
+          data.startswith(_GZIP_MAGIC)):
+        self._compressor = None
+        self.stats.compressed = False
+      if data:
+        self.stats.bytes_read += len(data)
+        if self._compressor:
+          data = self._compressor.compress(data)
+        self._buffer += data
       else:
-        raise BigqueryCommunicationError(
-            ('Could not connect with BigQuery server.\n'
-             'Http response status: %s\n'
-             'Http response content:\n%s') % (
-                 e.resp.get('status', '(unexpected)'), e.content))
+        if self._compressor:
+          self._buffer += self._compressor.flush()
+        self._size = self._buffer_start + len(self._buffer)
+      self._Discard()
+
+  def _Discard(self):
+    """Drop buffered bytes that will not be asked for again."""
+    discard = min(self._acknowledged - self._buffer_start, len(self._buffer))
+    if discard > 0:
+      del self._buffer[:discard]
+      self._buffer_start += discard
+
+
+class _ThreadLocalHttp(object):
+  """An httplib2.Http stand-in that uses a separate Http per thread.
+
+  httplib2.Http objects are not thread-safe, so operations that issue
+  requests from several threads at once use this in place of a shared
+  Http. Each thread gets its own Http, created by http_factory the first
+  time that thread makes a request.
+  """
+
+  def __init__(self, http_factory):
+    self._http_factory = http_factory
+    self._local = threading.local()
+
+  def _GetHttp(self):
+    http = getattr(self._local, 'http', None)
+    if http is None:
+      http = self._http_factory()
+      self._local.http = http
+    return http
+
+  def request(self, *args, **kwds):  # pylint: disable=g-bad-name
+    return self._GetHttp().request(*args, **kwds)
+
+  def __getattr__(self, name):
+    return getattr(self._GetHttp(), name)
 
 
 class JobIdGenerator(object):
@@ -389,6 +1746,355 @@ class JobIdGeneratorIncrementing(JobIdGenerator):
     return '%s_%d' % (self._inner.Generate(config), self._retry)
 
 
+class JobOutcome(collections.namedtuple(
+    'JobOutcome',
+    ['name', 'job', 'error', 'start_time', 'end_time', 'attempts'])):
+  """The outcome of one job in a JobGroup.
+
+  Attributes:
+    name: the caller-supplied name for this job, such as a source file.
+    job: the last job resource seen for this job, or None if the job
+      could not be started.
+    error: None if the job succeeded, otherwise the exception raised
+      while starting the job or describing why the job failed.
+    start_time: the time at which starting this job began.
+    end_time: the time at which this job was seen to be finished.
+    attempts: the number of times the job was started, including retries.
+  """
+  __slots__ = ()
+
+  def __new__(cls, name, job, error, start_time, end_time, attempts=1):
+    return super(JobOutcome, cls).__new__(
+        cls, name, job, error, start_time, end_time, attempts)
+
+  @property
+  def input_bytes(self):
+    """The number of bytes the job read from its input, if known."""
+    if not self.job:
+      return 0
+    statistics = self.job.get('statistics', {})
+    return int(statistics.get('load', {}).get('inputFileBytes', 0))
+
+
+class JobGroup(object):
+  """The outcomes of a group of jobs that were run together."""
+
+  def __init__(self, outcomes):
+    self.outcomes = list(outcomes)
+
+  def __len__(self):
+    return len(self.outcomes)
+
+  def __iter__(self):
+    return iter(self.outcomes)
+
+  @property
+  def failed(self):
+    """The outcomes of the jobs that failed."""
+    return [outcome for outcome in self.outcomes if outcome.error]
+
+  @property
+  def jobs(self):
+    """The job resources of the jobs that were started."""
+    return [outcome.job for outcome in self.outcomes if outcome.job]
+
+  def Summary(self):
+    """Returns a JSON-serializable summary of this group.
+
+    Returns:
+      A dict with a 'jobs' list holding one entry per job, in the order
+      the jobs were given, along with totals over all jobs.
+    """
+    jobs = []
+    for outcome in self.outcomes:
+      entry = {
+          'name': outcome.name,
+          'state': 'FAILURE' if outcome.error else 'SUCCESS',
+          'inputBytes': outcome.input_bytes,
+          'durationSeconds': round(outcome.end_time - outcome.start_time, 3),
+          'attempts': outcome.attempts,
+          }
+      if outcome.job:
+        entry['jobId'] = str(
+            BigqueryClient.ConstructObjectReference(outcome.job))
+        if not outcome.error and outcome.job['status']['state'] != 'DONE':
+          entry['state'] = outcome.job['status']['state']
+      if outcome.error:
+        entry['error'] = str(outcome.error)
+      jobs.append(entry)
+    if self.outcomes:
+      duration = (max(outcome.end_time for outcome in self.outcomes) -
+                  min(outcome.start_time for outcome in self.outcomes))
+    else:
+      duration = 0
+    return {
+        'jobs': jobs,
+        'succeeded': len(self.outcomes) - len(self.failed),
+        'failed': len(self.failed),
+        'inputBytes': sum(outcome.input_bytes for outcome in self.outcomes),
+        'durationSeconds': round(duration, 3),
+        }
+
+
+def _MetadataIds(reference):
+  """Returns the tuple of ids that names an object in a MetadataIndex.
+
+  Args:
+    reference: A Reference, or a reference dict such as the server returns.
+  """
+  reference_dict = dict(reference)
+  return tuple(reference_dict[name]
+               for name in ('projectId', 'datasetId', 'tableId')
+               if name in reference_dict)
+
+
+class _MetadataCache(object):
+  """An LRU cache of metadata read from the server, such as table info.
+
+  Each entry is kept for a time-to-live that depends on its kind. After
+  that, an entry that has an etag is revalidated instead of read again,
+  and kept for another time-to-live if the server says the object is
+  unchanged. The cache may be used from several threads.
+
+  Entries are keyed by the Reference of the object they describe. The
+  entries about an object and about the objects in it can be invalidated
+  together.
+  """
+
+  def __init__(self, ttls=None, max_entries=_METADATA_CACHE_SIZE,
+               clock=time.time):
+    """Initializes a _MetadataCache.
+
+    Args:
+      ttls: A dict of the number of seconds to keep entries for, by kind,
+        overriding _METADATA_CACHE_TTLS. 0 disables caching of a kind.
+      max_entries: The most entries to keep.
+      clock: A function that returns the current time in seconds.
+    """
+    self.ttls = dict(_METADATA_CACHE_TTLS)
+    self.ttls.update(ttls or {})
+    self.max_entries = max_entries
+    self._clock = clock
+    self._entries = collections.OrderedDict()
+    self._lock = threading.Lock()
+    # Incremented by each invalidation, so that a read that started
+    # before one doesn't store what it read.
+    self._generation = 0
+
+  def Get(self, kind, reference, fetch, revalidate=None, args=()):
+    """Returns the metadata of an object, reading it if need be.
+
+    Args:
+      kind: The kind of metadata, such as 'table' or 'tables', which
+        selects its time-to-live.
+      reference: The Reference of the object.
+      fetch: A function of no arguments that reads the metadata.
+      revalidate: Optional. A function of an etag that returns None if the
+        object still has that etag, and reads its metadata otherwise.
+      args: A tuple of any other arguments the metadata depends on.
+
+    Returns:
+      A copy of the metadata, which the caller may modify.
+    """
+    ttl = self.ttls.get(kind, 0)
+    if ttl <= 0 or self.max_entries <= 0:
+      return fetch()
+    key = (kind, reference, args)
+    with self._lock:
+      generation = self._generation
+      entry = self._entries.pop(key, None)
+      if entry is not None:
+        self._entries[key] = entry
+    if entry is None:
+      value = fetch()
+    else:
+      value, expires = entry
+      if self._clock() < expires:
+        return copy.deepcopy(value)
+      etag = value.get('etag')
+      if etag and revalidate:
+        refreshed = revalidate(etag)
+        if refreshed is not None:
+          value = refreshed
+      else:
+        value = fetch()
+    with self._lock:
+      if generation == self._generation:
+        self._entries.pop(key, None)
+        self._entries[key] = (value, self._clock() + ttl)
+        while len(self._entries) > self.max_entries:
+          self._entries.popitem(last=False)
+    return copy.deepcopy(value)
+
+  def Invalidate(self, reference, kinds=None):
+    """Removes the entries about an object and the objects in it.
+
+    Args:
+      reference: The Reference of the project, dataset or table.
+      kinds: Optional. If given, only entries of these kinds are removed.
+    """
+    ids = _MetadataIds(reference)
+    with self._lock:
+      self._generation += 1
+      for key in [key for key in self._entries
+                  if (kinds is None or key[0] in kinds) and
+                  (key[1] == reference or
+                   _MetadataIds(key[1])[:len(ids)] == ids)]:
+        del self._entries[key]
+
+
+class MetadataIndex(object):
+  """A SQLite index of project, dataset and table metadata, kept on disk.
+
+  The index outlives the process that fills it, so that separate bq
+  invocations can reuse what earlier ones read. It holds the info of
+  objects, as returned by projects.list, datasets.get and tables.get, and
+  the complete listings of the projects, of the datasets in a project and
+  of the tables in a dataset. Each entry records when it was read, and
+  readers pass the oldest age they accept.
+
+  Objects are named by the tuple of their ids, as by _MetadataIds; the
+  container of all projects is ().
+  """
+
+  def __init__(self, filename, clock=time.time):
+    """Opens the index in filename, creating it if need be.
+
+    Args:
+      filename: The name of the SQLite database file.
+      clock: A function that returns the current time in seconds.
+
+    Raises:
+      sqlite3.Error: if the index can't be opened.
+    """
+    self.filename = os.path.expanduser(filename)
+    self._clock = clock
+    if not os.path.exists(self.filename):
+      # Schemas and descriptions may be confidential, so keep them private.
+      try:
+        os.close(os.open(self.filename, os.O_WRONLY | os.O_CREAT, 0600))
+      except OSError, e:
+        raise sqlite3.OperationalError(str(e))
+    self._connection = sqlite3.connect(
+        self.filename, timeout=_METADATA_INDEX_TIMEOUT, check_same_thread=False)
+    self._lock = threading.Lock()
+    with self._lock:
+      with self._connection:
+        self._connection.executescript(_METADATA_INDEX_SCHEMA)
+
+  @staticmethod
+  def _Key(ids, length):
+    return tuple(ids) + ('',) * (length - len(ids))
+
+  def _Fresh(self, updated, max_age):
+    return max_age is None or self._clock() - updated <= max_age
+
+  def _Query(self, sql, params):
+    with self._lock:
+      return self._connection.execute(sql, params).fetchall()
+
+  def GetInfo(self, ids, max_age=None):
+    """Returns the info of an object, or None if it's unknown or too old.
+
+    Args:
+      ids: The ids of the project, dataset or table.
+      max_age: Optional. The age in seconds of the oldest info to return.
+    """
+    rows = self._Query(
+        'SELECT info, updated FROM objects '
+        'WHERE project_id = ? AND dataset_id = ? AND table_id = ?',
+        self._Key(ids, 3))
+    if rows and self._Fresh(rows[0][1], max_age):
+      return json.loads(rows[0][0])
+    return None
+
+  def GetListing(self, ids, max_age=None):
+    """Returns the entries listing the children of an object, or None.
+
+    Args:
+      ids: The ids of the container: () for the projects, those of a
+        project for its datasets, or of a dataset for its tables.
+      max_age: Optional. The age in seconds of the oldest listing to return.
+    """
+    rows = self._Query(
+        'SELECT entries, updated FROM listings '
+        'WHERE project_id = ? AND dataset_id = ?', self._Key(ids, 2))
+    if rows and self._Fresh(rows[0][1], max_age):
+      return json.loads(rows[0][0])
+    return None
+
+  def GetChildIds(self, ids):
+    """Returns the sorted ids of the known children of an object.
+
+    Children are known from their info or from the listing of ids, at any
+    age, so this suits uses such as completion that tolerate stale names.
+
+    Args:
+      ids: The ids of the container, as for GetListing.
+    """
+    columns = ('project_id', 'dataset_id', 'table_id')
+    child = columns[len(ids)]
+    conditions = ['%s = ?' % (column,) for column in columns[:len(ids)]]
+    conditions.append("%s != ''" % (child,))
+    conditions.extend("%s = ''" % (column,)
+                      for column in columns[len(ids) + 1:])
+    names = set(row[0] for row in self._Query(
+        'SELECT %s FROM objects WHERE %s' % (child, ' AND '.join(conditions)),
+        tuple(ids)))
+    for entry in self.GetListing(ids) or []:
+      try:
+        reference = BigqueryClient.ConstructObjectReference(entry)
+      except ValueError:
+        continue
+      names.add(_MetadataIds(reference)[-1])
+    return sorted(names)
+
+  def Update(self, infos=(), listings=()):
+    """Records the info of objects and the listings of containers.
+
+    Args:
+      infos: An iterable of (ids, info) pairs.
+      listings: An iterable of (ids, entries) pairs, of complete listings.
+    """
+    now = self._clock()
+    with self._lock:
+      with self._connection:
+        self._connection.executemany(
+            'INSERT OR REPLACE INTO objects VALUES (?, ?, ?, ?, ?)',
+            (self._Key(ids, 3) + (json.dumps(info), now)
+             for ids, info in infos))
+        self._connection.executemany(
+            'INSERT OR REPLACE INTO listings VALUES (?, ?, ?, ?)',
+            (self._Key(ids, 2) + (json.dumps(entries), now)
+             for ids, entries in listings))
+
+  def Invalidate(self, ids):
+    """Removes an object, the objects in it, and the listing it is in.
+
+    Args:
+      ids: The ids of the project, dataset or table.
+    """
+    columns = ('project_id', 'dataset_id', 'table_id')
+    within = ' AND '.join('%s = ?' % (column,) for column in columns[:len(ids)])
+    with self._lock:
+      with self._connection:
+        self._connection.execute(
+            'DELETE FROM objects WHERE ' + within, tuple(ids))
+        if len(ids) < 3:
+          self._connection.execute(
+              'DELETE FROM listings WHERE ' + within, tuple(ids))
+        self._connection.execute(
+            'DELETE FROM listings WHERE project_id = ? AND dataset_id = ?',
+            self._Key(ids[:-1], 2))
+
+  def Clear(self):
+    """Removes everything from the index."""
+    with self._lock:
+      with self._connection:
+        self._connection.execute('DELETE FROM objects')
+        self._connection.execute('DELETE FROM listings')
+
+
 class BigqueryClient(object):
   """Class encapsulating interaction with the BigQuery service."""
 
@@ -417,6 +2123,27 @@ class BigqueryClient(object):
         complete before returning from the insert request.
       wait_printer_factory: a function that returns a WaitPrinter.
         This will be called for each job that we wait on. See WaitJob().
+      max_concurrent_jobs: the maximum number of jobs that operations
+        starting more than one job, such as loading several local files,
+        will have in flight at once.
+      upload_chunk_size: the number of bytes sent in each request of a
+        media upload. Must be a multiple of 256 KiB.
+      upload_session_dir: if set, a directory in which to save the
+        sessions of media uploads, so that an interrupted upload of an
+        unchanged file with the same job configuration is resumed by the
+        next attempt instead of started over.
+      metadata_cache_ttls: a dict of the number of seconds that metadata
+        read from the server is reused for, by kind: 'project', 'dataset',
+        'table', and the listings 'datasets' and 'tables'. Kinds that are
+        left out keep their default; 0 turns off caching of a kind.
+      metadata_cache_size: the most metadata entries to keep.
+      metadata_index_file: if set, the name of a MetadataIndex file that
+        metadata read from the server is saved in, to be reused by later
+        clients, including ones in other processes.
+      metadata_index_max_age: the age in seconds of the oldest metadata in
+        the index that is used instead of reading it from the server. If
+        0, the default, the index is only used by GetMetadataIndex's
+        callers, such as completion of names.
 
     Raises:
       ValueError: if keywords are missing or incorrectly specified.
@@ -438,10 +2165,20 @@ class BigqueryClient(object):
         'wait_printer_factory': BigqueryClient.TransitionWaitPrinter,
         'job_id_generator': JobIdGeneratorIncrementing(JobIdGeneratorRandom()),
         'max_rows_per_request': _MAX_ROWS_PER_REQUEST,
+        'max_concurrent_jobs': _MAX_CONCURRENT_JOBS,
+        'upload_chunk_size': _UPLOAD_CHUNK_SIZE,
+        'upload_session_dir': None,
+        'metadata_cache_ttls': None,
+        'metadata_cache_size': _METADATA_CACHE_SIZE,
+        'metadata_index_file': None,
+        'metadata_index_max_age': 0,
         }
     for flagname, default in default_flag_values.iteritems():
       if not hasattr(self, flagname):
         setattr(self, flagname, default)
+    self._metadata_cache = _MetadataCache(self.metadata_cache_ttls,
+                                          self.metadata_cache_size)
+    self._metadata_index = None
     if self.dataset_id and not self.project_id:
       raise ValueError('Cannot set dataset_id without project_id')
 
@@ -459,7 +2196,10 @@ class BigqueryClient(object):
   def apiclient(self):
     """Return the apiclient attached to self."""
     if self._apiclient is None:
-      http = self.credentials.authorize(self.GetHttp())
+      # Jobs may be started from several threads at once (see
+      # RunJobsConcurrently), so give each thread its own connection.
+      http = _ThreadLocalHttp(
+          lambda: self.credentials.authorize(self.GetHttp()))
       bigquery_model = BigqueryModel(
           trace=self.trace)
       bigquery_http = BigqueryHttp.Factory(
@@ -710,30 +2450,171 @@ class BigqueryClient(object):
         identifier,))
 
   def GetObjectInfo(self, reference):
-    """Get all data returned by the server about a specific object."""
+    """Get all data returned by the server about a specific object.
+
+    Projects, datasets and tables are read through the metadata cache.
+    """
     # Projects are handled separately, because we only have
     # bigquery.projects.list.
     if isinstance(reference, ApiClientHelper.ProjectReference):
-      projects = self.ListProjects()
-      for project in projects:
-        if BigqueryClient.ConstructObjectReference(project) == reference:
-          project['kind'] = 'bigquery#project'
-          return project
-      raise BigqueryNotFoundError('Unknown %r' % (reference,))
+
+      def FindProject():
+        info = self._LookUpMetadataIndex('project', reference)
+        if info is not None:
+          return info
+        projects = self.ListProjects()
+        for project in projects:
+          if BigqueryClient.ConstructObjectReference(project) == reference:
+            project['kind'] = 'bigquery#project'
+            return project
+        raise BigqueryNotFoundError('Unknown %r' % (reference,))
+      return self._metadata_cache.Get('project', reference, FindProject)
 
     if isinstance(reference, ApiClientHelper.JobReference):
       return self.apiclient.jobs().get(**dict(reference)).execute()
     elif isinstance(reference, ApiClientHelper.DatasetReference):
-      return self.apiclient.datasets().get(**dict(reference)).execute()
+      return self._GetCachedMetadata(
+          'dataset', reference,
+          lambda: self.apiclient.datasets().get(**dict(reference)))
     elif isinstance(reference, ApiClientHelper.TableReference):
-      return self.apiclient.tables().get(**dict(reference)).execute()
+      return self._GetCachedMetadata(
+          'table', reference,
+          lambda: self.apiclient.tables().get(**dict(reference)))
     else:
       raise TypeError('Type of reference must be one of: ProjectReference, '
                       'JobReference, DatasetReference, or TableReference')
 
+  def _GetCachedMetadata(self, kind, reference, make_request, args=()):
+    """Reads metadata about reference through the metadata cache and index.
+
+    Args:
+      kind: The kind of metadata, for _MetadataCache.Get.
+      reference: The Reference the metadata is about.
+      make_request: A function of no arguments that returns a new request
+        that reads the metadata.
+      args: Any other arguments the metadata depends on.
+
+    Returns:
+      The metadata.
+    """
+
+    def Fetch():
+      result = self._LookUpMetadataIndex(kind, reference, args)
+      if result is None:
+        result = make_request().execute()
+        self._AddToMetadataIndex(kind, reference, result, args)
+      return result
+    return self._metadata_cache.Get(
+        kind, reference, Fetch,
+        lambda etag: make_request().ExecuteIfModified(etag),
+        args)
+
+  def GetMetadataIndex(self):
+    """Returns the MetadataIndex of this client, or None if there is none.
+
+    The index is opened the first time it is needed. If it can't be
+    opened, a warning is logged and the client does without it.
+    """
+    if self._metadata_index is None and self.metadata_index_file:
+      try:
+        self._metadata_index = MetadataIndex(self.metadata_index_file)
+      except sqlite3.Error, e:
+        logging.warning('Cannot open metadata index %s: %s',
+                        self.metadata_index_file, e)
+        self.metadata_index_file = None
+    return self._metadata_index
+
+  def _LookUpMetadataIndex(self, kind, reference, args=()):
+    """Returns metadata from the index if it is fresh enough, or None.
+
+    Args:
+      kind: The kind of metadata, as for _MetadataCache.Get.
+      reference: The Reference the metadata is about.
+      args: For listings, the (max_results, page_token, ...) they were
+        asked for with.
+    """
+    if self.metadata_index_max_age <= 0 or not self.GetMetadataIndex():
+      return None
+    ids = _MetadataIds(reference)
+    try:
+      if kind in ('project', 'dataset', 'table'):
+        return self._metadata_index.GetInfo(ids, self.metadata_index_max_age)
+      # Only whole listings are indexed, so only first pages are served.
+      max_results, page_token = args[:2]
+      if page_token or any(args[2:]):
+        return None
+      entries = self._metadata_index.GetListing(
+          ids, self.metadata_index_max_age)
+    except sqlite3.Error, e:
+      logging.warning('Cannot read metadata index: %s', e)
+      return None
+    # A listing cut short needs the server's nextPageToken, to say that
+    # there is more, so it is read from the server.
+    if entries is None or (max_results and len(entries) > max_results):
+      return None
+    return {kind: entries}
+
+  def _AddToMetadataIndex(self, kind, reference, result, args=()):
+    """Saves metadata read from the server in the index, if there is one.
+
+    Args:
+      kind: The kind of metadata, as for _MetadataCache.Get.
+      reference: The Reference the metadata is about.
+      result: The response of the request that read the metadata.
+      args: For listings, the (max_results, page_token, ...) they were
+        asked for with.
+    """
+    if not self.GetMetadataIndex():
+      return
+    ids = _MetadataIds(reference)
+    if kind in ('project', 'dataset', 'table'):
+      update = {'infos': [(ids, result)]}
+    elif any(args[1:]) or 'nextPageToken' in result:
+      return
+    elif kind == 'projects':
+      update = {
+          'listings': [(ids, result.get(kind, []))],
+          'infos': [(_MetadataIds(project['projectReference']),
+                     dict(project, kind='bigquery#project'))
+                    for project in result.get(kind, [])]}
+    else:
+      update = {'listings': [(ids, result.get(kind, []))]}
+    try:
+      self._metadata_index.Update(**update)
+    except sqlite3.Error, e:
+      logging.warning('Cannot update metadata index: %s', e)
+
+  def _InvalidateMetadata(self, reference):
+    """Drops the cached metadata about an object, and its listing.
+
+    Args:
+      reference: The DatasetReference or TableReference of the object.
+    """
+    if isinstance(reference, ApiClientHelper.TableReference):
+      parent, listing = reference.GetDatasetReference(), 'tables'
+    else:
+      parent, listing = reference.GetProjectReference(), 'datasets'
+    self._metadata_cache.Invalidate(reference)
+    self._metadata_cache.Invalidate(parent, kinds=(listing,))
+    if self.GetMetadataIndex():
+      try:
+        self._metadata_index.Invalidate(_MetadataIds(reference))
+      except sqlite3.Error, e:
+        logging.warning('Cannot update metadata index: %s', e)
+
+  def _InvalidateJobDestination(self, configuration):
+    """Drops the cached metadata about the table a job writes to, if any."""
+    for job_config in configuration.itervalues():
+      if isinstance(job_config, dict) and 'destinationTable' in job_config:
+        try:
+          self._InvalidateMetadata(ApiClientHelper.TableReference.Create(
+              **job_config['destinationTable']))
+        except ValueError:
+          pass
+
   def GetTableSchema(self, table_dict):
-    table_info = self.apiclient.tables().get(**table_dict).execute()
-    return table_info.get('schema', {})
+    table_ref = ApiClientHelper.TableReference.Create(**table_dict)
+    return self.GetObjectInfo(table_ref).get('schema', {})
 
   def ReadTableRows(self, table_dict, max_rows=_MAX_ROWS_PER_REQUEST):
     """Read at most max_rows rows from a table."""
@@ -766,7 +2647,14 @@ class BigqueryClient(object):
     op = self.apiclient.tabledata().insertAll(
         body=dict(rows=map(_EncodeInsert, inserts)),
         **table_dict)
-    return op.execute()
+    try:
+      return op.execute()
+    finally:
+      # Streamed rows change numRows and streamingBuffer, which cached
+      # metadata wouldn't show until it expired. Rows may have been
+      # inserted even if the request failed.
+      self._InvalidateMetadata(
+          ApiClientHelper.TableReference.Create(**table_dict))
 
   def ReadSchemaAndRows(self, table_dict, start_row=0,
                         max_rows=_MAX_ROWS_PER_REQUEST):
@@ -795,13 +2683,57 @@ class BigqueryClient(object):
       max_rows: number of rows to read.
 
     Returns:
-      A tuple where the first item is the list of fields and the
-      second item a list of rows.
+      A tuple where the first item is the list of fields and the
+      second item a list of rows.
+    """
+    job_ref = ApiClientHelper.JobReference.Create(**job_dict)
+    reader = _JobTableReader(self.apiclient, self.max_rows_per_request,
+                             job_ref)
+    return reader.ReadSchemaAndRows(start_row, max_rows)
+
+  def IterSchemaAndRows(self, table_dict, start_row=0,
+                        max_rows=_MAX_ROWS_PER_REQUEST):
+    """Like ReadSchemaAndRows, but returns an iterator over the rows.
+
+    The rows are read a page at a time as they are iterated.
+    """
+    table_ref = ApiClientHelper.TableReference.Create(**table_dict)
+    return _TableTableReader(self.apiclient, self.max_rows_per_request,
+                             table_ref).IterSchemaAndRows(start_row, max_rows)
+
+  def IterSchemaAndJobRows(self, job_dict, start_row=0,
+                           max_rows=_MAX_ROWS_PER_REQUEST):
+    """Like ReadSchemaAndJobRows, but returns an iterator over the rows.
+
+    The rows are read a page at a time as they are iterated.
+    """
+    job_ref = ApiClientHelper.JobReference.Create(**job_dict)
+    reader = _JobTableReader(self.apiclient, self.max_rows_per_request,
+                             job_ref)
+    return reader.IterSchemaAndRows(start_row, max_rows)
+
+  def GetRowPager(self, reference, page_rows):
+    """Returns a RowPager over the rows of a table or query job.
+
+    Arguments:
+      reference: A TableReference, or the JobReference of a query job.
+      page_rows: The number of rows in each page.
+
+    Raises:
+      TypeError: if reference is not a TableReference or JobReference.
+
+    Returns:
+      A RowPager that has not read any rows yet.
     """
-    job_ref = ApiClientHelper.JobReference.Create(**job_dict)
-    reader = _JobTableReader(self.apiclient, self.max_rows_per_request,
-                             job_ref)
-    return reader.ReadSchemaAndRows(start_row, max_rows)
+    if isinstance(reference, ApiClientHelper.JobReference):
+      reader = _JobTableReader(self.apiclient, self.max_rows_per_request,
+                               reference)
+    elif isinstance(reference, ApiClientHelper.TableReference):
+      reader = _TableTableReader(self.apiclient, self.max_rows_per_request,
+                                 reference)
+    else:
+      raise TypeError('Cannot read rows from %r' % (reference,))
+    return RowPager(reader, page_rows)
 
   @staticmethod
   def ConfigureFormatter(formatter, reference_type, print_format='list'):
@@ -894,8 +2826,10 @@ class BigqueryClient(object):
   def ProcessSources(source_string):
     """Take a source string and return a list of URIs.
 
-    The list will consist of either a single local filename, which
-    we check exists and is a file, or a list of gs:// uris.
+    The list will consist of either local filenames, which we check
+    exist and are files, or gs:// uris. Local sources may be glob
+    patterns, which are expanded in sorted order. A source of "-" stands
+    for standard input, and must be the only source.
 
     Args:
       source_string: A comma-separated list of URIs.
@@ -914,17 +2848,27 @@ class BigqueryClient(object):
       if len(gs_uris) != len(sources):
         raise BigqueryClientError('All URIs must begin with "gs://" if any do.')
       return sources
-    else:
-      source = sources[0]
-      if len(sources) > 1:
+    if '-' in sources:
+      if len(sources) != 1:
         raise BigqueryClientError(
-            'Local upload currently supports only one file, found %d' % (
-                len(sources),))
-      if not os.path.exists(source):
-        raise BigqueryClientError('Source file not found: %s' % (source,))
-      if not os.path.isfile(source):
-        raise BigqueryClientError('Source path is not a file: %s' % (source,))
-    return sources
+            'Standard input ("-") cannot be combined with other sources.')
+      return sources
+    filenames = []
+    for source in sources:
+      if glob.has_magic(source):
+        matches = sorted(glob.glob(source))
+        if not matches:
+          raise BigqueryClientError('No files match pattern: %s' % (source,))
+        filenames.extend(matches)
+      else:
+        filenames.append(source)
+    for filename in filenames:
+      if not os.path.exists(filename):
+        raise BigqueryClientError('Source file not found: %s' % (filename,))
+      if not os.path.isfile(filename):
+        raise BigqueryClientError(
+            'Source path is not a file: %s' % (filename,))
+    return filenames
 
   @staticmethod
   def ReadSchema(schema):
@@ -932,10 +2876,11 @@ class BigqueryClient(object):
 
     If schema does not contain ':' and is the name of an existing
     file, read it as a JSON schema. If not, it must be a
-    comma-separated list of fields in the form name:type.
+    comma-separated list of fields in the form name:type. A list of
+    fields, such as InferSchema returns, is used as it is.
 
     Args:
-      schema: A filename or schema.
+      schema: A filename, schema, or list of fields.
 
     Returns:
       The new schema (as a dict).
@@ -956,6 +2901,8 @@ class BigqueryClient(object):
 
     if not schema:
       raise BigquerySchemaError('Schema cannot be empty')
+    elif isinstance(schema, list):
+      return schema
     elif os.path.exists(schema):
       with open(schema) as f:
         try:
@@ -975,6 +2922,104 @@ class BigqueryClient(object):
     else:
       return [NewField(entry) for entry in schema.split(',')]
 
+  @staticmethod
+  def InferSchema(source, sample_rows=_SAMPLE_ROWS, field_delimiter=None,
+                  skip_leading_rows=None, encoding=None, quote=None,
+                  allow_quoted_newlines=None, source_format=None,
+                  rand=random, **unused_kwds):
+    """Infer a schema from a sample of the records of local files.
+
+    Takes the same arguments as Load, so that a caller can infer the
+    schema of exactly what it is about to load. For CSV, columns are
+    named after the last skipped leading row, if any, and otherwise
+    field_1, field_2, and so on; each column gets the narrowest type
+    that all its sampled values parse as. For NEWLINE_DELIMITED_JSON,
+    objects become RECORD fields and arrays REPEATED ones.
+
+    Args:
+      source: String specifying the local source files, as for Load.
+      sample_rows: Optional. The number of records to sample from each
+          file.
+      field_delimiter: Optional. As for Load.
+      skip_leading_rows: Optional. As for Load.
+      encoding: Optional. As for Load.
+      quote: Optional. As for Load.
+      allow_quoted_newlines: Optional. As for Load.
+      source_format: Optional. As for Load.
+      rand: Optional. The source of randomness, for tests.
+      **unused_kwds: Other arguments to Load, which are ignored.
+
+    Returns:
+      The inferred schema, as a list of fields.
+
+    Raises:
+      BigqueryClientError: if no schema can be inferred from the sources.
+    """
+    sources = BigqueryClient.ProcessSources(source)
+    if sources[0].startswith('gs://') or sources == ['-']:
+      raise BigqueryClientError('Schemas can only be inferred for local files.')
+    source_format = source_format or 'CSV'
+    if source_format not in ('CSV', 'NEWLINE_DELIMITED_JSON'):
+      raise BigqueryClientError(
+          'Cannot infer a schema for source format %s.' % (source_format,))
+    codec = 'latin-1' if encoding == 'ISO-8859-1' else 'utf-8'
+    if source_format == 'CSV':
+      field_delimiter = field_delimiter or ','
+      if isinstance(field_delimiter, unicode):
+        field_delimiter = field_delimiter.encode(codec)
+      if len(field_delimiter) != 1:
+        raise BigqueryClientError(
+            'Cannot infer a schema with multi-byte field delimiter %r.' % (
+                field_delimiter,))
+      if quote is None:
+        quote = '"'
+    else:
+      skip_leading_rows = 0
+      quote = None
+
+    def ParseCsv(record):
+      return csv.reader(
+          record.splitlines(True), delimiter=field_delimiter,
+          quotechar=quote or None,
+          quoting=csv.QUOTE_MINIMAL if quote else csv.QUOTE_NONE).next()
+
+    header = None
+    rows = []
+    json_fields = collections.OrderedDict()
+    for filename in sources:
+      leading, sample = _SampleRecords(
+          filename, sample_rows, skip_leading_rows=skip_leading_rows,
+          quote=quote if allow_quoted_newlines else None, rand=rand)
+      for record in sample:
+        if not record.strip():
+          continue
+        try:
+          if source_format == 'CSV':
+            rows.append(ParseCsv(record))
+          else:
+            value = json.loads(record.decode(codec),
+                               object_pairs_hook=collections.OrderedDict)
+            if isinstance(value, dict):
+              for key, subvalue in value.iteritems():
+                _InferJsonValue(json_fields, key, subvalue)
+        except (csv.Error, ValueError), e:
+          logging.info('Skipping unparseable record in %s: %s', filename, e)
+      if header is None and leading and leading[-1].strip():
+        try:
+          header = [name.decode(codec, 'replace')
+                    for name in ParseCsv(leading[-1])]
+        except csv.Error:
+          pass
+
+    if source_format == 'CSV':
+      fields = _InferCsvSchema(header, rows)
+    else:
+      fields = _InferJsonSchema(json_fields)
+    if not fields:
+      raise BigqueryClientError(
+          'Could not infer a schema from %s.' % (', '.join(sources),))
+    return fields
+
   @staticmethod
   def _KindToName(kind):
     """Convert a kind to just a type name."""
@@ -1124,6 +3169,97 @@ class BigqueryClient(object):
       request['pageToken'] = page_token
     return request
 
+  def _ListAll(self, collection, reference):
+    """Returns every entry of a listing, reading all of its pages.
+
+    Args:
+      collection: 'projects', 'datasets' or 'tables'.
+      reference: The container to list, as for _PrepareListRequest.
+
+    Returns:
+      The list of entries.
+    """
+    entries = []
+    page_token = None
+    while True:
+      request = self._PrepareListRequest(reference, None, page_token)
+      result = getattr(self.apiclient, collection)().list(**request).execute()
+      entries.extend(result.get(collection, []))
+      page_token = result.get('nextPageToken')
+      if not page_token:
+        return entries
+
+  def RefreshMetadataIndex(self, reference=None):
+    """Reads metadata from the server into the metadata index.
+
+    Reads the projects, or the given project or dataset, with the info of
+    every dataset and table in them, including the schemas of the tables.
+    Datasets and tables are read concurrently.
+
+    Arguments:
+      reference: Optional. The ProjectReference or DatasetReference to
+        read. If None, all projects are read.
+
+    Raises:
+      BigqueryClientError: if there is no metadata index.
+      TypeError: if reference is not a ProjectReference, DatasetReference
+        or None.
+
+    Returns:
+      A dict of the number of 'projects', 'datasets' and 'tables' read.
+    """
+    _Typecheck(reference, (type(None), ApiClientHelper.ProjectReference,
+                           ApiClientHelper.DatasetReference),
+               method='RefreshMetadataIndex')
+    index = self.GetMetadataIndex()
+    if index is None:
+      raise BigqueryClientError('No metadata index is configured.')
+    counts = {'projects': 0, 'datasets': 0, 'tables': 0}
+    if isinstance(reference, ApiClientHelper.DatasetReference):
+      dataset_refs = [reference]
+    else:
+      if reference is None:
+        projects = self._ListAll('projects', {})
+        index.Update(
+            infos=[(_MetadataIds(project['projectReference']),
+                    dict(project, kind='bigquery#project'))
+                   for project in projects],
+            listings=[((), projects)])
+        project_refs = map(BigqueryClient.ConstructObjectReference, projects)
+      else:
+        project_refs = [reference]
+      counts['projects'] = len(project_refs)
+      dataset_refs = []
+      for project_ref in project_refs:
+        datasets = self._ListAll('datasets', project_ref)
+        index.Update(listings=[(_MetadataIds(project_ref), datasets)])
+        dataset_refs.extend(
+            map(BigqueryClient.ConstructObjectReference, datasets))
+
+    def ReadDataset(dataset_ref):
+      info = self.apiclient.datasets().get(**dict(dataset_ref)).execute()
+      return dataset_ref, info, self._ListAll('tables', dataset_ref)
+
+    def ReadTable(table_ref):
+      return table_ref, self.apiclient.tables().get(**dict(table_ref)).execute()
+
+    table_refs = []
+    for dataset_ref, info, tables in _ReadInOrder(
+        ReadDataset, dataset_refs, _MAX_CONCURRENT_READS):
+      ids = _MetadataIds(dataset_ref)
+      index.Update(infos=[(ids, info)], listings=[(ids, tables)])
+      table_refs.extend(map(BigqueryClient.ConstructObjectReference, tables))
+      counts['datasets'] += 1
+    tables = _ReadInOrder(ReadTable, table_refs, _MAX_CONCURRENT_READS)
+    while True:
+      # Write the tables in batches, since each write is a transaction.
+      batch = [(_MetadataIds(table_ref), info)
+               for table_ref, info in itertools.islice(tables, 100)]
+      if not batch:
+        return counts
+      index.Update(infos=batch)
+      counts['tables'] += len(batch)
+
   def _NormalizeProjectReference(self, reference):
     if reference is None:
       try:
@@ -1174,8 +3310,13 @@ class BigqueryClient(object):
 
   def ListProjects(self, max_results=None, page_token=None):
     """List the projects this user has access to."""
-    request = self._PrepareListRequest({}, max_results, page_token)
-    result = self.apiclient.projects().list(**request).execute()
+    args = (max_results, page_token)
+    # The listing of all projects is indexed under no ids at all.
+    result = self._LookUpMetadataIndex('projects', {}, args)
+    if result is None:
+      request = self._PrepareListRequest({}, max_results, page_token)
+      result = self.apiclient.projects().list(**request).execute()
+      self._AddToMetadataIndex('projects', {}, result, args)
     return result.get('projects', [])
 
   def ListDatasetRefs(self, **kwds):
@@ -1191,7 +3332,10 @@ class BigqueryClient(object):
     request = self._PrepareListRequest(reference, max_results, page_token)
     if list_all is not None:
       request['all'] = list_all
-    result = self.apiclient.datasets().list(**request).execute()
+    result = self._GetCachedMetadata(
+        'datasets', reference,
+        lambda: self.apiclient.datasets().list(**request),
+        args=(max_results, page_token, list_all))
     return result.get('datasets', [])
 
   def ListTableRefs(self, **kwds):
@@ -1202,7 +3346,10 @@ class BigqueryClient(object):
     """List the tables associated with this reference."""
     _Typecheck(reference, ApiClientHelper.DatasetReference, method='ListTables')
     request = self._PrepareListRequest(reference, max_results, page_token)
-    result = self.apiclient.tables().list(**request).execute()
+    result = self._GetCachedMetadata(
+        'tables', reference,
+        lambda: self.apiclient.tables().list(**request),
+        args=(max_results, page_token))
     return result.get('tables', [])
 
   #################################
@@ -1252,7 +3399,7 @@ class BigqueryClient(object):
     _Typecheck(reference, ApiClientHelper.DatasetReference,
                method='DatasetExists')
     try:
-      self.apiclient.datasets().get(**dict(reference)).execute()
+      self.GetObjectInfo(reference)
       return True
     except BigqueryNotFoundError:
       return False
@@ -1260,7 +3407,7 @@ class BigqueryClient(object):
   def TableExists(self, reference):
     _Typecheck(reference, ApiClientHelper.TableReference, method='TableExists')
     try:
-      self.apiclient.tables().get(**dict(reference)).execute()
+      self.GetObjectInfo(reference)
       return True
     except BigqueryNotFoundError:
       return False
@@ -1299,6 +3446,7 @@ class BigqueryClient(object):
     except BigqueryDuplicateError:
       if not ignore_existing:
         raise
+    self._InvalidateMetadata(reference)
 
   def CreateTable(self, reference, ignore_existing=False, schema=None,
                   description=None, friendly_name=None, expiration=None):
@@ -1336,6 +3484,7 @@ class BigqueryClient(object):
     except BigqueryDuplicateError:
       if not ignore_existing:
         raise
+    self._InvalidateMetadata(reference)
 
   def UpdateTable(self, reference, schema=None,
                   description=None, friendly_name=None, expiration=None):
@@ -1364,6 +3513,7 @@ class BigqueryClient(object):
       body['expirationTime'] = expiration
 
     self.apiclient.tables().patch(body=body, **dict(reference)).execute()
+    self._InvalidateMetadata(reference)
 
   def UpdateDataset(self, reference,
                     description=None, friendly_name=None, acl=None):
@@ -1390,6 +3540,7 @@ class BigqueryClient(object):
       body['access'] = acl
 
     self.apiclient.datasets().patch(body=body, **dict(reference)).execute()
+    self._InvalidateMetadata(reference)
 
   def DeleteDataset(self, reference, ignore_not_found=False,
                     delete_contents=None):
@@ -1419,6 +3570,8 @@ class BigqueryClient(object):
     except BigqueryNotFoundError:
       if not ignore_not_found:
         raise
+    finally:
+      self._InvalidateMetadata(reference)
 
   def DeleteTable(self, reference, ignore_not_found=False):
     """Deletes TableReference reference.
@@ -1438,24 +3591,31 @@ class BigqueryClient(object):
     except BigqueryNotFoundError:
       if not ignore_not_found:
         raise
+    finally:
+      self._InvalidateMetadata(reference)
 
   #################################
   ## Job control
   #################################
 
   def StartJob(self, configuration,
-               project_id=None, upload_file=None, job_id=None):
+               project_id=None, upload_file=None, job_id=None,
+               compression_level=None):
     """Start a job with the given configuration.
 
     Args:
       configuration: The configuration for a job.
       project_id: The project_id to run the job under. If None,
         self.project_id is used.
-      upload_file: A file to include as a media upload to this request.
-        Only valid on job requests that expect a media upload file.
+      upload_file: A file to include as a media upload to this request,
+        either a filename, a _FileSlice of part of a file, or a file object
+        such as sys.stdin that is read once from front to back. Only valid
+        on job requests that expect a media upload file.
       job_id: A unique job_id to use for this job. If a
         JobIdGenerator, a job id will be generated from the job configuration.
         If None, a unique job_id will be created for this request.
+      compression_level: If not None, gzip upload_file at this level
+        (1 to 9) while uploading it, unless it is already gzipped.
 
     Returns:
       The job resource returned from the insert job request. If there is an
@@ -1465,11 +3625,19 @@ class BigqueryClient(object):
     Raises:
       BigqueryClientConfigurationError: if project_id and
         self.project_id are None.
+      BigqueryClientError: if self.upload_chunk_size is not a multiple
+        of 256 KiB.
     """
     project_id = project_id or self.project_id
     if not project_id:
       raise BigqueryClientConfigurationError(
           'Cannot start a job without a project id.')
+    if upload_file and self.upload_chunk_size % _UPLOAD_CHUNK_ALIGNMENT:
+      raise BigqueryClientError(
+          'Upload chunk size must be a multiple of %d bytes, got %d.' % (
+              _UPLOAD_CHUNK_ALIGNMENT, self.upload_chunk_size))
+    # The destination is invalidated again once the job is done; see PollJob.
+    self._InvalidateJobDestination(configuration)
     configuration = configuration.copy()
     if self.job_property:
       configuration['properties'] = dict(
@@ -1486,15 +3654,139 @@ class BigqueryClient(object):
       job_reference = {'jobId': job_id, 'projectId': project_id}
       job_request['jobReference'] = job_reference
     media_upload = ''
-    if upload_file:
-      resumable = True
-      media_upload = http_request.MediaFileUpload(
-          filename=upload_file, mimetype='application/octet-stream',
-          resumable=resumable)
-    result = self.apiclient.jobs().insert(
+    if isinstance(upload_file, basestring):
+      upload_file = _FileSlice(upload_file)
+    if upload_file and not isinstance(upload_file, _FileSlice):
+      stats = UploadStats(getattr(upload_file, 'name', '<stream>'))
+      media_upload = _StreamingUpload(
+          upload_file, compression_level,
+          chunksize=self.upload_chunk_size, stats=stats)
+    elif upload_file:
+      stats = UploadStats(upload_file.name, upload_file.size)
+      if compression_level is not None and not _IsGzipFile(upload_file):
+        media_upload = _StreamingUpload(
+            upload_file, compression_level,
+            chunksize=self.upload_chunk_size, stats=stats)
+      else:
+        resumable = True
+        media_upload = http_request.MediaIoBaseUpload(
+            upload_file, mimetype='application/octet-stream',
+            chunksize=self.upload_chunk_size, resumable=resumable)
+    request = self.apiclient.jobs().insert(
         body=job_request, media_body=media_upload,
-        projectId=project_id).execute()
-    return result
+        projectId=project_id)
+    if not upload_file:
+      return request.execute()
+    if not isinstance(upload_file, _FileSlice):
+      # A stream can't be read again, so there is no resuming it later.
+      return self._ExecuteUpload(request, stats, None)
+    # The job id is left out of the key, since a new one is usually
+    # generated for each attempt.
+    file_stat = os.stat(upload_file.filename)
+    session_key = _UploadSessionStore.Key(
+        os.path.abspath(upload_file.filename), file_stat.st_size,
+        file_stat.st_mtime, upload_file.begin, upload_file.end,
+        compression_level, project_id, configuration)
+    try:
+      return self._ExecuteUpload(request, stats, session_key)
+    finally:
+      upload_file.close()
+
+  def _ExecuteUpload(self, request, stats, session_key):
+    """Execute a request with a resumable media upload, chunk by chunk.
+
+    A failed chunk is retried with exponential backoff, first asking the
+    server how much of the media it has. If self.upload_session_dir is
+    set, the upload session is saved after every chunk, and a session
+    saved under the same key by an earlier run is resumed. The session is
+    deleted once the upload completes or is rejected.
+
+    Args:
+      request: The BigqueryHttp request to execute.
+      stats: The UploadStats of the upload, updated as chunks are sent.
+      session_key: A key identifying this upload across runs, or None if
+        it can't be resumed by another run.
+
+    Returns:
+      The response to the request once all of the media is uploaded.
+
+    Raises:
+      BigqueryCommunicationError: if a chunk still fails after retrying.
+      BigqueryError: if the server rejects the request.
+    """
+    upload = _ResumableUpload(request)
+    sessions = None
+    resuming = False
+    if (self.upload_session_dir and session_key is not None and
+        not upload.supported):
+      logging.warning('Uploads cannot be resumed with apiclient %s.',
+                      getattr(apiclient, '__version__', None))
+    elif self.upload_session_dir and session_key is not None:
+      sessions = _UploadSessionStore(self.upload_session_dir)
+      session = sessions.Get(session_key)
+      if session:
+        logging.info('Resuming upload of %s at byte %d.',
+                     stats.name, session['progress'])
+        upload.Resume(session['uri'], session['progress'])
+        stats.resumed_bytes = session['progress']
+        resuming = True
+
+    printer = self.wait_printer_factory()
+    failures = 0
+    response = None
+    while response is None:
+      try:
+        status, response = request.next_chunk()
+      except apiclient.errors.HttpError, e:
+        if resuming and e.resp.status in (404, 410):
+          logging.info('Upload session for %s expired, starting over.',
+                       stats.name)
+          sessions.Delete(session_key)
+          upload.Restart()
+          stats.resumed_bytes = 0
+          resuming = False
+          continue
+        if e.resp.status < 500:
+          if sessions:
+            sessions.Delete(session_key)
+          request.RaiseHttpError(e)
+        error = e
+      except (httplib.HTTPException, httplib2.HttpLib2Error, socket.error), e:
+        error = e
+      else:
+        resuming = False
+        failures = 0
+        if response is None:
+          stats.bytes_sent = status.resumable_progress
+          if not stats.compressed:
+            stats.bytes_read = stats.bytes_sent
+          if sessions:
+            sessions.Put(session_key, {
+                'uri': upload.uri,
+                'progress': upload.progress,
+                'file': stats.name,
+                })
+          printer.PrintUpload(stats)
+        continue
+      failures += 1
+      if failures > _UPLOAD_RETRIES:
+        raise BigqueryCommunicationError(
+            'Upload of %s failed after %d retries: %s' % (
+                stats.name, _UPLOAD_RETRIES, error))
+      logging.warning('Retry #%d for upload of %s at byte %d: %s',
+                      failures, stats.name, upload.progress, error)
+      upload.Failed()
+      time.sleep(random.random() * min(2 ** failures, 60))
+
+    if sessions:
+      sessions.Delete(session_key)
+    stats.bytes_sent = request.resumable.size()
+    if not stats.compressed:
+      stats.bytes_read = stats.bytes_sent
+    stats.Finish()
+    printer.PrintUpload(stats)
+    printer.Done()
+    return response
 
   def _StartQueryRpc(self,
                      query,
@@ -1583,16 +3875,19 @@ class BigqueryClient(object):
     return self.apiclient.jobs().getQueryResults(**kwds).execute()
 
   def RunJobSynchronously(self, configuration, project_id=None,
-                          upload_file=None, job_id=None):
+                          upload_file=None, job_id=None,
+                          compression_level=None):
     result = self.StartJob(configuration, project_id=project_id,
-                           upload_file=upload_file, job_id=job_id)
+                           upload_file=upload_file, job_id=job_id,
+                           compression_level=compression_level)
     if result['status']['state'] != 'DONE':
       job_reference = BigqueryClient.ConstructObjectReference(result)
       result = self.WaitJob(job_reference)
     return self.RaiseIfJobError(result)
 
   def ExecuteJob(self, configuration, sync=None,
-                 project_id=None, upload_file=None, job_id=None):
+                 project_id=None, upload_file=None, job_id=None,
+                 compression_level=None):
     """Execute a job, possibly waiting for results."""
     if sync is None:
       sync = self.sync
@@ -1600,11 +3895,11 @@ class BigqueryClient(object):
     if sync:
       job = self.RunJobSynchronously(
           configuration, project_id=project_id, upload_file=upload_file,
-          job_id=job_id)
+          job_id=job_id, compression_level=compression_level)
     else:
       job = self.StartJob(
           configuration, project_id=project_id, upload_file=upload_file,
-          job_id=job_id)
+          job_id=job_id, compression_level=compression_level)
       self.RaiseIfJobError(job)
     return job
 
@@ -1628,6 +3923,17 @@ class BigqueryClient(object):
       """
       raise NotImplementedError('Subclass must implement Done')
 
+    def PrintUpload(self, stats):
+      """Prints the progress of a media upload.
+
+      Subclasses need not implement this; by default nothing is printed.
+      Only the VerboseWaitPrinter prints it, on stderr.
+
+      Args:
+        stats: the UploadStats of the upload.
+      """
+      pass
+
   class WaitPrinterHelper(WaitPrinter):
     """A Done implementation that prints based off a property."""
 
@@ -1652,6 +3958,13 @@ class BigqueryClient(object):
           job_id, wait_time, status),
       sys.stderr.flush()
 
+    def PrintUpload(self, stats):
+      # On stderr, so that the progress isn't mixed into the output.
+      sys.stderr.write('\rUploading %s' % (stats,))
+      if stats.end_time is not None:
+        sys.stderr.write('\n')
+      sys.stderr.flush()
+
   class TransitionWaitPrinter(VerboseWaitPrinter):
     """A WaitPrinter that only prints status change updates."""
 
@@ -1663,6 +3976,9 @@ class BigqueryClient(object):
         super(BigqueryClient.TransitionWaitPrinter, self).Print(
             job_id, wait_time, status)
 
+    def PrintUpload(self, unused_stats):
+      pass
+
   def WaitJob(self, job_reference, status='DONE',
               wait=sys.maxint, wait_printer_factory=None):
     """Poll for a job to run until it reaches the requested status.
@@ -1743,8 +4059,180 @@ class BigqueryClient(object):
     wait = BigqueryClient.NormalizeWait(wait)
     job = self.apiclient.jobs().get(**dict(job_reference)).execute()
     current = job['status']['state']
+    if current == 'DONE':
+      self._InvalidateJobDestination(job.get('configuration', {}))
     return (current == status, job)
 
+  @staticmethod
+  def _StartJobInThread(index, start_function, started):
+    """Calls start_function and reports the result on the started queue."""
+    start_time = time.time()
+    try:
+      job = start_function()
+    except Exception, e:  # pylint: disable=broad-except
+      logging.info('Failed to start job %d: %s', index, e)
+      started.put((index, None, e, start_time))
+    else:
+      started.put((index, job, None, start_time))
+
+  @staticmethod
+  def _GetJobError(job):
+    """Returns the BigqueryError for job if it failed, or None."""
+    try:
+      BigqueryClient.RaiseIfJobError(job)
+    except BigqueryError, e:
+      return e
+    return None
+
+  def RunJobsConcurrently(self, job_starters, sync=None,
+                          max_concurrent_jobs=None, wait_printer_factory=None,
+                          retries=0):
+    """Start a group of jobs concurrently and wait on them together.
+
+    Each job is started by calling its start function on a worker thread,
+    so that slow start requests such as media uploads overlap. At most
+    max_concurrent_jobs jobs are being started or running at any time.
+    Started jobs are all polled from the calling thread, and the status
+    of the whole group is reported through a single WaitPrinter. A job
+    that fails is started again, by calling its start function again,
+    up to retries times, after an exponential backoff with jitter; start
+    functions that use a JobIdGenerator get a fresh job id for each
+    attempt.
+
+    Arguments:
+      job_starters: List of (name, start_function) pairs. Each
+        start_function takes no arguments, starts one job (for example by
+        calling StartJob) and returns the job resource.
+      sync: (optional, defaults to self.sync) If False, a job is considered
+        finished as soon as it has been started.
+      max_concurrent_jobs: (optional, defaults to self.max_concurrent_jobs)
+        Max number of jobs in flight at once.
+      wait_printer_factory: (optional, defaults to
+        self.wait_printer_factory) Returns a subclass of WaitPrinter
+        that will be called with the status of the group.
+      retries: (optional, defaults to 0) The number of times to restart
+        each job that fails. Jobs that fail with a BigqueryClientError,
+        which would fail the same way again, are not retried.
+
+    Returns:
+      A JobGroup holding one JobOutcome per entry of job_starters, in
+      the same order.
+    """
+    if sync is None:
+      sync = self.sync
+    max_concurrent_jobs = max(
+        1, max_concurrent_jobs or self.max_concurrent_jobs)
+    if wait_printer_factory:
+      printer = wait_printer_factory()
+    else:
+      printer = self.wait_printer_factory()
+    group_name = '%d jobs' % (len(job_starters),)
+
+    outcomes = [None] * len(job_starters)
+    pending = collections.deque(enumerate(job_starters))
+    started = Queue.Queue()
+    # Maps the index of each running job to (job, start_time).
+    running = {}
+    in_flight = 0
+    # Maps the index of each job to the number of times it was started,
+    # and when it was first started.
+    attempts = collections.defaultdict(int)
+    first_start_times = {}
+    # Maps the index of each job waiting to be retried to when it may be
+    # started again.
+    retry_times = {}
+
+    def Finish(index, job, error, start_time):
+      first_start_times.setdefault(index, start_time)
+      if (error and attempts[index] <= retries and
+          not isinstance(error, BigqueryClientError)):
+        # Failures such as rateLimitExceeded call for waiting a while,
+        # and jitter keeps the retries of a group from arriving together.
+        delay = min(2 ** attempts[index], 60) * (1 + random.random()) / 2
+        logging.warning('Retrying %s in %.1fs after attempt %d failed: %s',
+                        job_starters[index][0], delay, attempts[index], error)
+        retry_times[index] = time.time() + delay
+        return
+      outcomes[index] = JobOutcome(
+          job_starters[index][0], job, error, first_start_times[index],
+          time.time(), attempts[index])
+
+    # Poll the running jobs at the same intervals as WaitJob, but
+    # never less often than every 10 seconds, since one slow job should
+    # not delay noticing that the others are done.
+    waits = itertools.chain(
+        itertools.repeat(1, 8),
+        xrange(2, 10, 2),
+        itertools.repeat(10))
+    start_time = time.time()
+    next_poll = start_time
+    while pending or in_flight or retry_times:
+      now = time.time()
+      for index, retry_time in sorted(retry_times.items()):
+        if retry_time <= now:
+          del retry_times[index]
+          pending.append((index, job_starters[index]))
+      if not pending and not in_flight:
+        time.sleep(min(retry_times.itervalues()) - now)
+        continue
+      while pending and in_flight < max_concurrent_jobs:
+        index, (_, start_function) = pending.popleft()
+        attempts[index] += 1
+        thread = threading.Thread(
+            target=BigqueryClient._StartJobInThread,
+            args=(index, start_function, started))
+        thread.daemon = True
+        thread.start()
+        in_flight += 1
+
+      # Queue.get without a timeout can't be interrupted, so always
+      # wake up at least once a second.
+      try:
+        index, job, error, job_start_time = started.get(timeout=1)
+      except Queue.Empty:
+        pass
+      else:
+        if error:
+          Finish(index, None, error, job_start_time)
+          in_flight -= 1
+        elif not sync or job['status']['state'] == 'DONE':
+          Finish(index, job, self._GetJobError(job), job_start_time)
+          in_flight -= 1
+        else:
+          running[index] = (job, job_start_time)
+
+      if running and time.time() >= next_poll:
+        for index, (job, job_start_time) in running.items():
+          try:
+            done, job = self.PollJob(
+                BigqueryClient.ConstructObjectReference(job))
+          except (BigqueryCommunicationError, BigqueryBackendError), e:
+            # Transient errors while waiting on a job are okay.
+            logging.warning('Transient error during job status check: %s', e)
+            continue
+          if done:
+            del running[index]
+            Finish(index, job, self._GetJobError(job), job_start_time)
+            in_flight -= 1
+          else:
+            running[index] = (job, job_start_time)
+        next_poll = time.time() + waits.next()
+
+      counts = collections.defaultdict(int)
+      counts['STARTING'] = in_flight - len(running)
+      for job, _ in running.itervalues():
+        counts[job['status']['state']] += 1
+      for outcome in outcomes:
+        if outcome:
+          counts['FAILED' if outcome.error else 'DONE'] += 1
+      status = ', '.join(
+          '%d %s' % (counts[state], state)
+          for state in ('STARTING', 'PENDING', 'RUNNING', 'DONE', 'FAILED')
+          if counts[state])
+      printer.Print(group_name, time.time() - start_time, status)
+    printer.Done()
+    return JobGroup(outcomes)
+
   #################################
   ## Wrappers for job types
   #################################
@@ -1942,6 +4430,7 @@ class BigqueryClient(object):
            field_delimiter=None, skip_leading_rows=None, encoding=None,
            quote=None, max_bad_records=None, allow_quoted_newlines=None,
            source_format=None, allow_jagged_rows=None,
+           compression_level=None, split_size=None, max_uris_per_job=None,
            **kwds):
     """Load the given data into BigQuery.
 
@@ -1950,7 +4439,8 @@ class BigqueryClient(object):
 
     Args:
       destination_table_reference: TableReference to load data into.
-      source: String specifying source data to load.
+      source: String specifying source data to load. A source of "-"
+          uploads standard input as it is read.
       schema: (default None) Schema of the created table. (Can be left blank
           for append operations.)
       create_disposition: Optional. Specifies the create_disposition for
@@ -1971,17 +4461,41 @@ class BigqueryClient(object):
           "DATASTORE_BACKUP", or "NEWLINE_DELIMITED_JSON".
       allow_jagged_rows: Optional. Whether to allow missing trailing optional
           columns in csv import data.
+      compression_level: Optional. If set, gzip local files at this level
+          (1 to 9) as they are uploaded. Files that are already gzipped are
+          uploaded as they are.
+      split_size: Optional. If set, split local files into shards of about
+          this many bytes, each holding whole rows, and load each shard with
+          its own job. Leading rows are skipped locally, and quoted newlines
+          are kept inside their shard when allow_quoted_newlines is set.
+      max_uris_per_job: Optional. The most gs:// uris to load with one job.
+          Longer lists of uris are split across several jobs. Defaults to
+          _MAX_URIS_PER_JOB, the most the service accepts.
       **kwds: Passed on to self.ExecuteJob.
 
     Returns:
-      The resulting job info.
+      The resulting job info, or a JobGroup if source names more than one
+      local file, split_size is given, or there are more than
+      max_uris_per_job uris.
+
+    Raises:
+      BigqueryClientError: if compression or splitting is requested for
+          gs:// sources, or splitting for a gzipped file or standard input.
     """
     _Typecheck(destination_table_reference, ApiClientHelper.TableReference)
     load_config = {'destinationTable': dict(destination_table_reference)}
     sources = BigqueryClient.ProcessSources(source)
     if sources[0].startswith('gs://'):
+      if compression_level is not None or split_size:
+        raise BigqueryClientError(
+            'Compression and splitting only apply to local files, '
+            'not "gs://" uris.')
       load_config['sourceUris'] = sources
       upload_file = None
+    elif sources == ['-']:
+      if split_size:
+        raise BigqueryClientError('Cannot split standard input.')
+      upload_file = sys.stdin
     else:
       upload_file = sources[0]
     if schema is not None:
@@ -1994,9 +4508,338 @@ class BigqueryClient(object):
         source_format=source_format,
         allow_quoted_newlines=allow_quoted_newlines,
         allow_jagged_rows=allow_jagged_rows)
+    if upload_file and split_size:
+      if quote is None:
+        quote = '"'
+      if not allow_quoted_newlines or source_format not in (None, 'CSV'):
+        quote = None
+      shards = []
+      for filename in sources:
+        with open(filename, 'rb') as f:
+          if _IsGzipFile(f):
+            raise BigqueryClientError(
+                'Cannot split gzipped file %s.' % (filename,))
+        shards.extend(_SplitFile(filename, split_size,
+                                 skip_leading_rows=skip_leading_rows,
+                                 quote=quote))
+      if shards:
+        load_config.pop('skipLeadingRows', None)
+        sources = shards
+    if upload_file and (split_size or len(sources) > 1):
+      return self._LoadInParts(load_config, sources,
+                               compression_level=compression_level, **kwds)
+    max_uris_per_job = max_uris_per_job or _MAX_URIS_PER_JOB
+    if not upload_file and len(sources) > max_uris_per_job:
+      del load_config['sourceUris']
+      return self._LoadInParts(
+          load_config,
+          [sources[i:i + max_uris_per_job]
+           for i in xrange(0, len(sources), max_uris_per_job)],
+          **kwds)
     return self.ExecuteJob(configuration={'load': load_config},
-                           upload_file=upload_file, **kwds)
+                           upload_file=upload_file,
+                           compression_level=compression_level, **kwds)
+
+  def _LoadInParts(self, load_config, parts, sync=None,
+                   project_id=None, job_id=None, compression_level=None):
+    """Load data into one table with several concurrent jobs.
+
+    Each part is loaded by its own job into the same table, using
+    RunJobsConcurrently. A part is either a local file, which is uploaded
+    as the media of its job, or a list of gs:// uris for the job's
+    sourceUris. If the load replaces the table or requires it to be
+    empty, the first part is loaded on its own and the remaining parts
+    are then appended.
+
+    Args:
+      load_config: The load configuration shared by all parts.
+      parts: The parts to load, as filenames, _FileSlices, or lists of
+        uris.
+      sync: Whether to wait for the jobs to finish. Defaults to self.sync.
+      project_id: The project_id to run the jobs under.
+      job_id: A job_id or JobIdGenerator. Each part's job gets the
+        generated job_id with the index of the part appended.
+      compression_level: If not None, gzip each local file at this level.
+
+    Returns:
+      A JobGroup with one outcome per part.
+    """
+    job_id = job_id or self.job_id_generator
+
+    def Starter(upload, configuration, part_job_id):
+      return lambda: self.StartJob(
+          configuration, project_id=project_id, upload_file=upload,
+          job_id=part_job_id, compression_level=compression_level)
+
+    job_starters = []
+    for i, part in enumerate(parts):
+      configuration = {'load': dict(load_config)}
+      if isinstance(part, list):
+        configuration['load']['sourceUris'] = part
+        name = part[0]
+        if len(part) > 1:
+          name += ' and %d more' % (len(part) - 1,)
+        upload = None
+      else:
+        name = getattr(part, 'name', part)
+        upload = part
+      if i and load_config.get('writeDisposition') in (
+          'WRITE_TRUNCATE', 'WRITE_EMPTY'):
+        configuration['load']['writeDisposition'] = 'WRITE_APPEND'
+      part_job_id = job_id
+      if isinstance(part_job_id, JobIdGenerator):
+        part_job_id = part_job_id.Generate(configuration)
+      if part_job_id is not None:
+        part_job_id = '%s_%d' % (part_job_id, i)
+      job_starters.append((name, Starter(upload, configuration, part_job_id)))
+
+    if load_config.get('writeDisposition') not in (
+        'WRITE_TRUNCATE', 'WRITE_EMPTY'):
+      return self.RunJobsConcurrently(job_starters, sync=sync)
+    first = self.RunJobsConcurrently(job_starters[:1], sync=True)
+    if first.failed:
+      now = time.time()
+      error = BigqueryClientError(
+          'Not started because the load of %s failed.' % (
+              job_starters[0][0],))
+      return JobGroup(first.outcomes + [
+          JobOutcome(name, None, error, now, now, attempts=0)
+          for name, _ in job_starters[1:]])
+    rest = self.RunJobsConcurrently(job_starters[1:], sync=sync)
+    return JobGroup(first.outcomes + rest.outcomes)
+
+  def LoadManifest(self, manifest, sync=None, project_id=None, job_id=None,
+                   retries=_MANIFEST_RETRIES, max_concurrent_jobs=None,
+                   **defaults):
+    """Run the loads described by a manifest concurrently.
+
+    A manifest is a JSON list of entries, each describing one load job
+    with a "destination_table" identifier, a "source" string or list of
+    sources, an optional "schema" (a list of fields, or a string as for
+    ReadSchema), an optional "name" to report the job by, and any of
+    the options of Load in _MANIFEST_LOAD_OPTIONS. Every entry is checked
+    before any job is started. The jobs are run by RunJobsConcurrently,
+    and failed jobs are retried with fresh job ids.
+
+    Args:
+      manifest: The name of a manifest file, or the list of its entries.
+      sync: Whether to wait for the jobs to finish. Defaults to self.sync.
+      project_id: The project_id to run the jobs under.
+      job_id: A job_id or JobIdGenerator. A JobIdGenerator is asked for a
+        new job id for every attempt; a fixed job_id gets the index of the
+        entry, and the attempt number if it is a retry, appended.
+      retries: The number of times to retry each failed job.
+      max_concurrent_jobs: Max number of jobs in flight at once. Defaults
+        to self.max_concurrent_jobs.
+      **defaults: Options of Load used for entries that don't set them.
 
+    Returns:
+      A JobGroup with one outcome per entry, in manifest order.
+
+    Raises:
+      BigqueryClientError: if the manifest can't be read, or an entry is
+        invalid.
+    """
+    if isinstance(manifest, basestring):
+      try:
+        with open(manifest) as f:
+          manifest = json.load(f)
+      except (IOError, ValueError), e:
+        raise BigqueryClientError(
+            'Error reading manifest %s: %s' % (manifest, e))
+    if not isinstance(manifest, list) or not manifest:
+      raise BigqueryClientError(
+          'A manifest must be a non-empty JSON list of load entries.')
+    job_id = job_id or self.job_id_generator
+    if (isinstance(job_id, JobIdGenerator) and
+        not isinstance(job_id, JobIdGeneratorIncrementing)):
+      job_id = JobIdGeneratorIncrementing(job_id)
+
+    def Starter(index, reference, source, options):
+      attempts = itertools.count(1)
+
+      def Start():
+        attempt = attempts.next()
+        entry_job_id = job_id
+        if isinstance(job_id, basestring):
+          entry_job_id = '%s_%d' % (job_id, index)
+          if attempt > 1:
+            entry_job_id = '%s_%d' % (entry_job_id, attempt)
+        return self.Load(reference, source, sync=False,
+                         project_id=project_id, job_id=entry_job_id,
+                         **options)
+      return Start
+
+    job_starters = []
+    for index, entry in enumerate(manifest):
+      if not isinstance(entry, dict):
+        raise BigqueryClientError(
+            'Manifest entry %d is not a JSON object.' % (index,))
+      entry = dict(entry)
+      destination = entry.pop('destination_table', None)
+      source = entry.pop('source', None)
+      name = entry.pop('name', None) or destination
+      if not destination or not source:
+        raise BigqueryClientError(
+            'Manifest entry %d needs a destination_table and a source.' % (
+                index,))
+      unknown = set(entry) - _MANIFEST_LOAD_OPTIONS
+      if unknown:
+        raise BigqueryClientError(
+            'Unknown options in manifest entry %d: %s' % (
+                index, ', '.join(sorted(unknown))))
+      if not isinstance(source, basestring):
+        source = ','.join(source)
+      sources = BigqueryClient.ProcessSources(source)
+      if not sources[0].startswith('gs://') and (
+          len(sources) != 1 or sources == ['-']):
+        raise BigqueryClientError(
+            'Manifest entry %d must name gs:// uris or one local file.' % (
+                index,))
+      if entry.get('schema') is not None:
+        entry['schema'] = BigqueryClient.ReadSchema(entry['schema'])
+      options = dict(defaults)
+      options.update(entry)
+      if options.get('split_size'):
+        raise BigqueryClientError('Manifest loads cannot be split.')
+      max_uris_per_job = options.get('max_uris_per_job') or _MAX_URIS_PER_JOB
+      if len(sources) > max_uris_per_job:
+        raise BigqueryClientError(
+            'Manifest entry %d has more than %d uris; split it into several '
+            'entries.' % (index, max_uris_per_job))
+      job_starters.append((name, Starter(
+          index, self.GetTableReference(destination), source, options)))
+    return self.RunJobsConcurrently(
+        job_starters, sync=sync, max_concurrent_jobs=max_concurrent_jobs,
+        retries=retries)
+
+  def ValidateLoad(self, destination_table_reference, source,
+                   schema=None, field_delimiter=None, skip_leading_rows=None,
+                   encoding=None, quote=None, max_bad_records=None,
+                   allow_quoted_newlines=None, source_format=None,
+                   allow_jagged_rows=None, processes=None, **unused_kwds):
+    """Check local source files against the schema before loading them.
+
+    Takes the same arguments as Load, so that a caller can check exactly
+    what it is about to load. Each file is cut into chunks of whole
+    records that are checked in parallel by a pool of processes, for the
+    field count and whether each value parses as its field's type. The
+    checks are lenient: they look for records the server would certainly
+    reject, not for everything it might.
+
+    Args:
+      destination_table_reference: TableReference the data will be loaded
+          into. Its schema is used if schema is None.
+      source: String specifying the local source files, as for Load.
+      schema: Optional. Schema to check against, as for Load.
+      field_delimiter: Optional. As for Load.
+      skip_leading_rows: Optional. As for Load.
+      encoding: Optional. As for Load.
+      quote: Optional. As for Load.
+      max_bad_records: Optional. As for Load.
+      allow_quoted_newlines: Optional. As for Load.
+      source_format: Optional. As for Load.
+      allow_jagged_rows: Optional. As for Load.
+      processes: Optional. Number of processes to check chunks with.
+          Defaults to the number of CPUs.
+      **unused_kwds: Other arguments to Load, which are ignored.
+
+    Returns:
+      A tuple (rows, bad_records) of the number of rows checked and a list
+      of the BadRecords found, which is no longer than max_bad_records.
+
+    Raises:
+      BigqueryClientError: if the sources can't be checked, or more than
+          max_bad_records bad records are found.
+    """
+    sources = BigqueryClient.ProcessSources(source)
+    if sources[0].startswith('gs://') or sources == ['-']:
+      raise BigqueryClientError('Only local files can be validated.')
+    if source_format not in (None, 'CSV', 'NEWLINE_DELIMITED_JSON'):
+      raise BigqueryClientError(
+          'Cannot validate source format %s.' % (source_format,))
+    if schema is not None:
+      fields = BigqueryClient.ReadSchema(schema)
+    else:
+      try:
+        fields = self.GetTableSchema(
+            dict(destination_table_reference)).get('fields')
+      except BigqueryNotFoundError:
+        fields = None
+      if not fields:
+        raise BigqueryClientError(
+            'Cannot validate without a schema for %s.' % (
+                destination_table_reference,))
+    field_delimiter = field_delimiter or ','
+    if isinstance(field_delimiter, unicode):
+      field_delimiter = field_delimiter.encode(
+          'latin-1' if encoding == 'ISO-8859-1' else 'utf-8')
+    if len(field_delimiter) != 1:
+      raise BigqueryClientError(
+          'Cannot validate with multi-byte field delimiter %r.' % (
+              field_delimiter,))
+    if quote is None:
+      quote = '"'
+    max_bad_records = max_bad_records or 0
+    options = {
+        'fields': fields,
+        'source_format': source_format or 'CSV',
+        'field_delimiter': field_delimiter,
+        'quote': quote,
+        'encoding': encoding or 'UTF-8',
+        'allow_jagged_rows': allow_jagged_rows,
+        'allow_quoted_newlines': allow_quoted_newlines,
+        'limit': max_bad_records + 1,
+        }
+    if options['source_format'] != 'CSV':
+      skip_leading_rows = 0
+    processes = processes or multiprocessing.cpu_count()
+
+    shards = []
+    for filename in sources:
+      with open(filename, 'rb') as f:
+        gzipped = _IsGzipFile(f)
+      if gzipped:
+        shards.append((filename, 0, sys.maxint, True,
+                       skip_leading_rows or 0, options))
+        continue
+      # Aim for a few chunks per process, so that the work evens out.
+      chunk_size = max(os.path.getsize(filename) // (4 * processes),
+                       _VALIDATE_CHUNK_SIZE)
+      for shard in _SplitFile(
+          filename, chunk_size, skip_leading_rows=skip_leading_rows,
+          quote=quote if allow_quoted_newlines else None):
+        shards.append((filename, shard.begin, shard.end, False, 0, options))
+
+    rows = 0
+    bad_records = []
+    if processes == 1 or len(shards) <= 1:
+      pool = None
+      results = itertools.imap(_ValidateShard, shards)
+    else:
+      pool = multiprocessing.Pool(min(processes, len(shards)))
+      results = pool.imap_unordered(_ValidateShard, shards)
+    try:
+      for shard_rows, shard_bad_records in results:
+        rows += shard_rows
+        bad_records.extend(shard_bad_records)
+        if len(bad_records) > max_bad_records:
+          break
+    finally:
+      if pool:
+        pool.terminate()
+    # Results may arrive out of order, so put the bad records back in
+    # file order.
+    order = dict((filename, i) for i, filename in enumerate(sources))
+    bad_records.sort(
+        key=lambda record: (order[record.source], record.offset))
+    if len(bad_records) > max_bad_records:
+      raise BigqueryClientError(
+          'Validation found more than %d bad records:\n%s' % (
+              max_bad_records,
+              '\n'.join(' - %s' % (record,)
+                        for record in bad_records[:max_bad_records + 1])))
+    return rows, bad_records
 
   def Extract(self, source_table, destination_uri,
               print_header=None, field_delimiter=None,
@@ -2032,6 +4875,251 @@ class BigqueryClient(object):
         print_header=print_header, field_delimiter=field_delimiter)
     return self.ExecuteJob(configuration={'extract': extract_config}, **kwds)
 
+  def ExtractTables(self, dataset_reference, table_pattern,
+                    destination_uri_template, print_header=None,
+                    field_delimiter=None, destination_format=None,
+                    sync=None, project_id=None, job_id=None,
+                    max_concurrent_jobs=None):
+    """Extract the tables of a dataset that match a pattern, concurrently.
+
+    Every page of the dataset's tables is listed, and each table whose
+    id matches table_pattern is extracted by its own job, using
+    RunJobsConcurrently. Views are skipped, since they can't be
+    extracted.
+
+    Args:
+      dataset_reference: DatasetReference of the tables to extract.
+      table_pattern: A shell-style pattern, as for fnmatch, that the ids
+          of the tables to extract must match.
+      destination_uri_template: The gs:// uri to extract each table to,
+          in which "{table}" is replaced by the table id, and "{dataset}"
+          and "{project}" by the dataset and project ids.
+      print_header: Optional. As for Extract.
+      field_delimiter: Optional. As for Extract.
+      destination_format: Optional. As for Extract.
+      sync: Whether to wait for the jobs to finish. Defaults to self.sync.
+      project_id: The project_id to run the jobs under.
+      job_id: A job_id or JobIdGenerator. Each table's job gets the
+        generated job_id with the index of the table appended.
+      max_concurrent_jobs: Max number of jobs in flight at once. Defaults
+        to self.max_concurrent_jobs.
+
+    Returns:
+      A JobGroup with one outcome per table, in table id order.
+
+    Raises:
+      BigqueryClientError: if the template doesn't name each table's
+          destination, or no tables match.
+    """
+    _Typecheck(dataset_reference, ApiClientHelper.DatasetReference,
+               method='ExtractTables')
+    if '{table}' not in destination_uri_template:
+      raise BigqueryClientError(
+          'The destination uri of a multi-table extract must contain '
+          '"{table}".')
+    table_ids = []
+    page_token = None
+    while True:
+      request = self._PrepareListRequest(dataset_reference, None, page_token)
+      result = self.apiclient.tables().list(**request).execute()
+      for table in result.get('tables', []):
+        table_id = table['tableReference']['tableId']
+        if (table.get('type', 'TABLE') != 'VIEW' and
+            fnmatch.fnmatchcase(table_id, table_pattern)):
+          table_ids.append(table_id)
+      page_token = result.get('nextPageToken')
+      if not page_token:
+        break
+    if not table_ids:
+      raise BigqueryClientError('No tables in %s match %s.' % (
+          dataset_reference, table_pattern))
+    job_id = job_id or self.job_id_generator
+
+    def Starter(table_reference, destination_uri, table_job_id):
+      return lambda: self.Extract(
+          table_reference, destination_uri, print_header=print_header,
+          field_delimiter=field_delimiter,
+          destination_format=destination_format, sync=False,
+          project_id=project_id, job_id=table_job_id)
+
+    job_starters = []
+    for i, table_id in enumerate(sorted(table_ids)):
+      table_reference = ApiClientHelper.TableReference.Create(
+          tableId=table_id, **dict(dataset_reference))
+      destination_uri = destination_uri_template.replace(
+          '{table}', table_id).replace(
+              '{dataset}', dataset_reference.datasetId).replace(
+                  '{project}', dataset_reference.projectId)
+      table_job_id = job_id
+      if isinstance(table_job_id, JobIdGenerator):
+        table_job_id = table_job_id.Generate(
+            {'extract': {'sourceTable': dict(table_reference),
+                         'destinationUri': destination_uri}})
+      if table_job_id is not None:
+        table_job_id = '%s_%d' % (table_job_id, i)
+      job_starters.append((str(table_reference), Starter(
+          table_reference, destination_uri, table_job_id)))
+    return self.RunJobsConcurrently(
+        job_starters, sync=sync, max_concurrent_jobs=max_concurrent_jobs)
+
+  def ExtractLocal(self, source, destination, destination_format=None,
+                   print_header=None, field_delimiter=None, compress=None,
+                   shard_rows=None, max_concurrent_reads=None):
+    """Read a table or query result into a local file.
+
+    The rows are read by tabledata.list calls for shards of shard_rows
+    rows each, starting at different startIndexes, up to
+    max_concurrent_reads of them at once. Each shard is encoded as it
+    arrives, and the shards are written in order, so that only about
+    max_concurrent_reads shards are held in memory.
+
+    Args:
+      source: TableReference of the table to read, or JobReference of a
+          completed query job whose results are read.
+      destination: The name of the file to write, or "-" for stdout.
+          Progress is only printed when writing to a file.
+      destination_format: Optional. "CSV" (the default),
+          "NEWLINE_DELIMITED_JSON" or "COLUMNAR", the binary format of
+          table_formatter.ColumnarFormatter.
+      print_header: Optional. Whether to write a header row to a CSV
+          file. Defaults to True.
+      field_delimiter: Optional. The field delimiter of a CSV file.
+      compress: Optional. Whether to gzip the file. Defaults to whether
+          destination ends in ".gz".
+      shard_rows: Optional. The number of rows in each shard.
+      max_concurrent_reads: Optional. The number of shards read at once.
+
+    Returns:
+      A dict with the number of 'rows' and 'bytesWritten', and the
+      'durationSeconds' and 'rowsPerSecond' of the extract.
+
+    Raises:
+      BigqueryClientError: if the source is not a table or query job,
+          the format is unknown, a table with nested or repeated fields
+          is extracted to CSV, or a COLUMNAR file is compressed.
+    """
+    if isinstance(source, ApiClientHelper.JobReference):
+      job = self.GetObjectInfo(source)
+      table = job['configuration'].get('query', {}).get('destinationTable')
+      if not table:
+        raise BigqueryClientError(
+            'Only the results of query jobs can be extracted, not %r.' % (
+                source,))
+      source = ApiClientHelper.TableReference.Create(**table)
+    _Typecheck(source, ApiClientHelper.TableReference, method='ExtractLocal')
+    destination_format = destination_format or 'CSV'
+    if destination_format not in ('CSV', 'NEWLINE_DELIMITED_JSON',
+                                  'COLUMNAR'):
+      raise BigqueryClientError(
+          'Cannot extract to local format %s.' % (destination_format,))
+    if compress is None:
+      compress = destination.endswith('.gz')
+    if compress and destination_format == 'COLUMNAR':
+      raise BigqueryClientError(
+          'COLUMNAR files are read in place and cannot be compressed.')
+    shard_rows = shard_rows or _EXTRACT_SHARD_ROWS
+    max_concurrent_reads = max_concurrent_reads or _MAX_CONCURRENT_READS
+
+    table_info = self.GetObjectInfo(source)
+    fields = table_info.get('schema', {}).get('fields', [])
+    num_rows = int(table_info.get('numRows', 0))
+    if destination_format == 'CSV':
+      if any(field.get('type', 'STRING').upper() == 'RECORD' or
+             field.get('mode', 'NULLABLE').upper() == 'REPEATED'
+             for field in fields):
+        raise BigqueryClientError(
+            'Tables with nested or repeated fields cannot be extracted '
+            'to CSV.')
+      field_delimiter = field_delimiter or ','
+      if len(field_delimiter) != 1:
+        raise BigqueryClientError(
+            'Local CSV extracts need a single byte field delimiter.')
+
+      def Encode(rows):
+        return _EncodeCsvRows(fields, rows, field_delimiter)
+    elif destination_format == 'COLUMNAR':
+      # Columns are typed by the schema and their offsets are global to
+      # the file, so the rows are kept and written by one formatter.
+      def Encode(rows):
+        return rows
+    else:
+
+      def Encode(rows):
+        return _EncodeJsonRows(fields, rows)
+
+    def ReadShard(start_row):
+      reader = _TableTableReader(
+          self.apiclient, self.max_rows_per_request, source,
+          schema=table_info.get('schema', {}))
+      for attempt in itertools.count(1):
+        try:
+          rows = reader.ReadRows(start_row, min(shard_rows,
+                                                num_rows - start_row))
+          break
+        except (BigqueryCommunicationError, BigqueryBackendError), e:
+          if attempt > _UPLOAD_RETRIES:
+            raise
+          logging.warning('Retry #%d reading rows %d of %r: %s',
+                          attempt, start_row, source, e)
+          time.sleep(random.random() * min(2 ** attempt, 60))
+      return len(rows), Encode(rows)
+
+    if destination == '-':
+      output = sys.stdout
+    else:
+      output = open(destination, 'wb')
+    counter = _CountingWriter(output)
+    writer = counter
+    if compress:
+      writer = gzip.GzipFile(filename='', mode='wb', fileobj=counter)
+    if destination == '-':
+      # Progress would be mixed into the rows.
+      printer = BigqueryClient.QuietWaitPrinter()
+    else:
+      printer = self.wait_printer_factory()
+    start_time = time.time()
+    rows_written = 0
+    try:
+      formatter = None
+      if destination_format == 'COLUMNAR':
+        formatter = table_formatter.ColumnarFormatter()
+        for field in fields:
+          formatter.AddField(field)
+        formatter.Begin(writer)
+      elif destination_format == 'CSV' and (
+          print_header or print_header is None):
+        writer.write(_EncodeCsvRows(
+            [{}] * len(fields), [[field['name'] for field in fields]],
+            field_delimiter))
+      for rows, data in _ReadInOrder(
+          ReadShard, xrange(0, num_rows, shard_rows), max_concurrent_reads):
+        if formatter is None:
+          writer.write(data)
+        else:
+          for row in data:
+            formatter.WriteRow(row)
+        rows_written += rows
+        elapsed = time.time() - start_time
+        printer.Print(str(source), elapsed, '%d of %d rows, %d rows/s' % (
+            rows_written, num_rows, rows_written / max(elapsed, 1e-3)))
+      if formatter is not None:
+        formatter.End()
+      if compress:
+        writer.close()
+    finally:
+      if output is not sys.stdout:
+        output.close()
+      else:
+        output.flush()
+    printer.Done()
+    elapsed = time.time() - start_time
+    return {
+        'rows': rows_written,
+        'bytesWritten': counter.bytes_written,
+        'durationSeconds': round(elapsed, 3),
+        'rowsPerSecond': int(rows_written / max(elapsed, 1e-3)),
+        }
+
 
 class _TableReader(object):
   """Base class that defines the TableReader interface.
@@ -2069,12 +5157,51 @@ class _TableReader(object):
       A tuple where the first item is the list of fields and the
       second item a list of rows.
     """
-    page_token = None
     rows = []
     schema = {}
+    for schema, page in self._ReadPages(start_row, max_rows):
+      rows.extend(page)
+    return (schema, rows)
+
+  def IterSchemaAndRows(self, start_row=0, max_rows=None):
+    """Like ReadSchemaAndRows, but reads pages as the rows are iterated.
+
+    Only the first page is read before this returns, so the rows can be
+    printed as they arrive instead of once all of them are in memory.
+
+    Args:
+      start_row: first row to read.
+      max_rows: maximum number of rows to return.
+
+    Returns:
+      A tuple where the first item is the list of fields and the
+      second item an iterator over the rows.
+    """
+    pages = self._ReadPages(start_row, max_rows)
+    schema, first_page = next(pages, ({}, []))
+    rows = itertools.chain(
+        first_page, itertools.chain.from_iterable(page for _, page in pages))
+    return (schema, rows)
+
+  def _ReadPages(self, start_row, max_rows):
+    """Read at most max_rows rows a page at a time.
+
+    Args:
+      start_row: first row to read.
+      max_rows: maximum number of rows to return.
+
+    Raises:
+      BigqueryInterfaceError: when bigquery returns something unexpected.
+
+    Yields:
+      For each page, a tuple of the list of fields and the page's rows.
+    """
+    page_token = None
+    rows_read = 0
+    schema = {}
     max_rows = max_rows or _MAX_ROWS_PER_REQUEST
-    while len(rows) < max_rows:
-      rows_to_read = max_rows - len(rows)
+    while rows_read < max_rows:
+      rows_to_read = max_rows - rows_read
       rows_to_read = min(self.max_rows_per_request, rows_to_read)
       (more_rows, page_token, current_schema) = self._ReadOnePage(
           None if page_token else start_row,
@@ -2082,8 +5209,9 @@ class _TableReader(object):
           page_token=page_token)
       if not schema and current_schema:
         schema = current_schema.get('fields', {})
-      for row in more_rows:
-        rows.append([entry.get('v', '') for entry in row.get('f', [])])
+      rows_read += len(more_rows)
+      yield schema, [[entry.get('v', '') for entry in row.get('f', [])]
+                     for row in more_rows]
       if not page_token:
         start_row += len(more_rows)
         if not more_rows:
@@ -2093,7 +5221,6 @@ class _TableReader(object):
         if not more_rows:
           raise BigqueryInterfaceError(
               'Not enough rows returned by server for %r' % (self,))
-    return (schema, rows)
 
   def __str__(self):
     return self._GetPrintContext()
@@ -2127,10 +5254,13 @@ class _TableReader(object):
 class _TableTableReader(_TableReader):
   """A TableReader that reads from a table."""
 
-  def __init__(self, local_apiclient, max_rows_per_request, table_ref):
+  def __init__(self, local_apiclient, max_rows_per_request, table_ref,
+               schema=None):
     self.table_ref = table_ref
     self.max_rows_per_request = max_rows_per_request
     self._apiclient = local_apiclient
+    # The schema is fetched with the first page, and reused after that.
+    self._schema = schema
 
   def _GetPrintContext(self):
     return '%r' % (self.table_ref,)
@@ -2146,11 +5276,12 @@ class _TableTableReader(_TableReader):
     page_token = data.get('pageToken', None)
     rows = data.get('rows', [])
 
-    kwds = dict(self.table_ref)
-    table_info = self._apiclient.tables().get(**kwds).execute()
-    schema = table_info.get('schema', {})
+    if self._schema is None:
+      kwds = dict(self.table_ref)
+      table_info = self._apiclient.tables().get(**kwds).execute()
+      self._schema = table_info.get('schema', {})
 
-    return (rows, page_token, schema)
+    return (rows, page_token, self._schema)
 
 
 class _JobTableReader(_TableReader):
@@ -2182,6 +5313,127 @@ class _JobTableReader(_TableReader):
     return (rows, page_token, schema)
 
 
+class RowPager(object):
+  """Reads the rows of a table a page at a time, as they are asked for.
+
+  A page is named by its first row: the page at start_row holds rows
+  [start_row, start_row + page_rows), and is read with startIndex, so any
+  page can be shown without reading the rows before it. Once a full page
+  is returned, the page after it is read in a background thread, so that
+  paging forward rarely waits on the server. The most recently returned
+  pages are kept, so paging back doesn't read them again.
+  """
+
+  def __init__(self, reader, page_rows, cached_pages=_PAGER_CACHED_PAGES):
+    """Initializes a RowPager.
+
+    Args:
+      reader: The _TableReader to read the rows with.
+      page_rows: The number of rows in each page.
+      cached_pages: The number of recently returned pages to keep.
+    """
+    if page_rows < 1:
+      raise ValueError('page_rows must be positive, not %r' % (page_rows,))
+    self.reader = reader
+    self.page_rows = page_rows
+    self.cached_pages = cached_pages
+    # The list of fields, once the first page has been read.
+    self.schema = None
+    # The number of rows, once a page that isn't full has been read.
+    self.row_count = None
+    self._pages = collections.OrderedDict()
+    # The first row of the page being read ahead, and the queue its
+    # result arrives on.
+    self._prefetch_start = None
+    self._prefetch = None
+
+  def GetPage(self, start_row):
+    """Returns the rows of a page, reading it if need be.
+
+    Args:
+      start_row: The first row of the page, from 0.
+
+    Raises:
+      BigqueryError: if the page can't be read.
+
+    Returns:
+      The list of rows in the page, which is empty past the last row.
+    """
+    if start_row in self._pages:
+      rows = self._pages.pop(start_row)
+    else:
+      if start_row == self._prefetch_start:
+        schema, rows = self._WaitForPrefetch()
+      else:
+        schema, rows = self._ReadPage(start_row)
+      self._AddPage(start_row, schema, rows)
+    self._pages[start_row] = rows
+    while len(self._pages) > self.cached_pages:
+      self._pages.popitem(last=False)
+    if len(rows) == self.page_rows:
+      self._StartPrefetch(start_row + self.page_rows)
+    return rows
+
+  def Close(self):
+    """Discards any page still being read ahead.
+
+    The read isn't waited for: its thread is a daemon, so it doesn't keep
+    the process alive, and it ends once the read does.
+    """
+    self._prefetch_start = None
+    self._prefetch = None
+
+  def IsLastPage(self, start_row):
+    """Returns whether no rows are known to follow the given page."""
+    return (self.row_count is not None and
+            start_row + self.page_rows >= self.row_count)
+
+  def _ReadPage(self, start_row):
+    return self.reader.ReadSchemaAndRows(start_row, self.page_rows)
+
+  def _AddPage(self, start_row, schema, rows):
+    if self.schema is None:
+      self.schema = schema
+    # An empty page past the end only bounds the number of rows.
+    if len(rows) < self.page_rows and (rows or not start_row):
+      self.row_count = start_row + len(rows)
+
+  def _StartPrefetch(self, start_row):
+    """Starts reading a page in the background, unless it's known."""
+    if (start_row in self._pages or start_row == self._prefetch_start or
+        self.IsLastPage(start_row - self.page_rows)):
+      return
+
+    def Read(result):
+      try:
+        result.put((True, self._ReadPage(start_row)))
+      except Exception:  # pylint: disable=broad-except
+        result.put((False, sys.exc_info()))
+
+    # A page still being read ahead is abandoned; its thread ends once
+    # the read does.
+    self._prefetch_start = start_row
+    self._prefetch = Queue.Queue(1)
+    thread = threading.Thread(target=Read, args=(self._prefetch,))
+    thread.daemon = True
+    thread.start()
+
+  def _WaitForPrefetch(self):
+    result = self._prefetch
+    self._prefetch_start = None
+    self._prefetch = None
+    while True:
+      # Queue.get without a timeout can't be interrupted.
+      try:
+        ok, value = result.get(timeout=1)
+        break
+      except Queue.Empty:
+        pass
+    if not ok:
+      raise value[0], value[1], value[2]
+    return value
+
+
 class ApiClientHelper(object):
   """Static helper methods and classes not provided by the discovery client."""
 
@@ -2189,53 +5441,89 @@ class ApiClientHelper(object):
     raise NotImplementedError('Cannot instantiate static class ApiClientHelper')
 
   class Reference(object):
-    """Base class for Reference objects returned by apiclient."""
-    _required_fields = set()
+    """Base class for Reference objects returned by apiclient.
+
+    References are immutable. Each subclass keeps its fields in slots
+    named by _required_fields, and they hash and compare by type and
+    fields, so they can be used as dict keys and in sets.
+    """
+    __slots__ = ('_items', '_hash')
+    _required_fields = ()
     _format_str = ''
 
     def __init__(self, **kwds):
       if type(self) == ApiClientHelper.Reference:
         raise NotImplementedError(
             'Cannot instantiate abstract class ApiClientHelper.Reference')
+      items = []
       for name in self._required_fields:
-        if not kwds.get(name, ''):
+        value = kwds.get(name, '')
+        if not value:
           raise ValueError('Missing required argument %s to %s' % (
               name, self.__class__.__name__))
-        setattr(self, name, kwds[name])
+        object.__setattr__(self, name, value)
+        items.append((name, value))
+      # The (name, value) pairs, in the order of _required_fields, make
+      # dict(reference) cheap.
+      object.__setattr__(self, '_items', tuple(items))
+      object.__setattr__(self, '_hash', hash((self.typename,) + self._items))
 
     @classmethod
     def Create(cls, **kwds):
       """Factory method for this class."""
-      args = dict((k, v) for k, v in kwds.iteritems()
-                  if k in cls._required_fields)
-      return cls(**args)
+      # __init__ ignores any other keywords.
+      return cls(**kwds)
+
+    def __setattr__(self, name, value):
+      raise AttributeError('%s is immutable' % (self.__class__.__name__,))
+
+    def __delattr__(self, name):
+      raise AttributeError('%s is immutable' % (self.__class__.__name__,))
+
+    def __copy__(self):
+      return self
+
+    def __deepcopy__(self, unused_memo):
+      return self
 
     def __iter__(self):
-      return ((name, getattr(self, name)) for name in self._required_fields)
+      return iter(self._items)
+
+    def __hash__(self):
+      return self._hash
 
     def __str__(self):
-      return self._format_str % dict(self)
+      return self._format_str % dict(self._items)
 
     def __repr__(self):
       return "%s '%s'" % (self.typename, self)
 
     def __eq__(self, other):
-      d = dict(other)
-      return all(getattr(self, name) == d.get(name, '')
-                 for name in self._required_fields)
+      if isinstance(other, ApiClientHelper.Reference):
+        return (self._hash == other._hash and type(self) is type(other) and
+                self._items == other._items)
+      try:
+        d = dict(other)
+      except (TypeError, ValueError):
+        return NotImplemented
+      return all(value == d.get(name, '') for name, value in self._items)
+
+    def __ne__(self, other):
+      equal = self.__eq__(other)
+      return equal if equal is NotImplemented else not equal
 
   class JobReference(Reference):
-    _required_fields = set(('projectId', 'jobId'))
+    __slots__ = _required_fields = ('projectId', 'jobId')
     _format_str = '%(projectId)s:%(jobId)s'
     typename = 'job'
 
   class ProjectReference(Reference):
-    _required_fields = set(('projectId',))
+    __slots__ = _required_fields = ('projectId',)
     _format_str = '%(projectId)s'
     typename = 'project'
 
   class DatasetReference(Reference):
-    _required_fields = set(('projectId', 'datasetId'))
+    __slots__ = _required_fields = ('projectId', 'datasetId')
     _format_str = '%(projectId)s:%(datasetId)s'
     typename = 'dataset'
 
@@ -2244,7 +5532,7 @@ class ApiClientHelper(object):
           projectId=self.projectId)
 
   class TableReference(Reference):
-    _required_fields = set(('projectId', 'datasetId', 'tableId'))
+    __slots__ = _required_fields = ('projectId', 'datasetId', 'tableId')
     _format_str = '%(projectId)s:%(datasetId)s.%(tableId)s'
     typename = 'table'
 
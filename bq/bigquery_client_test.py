@@ -6,12 +6,25 @@
 
 
 import itertools
+import gzip
 import json
+import os
+import random
+import shutil
+import socket
+import StringIO
+import sys
 import tempfile
+import threading
+import time
+import zlib
 
+from apiclient import http as http_request
 from google.apputils import googletest
+import httplib2
 
 import bigquery_client
+import table_formatter
 
 
 class BigqueryClientTest(googletest.TestCase):
@@ -115,6 +128,27 @@ class BigqueryClientTest(googletest.TestCase):
       reference = self._GetReference(parse)
       self.assertEquals(reference, self.client.GetReference(identifier))
 
+  def testReferencesAreHashableAndImmutable(self):
+    helper = bigquery_client.ApiClientHelper
+    table = helper.TableReference.Create(
+        projectId='prj', datasetId='ds', tableId='tbl', kind='ignored')
+    self.assertEquals({'projectId': 'prj', 'datasetId': 'ds', 'tableId': 'tbl'},
+                      dict(table))
+    self.assertEquals('prj:ds.tbl', str(table))
+    same = helper.TableReference(projectId='prj', datasetId='ds', tableId='tbl')
+    self.assertEquals(table, same)
+    self.assertFalse(table != same)
+    self.assertEquals(1, len(set([table, same])))
+    self.assertEquals(table, dict(table))
+    self.assertNotEqual(table.GetDatasetReference(), table)
+    self.assertNotEqual(
+        helper.ProjectReference(projectId='prj'),
+        helper.JobReference(projectId='prj', jobId='prj'))
+    self.assertRaises(AttributeError, setattr, table, 'tableId', 'other')
+    self.assertRaises(AttributeError, setattr, table, 'other', 'x')
+    self.assertRaises(ValueError, helper.TableReference, projectId='prj',
+                      datasetId='ds')
+
   def testParseDatasetReference(self):
     dataset_parses = dict((k, v) for k, v in self.reference_tests.iteritems()
                           if len(filter(bool, v)) == 2)
@@ -182,6 +216,1241 @@ class BigqueryClientTest(googletest.TestCase):
         r'not a JSON object',
         bigquery_client.JsonToInsertEntry, None, '[1, 2]')
 
+  def testProcessSourcesExpandsGlobs(self):
+    directory = tempfile.mkdtemp()
+    try:
+      names = [os.path.join(directory, name)
+               for name in ('b.csv', 'a.csv', 'c.json')]
+      for name in names:
+        open(name, 'w').close()
+      self.assertEquals(
+          sorted(names[:2]) + [names[2]],
+          bigquery_client.BigqueryClient.ProcessSources(
+              '%s, %s' % (os.path.join(directory, '*.csv'), names[2])))
+      self.assertRaisesRegexp(
+          bigquery_client.BigqueryClientError, r'No files match',
+          bigquery_client.BigqueryClient.ProcessSources,
+          os.path.join(directory, '*.tsv'))
+      self.assertRaisesRegexp(
+          bigquery_client.BigqueryClientError, r'not found',
+          bigquery_client.BigqueryClient.ProcessSources,
+          '%s,%s' % (names[0], os.path.join(directory, 'missing.csv')))
+      self.assertEquals(
+          ['-'], bigquery_client.BigqueryClient.ProcessSources('-'))
+      self.assertRaisesRegexp(
+          bigquery_client.BigqueryClientError, r'cannot be combined',
+          bigquery_client.BigqueryClient.ProcessSources,
+          '-,%s' % (names[0],))
+    finally:
+      shutil.rmtree(directory)
+
+
+class _FakeTime(object):
+  """A stand-in for the time module whose sleeps return at once.
+
+  Its clock runs with the real one, and jumps ahead by each sleep.
+  """
+
+  def __init__(self):
+    self.slept = 0
+    self.sleeps = []
+
+  def time(self):
+    return time.time() + self.slept
+
+  def sleep(self, secs):
+    self.sleeps.append(secs)
+    self.slept += max(secs, 0)
+
+
+class RunJobsConcurrentlyTest(googletest.TestCase):
+
+  def setUp(self):
+    self.client = bigquery_client.BigqueryClient(
+        api='http', api_version='', project_id='prj',
+        wait_printer_factory=bigquery_client.BigqueryClient.QuietWaitPrinter)
+    self.client.PollJob = self._PollJob
+    self.started = []
+    self.clock = bigquery_client.time = _FakeTime()
+
+  def tearDown(self):
+    bigquery_client.time = time
+
+  @staticmethod
+  def _Job(job_id, state, error=None):
+    job = {'jobReference': {'projectId': 'prj', 'jobId': job_id},
+           'status': {'state': state},
+           'statistics': {'load': {'inputFileBytes': '10'}}}
+    if error:
+      job['status']['errorResult'] = {'reason': 'invalid', 'message': error}
+    return job
+
+  def _PollJob(self, job_reference):
+    job_id = job_reference.jobId
+    return True, self._Job(job_id, 'DONE', 'bad' if 'fail' in job_id else None)
+
+  def _Starter(self, job_id, state='RUNNING'):
+
+    def Start():
+      self.started.append(job_id)
+      if job_id == 'raise':
+        raise IOError('upload failed')
+      return self._Job(job_id, state)
+    return (job_id, Start)
+
+  def testOutcomes(self):
+    group = self.client.RunJobsConcurrently(
+        [self._Starter('ok'), self._Starter('fail'), self._Starter('raise'),
+         self._Starter('done', state='DONE')],
+        max_concurrent_jobs=2)
+    self.assertEquals(['ok', 'fail', 'raise', 'done'],
+                      [outcome.name for outcome in group])
+    self.assertEquals(['fail', 'raise'],
+                      [outcome.name for outcome in group.failed])
+    summary = group.Summary()
+    self.assertEquals((2, 2, 30), (summary['succeeded'], summary['failed'],
+                                   summary['inputBytes']))
+    self.assertEquals('prj:ok', summary['jobs'][0]['jobId'])
+    self.assertTrue('upload failed' in summary['jobs'][2]['error'])
+
+  def testAsyncDoesNotPoll(self):
+    self.client.PollJob = None
+    group = self.client.RunJobsConcurrently(
+        [self._Starter('a'), self._Starter('b')], sync=False)
+    self.assertFalse(group.failed)
+    self.assertEquals('RUNNING', group.Summary()['jobs'][0]['state'])
+
+  def testReplaceLoadsFirstFileAlone(self):
+    configurations = []
+
+    def StartJob(configuration, **unused_kwds):
+      configurations.append(configuration['load']['writeDisposition'])
+      return self._Job('job%d' % (len(configurations),), 'DONE')
+    self.client.StartJob = StartJob
+    group = self.client._LoadInParts(
+        {'writeDisposition': 'WRITE_TRUNCATE'}, ['a', 'b', 'c'], job_id='x')
+    self.assertEquals(3, len(group))
+    self.assertEquals('WRITE_TRUNCATE', configurations[0])
+    self.assertEquals(['WRITE_APPEND'] * 2, configurations[1:])
+
+  def testExtractTables(self):
+    configurations = []
+
+    def StartJob(configuration, job_id=None, **unused_kwds):
+      configurations.append(configuration['extract'])
+      return self._Job(job_id, 'DONE')
+    self.client.StartJob = StartJob
+    self.client._apiclient = _FakeTablesApi(
+        [['events_2', 'users', 'events_view'], ['events_1']])
+    dataset = bigquery_client.ApiClientHelper.DatasetReference.Create(
+        projectId='prj', datasetId='ds')
+    group = self.client.ExtractTables(
+        dataset, 'events_*', 'gs://bucket/{dataset}/{table}-*.csv',
+        job_id='x')
+    self.assertEquals(['prj:ds.events_1', 'prj:ds.events_2'],
+                      [outcome.name for outcome in group])
+    self.assertEquals(
+        ['gs://bucket/ds/events_1-*.csv', 'gs://bucket/ds/events_2-*.csv'],
+        sorted(configuration['destinationUri']
+               for configuration in configurations))
+    self.assertEquals(['prj:x_0', 'prj:x_1'],
+                      [entry['jobId'] for entry in group.Summary()['jobs']])
+    self.assertRaisesRegexp(
+        bigquery_client.BigqueryClientError, 'No tables',
+        self.client.ExtractTables, dataset, 'nothing*', 'gs://b/{table}')
+    self.assertRaisesRegexp(
+        bigquery_client.BigqueryClientError, 'must contain',
+        self.client.ExtractTables, dataset, '*', 'gs://b/all.csv')
+
+  def testLoadSplitsLongUriLists(self):
+    configurations = []
+
+    def StartJob(configuration, **unused_kwds):
+      configurations.append(configuration['load'])
+      return self._Job('job%d' % (len(configurations),), 'DONE')
+    self.client.StartJob = StartJob
+    table = bigquery_client.ApiClientHelper.TableReference.Create(
+        projectId='prj', datasetId='ds', tableId='tbl')
+    uris = ['gs://bucket/%d' % (i,) for i in xrange(5)]
+    group = self.client.Load(table, ','.join(uris), max_uris_per_job=2,
+                             write_disposition='WRITE_TRUNCATE', job_id='x')
+    self.assertEquals(['gs://bucket/0 and 1 more', 'gs://bucket/2 and 1 more',
+                       'gs://bucket/4'], [outcome.name for outcome in group])
+    self.assertEquals(uris, sum((configuration['sourceUris']
+                                 for configuration in configurations), []))
+    self.assertEquals(
+        ['WRITE_TRUNCATE', 'WRITE_APPEND', 'WRITE_APPEND'],
+        [configuration['writeDisposition'] for configuration in configurations])
+    job = self.client.Load(table, ','.join(uris), job_id='y')
+    self.assertEquals(uris, configurations[-1]['sourceUris'])
+    self.assertEquals('job4', job['jobReference']['jobId'])
+
+  def testRetriesFailedJobs(self):
+    group = self.client.RunJobsConcurrently(
+        [self._Starter('fail'), self._Starter('ok')], retries=2)
+    self.assertEquals(['fail', 'ok', 'fail', 'fail'], self.started)
+    self.assertEquals([3, 1], [outcome.attempts for outcome in group])
+    self.assertEquals(['fail'], [outcome.name for outcome in group.failed])
+    self.assertEquals(3, group.Summary()['jobs'][0]['attempts'])
+
+  def testRetriesBackOff(self):
+    start_times = []
+
+    def Start():
+      start_times.append(self.clock.time())
+      raise IOError('rateLimitExceeded')
+    group = self.client.RunJobsConcurrently([('job', Start)], retries=3)
+    self.assertEquals([4], [outcome.attempts for outcome in group])
+    self.assertEquals(3, len(self.clock.sleeps))
+    for attempt, (start, restart) in enumerate(
+        zip(start_times, start_times[1:]), 1):
+      delay = restart - start
+      self.assertTrue(2 ** attempt / 2.0 <= delay <= 2 ** attempt + 1,
+                      'Attempt %d was retried after %.2fs' % (attempt, delay))
+
+  def testLoadManifest(self):
+    job_ids = []
+
+    def StartJob(configuration, job_id=None, **unused_kwds):
+      job_id = job_id.Generate(configuration)
+      job_ids.append(job_id)
+      load = configuration['load']
+      table = load['destinationTable']['tableId']
+      # The first attempt at loading t1 fails.
+      if table == 't1' and len([j for j in job_ids if 't1' in j]) == 1:
+        return self._Job(job_id + '_fail', 'DONE', 'backend')
+      return self._Job(job_id, 'DONE')
+    self.client.StartJob = StartJob
+    generator = bigquery_client.JobIdGeneratorFingerprint()
+    generator.Generate = lambda configuration: (
+        configuration['load']['destinationTable']['tableId'])
+    manifest = [
+        {'destination_table': 'ds.t0', 'source': 'gs://b/0.csv',
+         'schema': 'a:integer'},
+        {'destination_table': 'ds.t1', 'source': ['gs://b/1', 'gs://b/2'],
+         'write_disposition': 'WRITE_TRUNCATE', 'name': 'second'},
+        ]
+    group = self.client.LoadManifest(
+        manifest, job_id=generator, source_format='CSV')
+    self.assertFalse(group.failed)
+    self.assertEquals(['ds.t0', 'second'], [outcome.name for outcome in group])
+    self.assertEquals([1, 2], [outcome.attempts for outcome in group])
+    self.assertEquals(3, len(set(job_ids)))
+
+    self.assertRaisesRegexp(
+        bigquery_client.BigqueryClientError, 'Unknown options.*: colour',
+        self.client.LoadManifest,
+        [{'destination_table': 'ds.t', 'source': 'gs://b/c', 'colour': 1}])
+    self.assertRaisesRegexp(
+        bigquery_client.BigqueryClientError, 'needs a destination_table',
+        self.client.LoadManifest, [{'source': 'gs://b/c'}])
+
+
+class _FakeTablesApi(object):
+  """An apiclient stand-in that lists tables a page at a time."""
+
+  def __init__(self, pages):
+    self.pages = pages
+    self._result = None
+
+  # pylint: disable=g-bad-name
+  def tables(self):
+    return self
+
+  def list(self, pageToken=None, **unused_request):
+    index = int(pageToken or 0)
+    self._result = {'tables': [
+        {'tableReference': {'tableId': table_id},
+         'type': 'VIEW' if table_id.endswith('view') else 'TABLE'}
+        for table_id in self.pages[index]]}
+    if index + 1 < len(self.pages):
+      self._result['nextPageToken'] = str(index + 1)
+    return self
+
+  def execute(self):
+    return self._result
+  # pylint: enable=g-bad-name
+
+
+class _FakeTableDataApi(object):
+  """An apiclient stand-in that serves the rows of one table."""
+
+  def __init__(self, fields, rows):
+    self.table = {'schema': {'fields': fields}, 'numRows': str(len(rows))}
+    self.rows = rows
+    self.start_indexes = []
+    self._result = None
+
+  # pylint: disable=g-bad-name
+  def tabledata(self):
+    return self
+
+  def tables(self):
+    return self
+
+  def jobs(self):
+    return self
+
+  def list(self, startIndex=None, maxResults=None, **unused_request):
+    self.start_indexes.append(startIndex)
+    # Finish the reads out of order.
+    time.sleep(0.01 * random.random())
+    self._result = {'rows': [
+        {'f': [{'v': value} for value in row]}
+        for row in self.rows[startIndex:startIndex + maxResults]]}
+    return self
+
+  def get(self, jobId=None, **unused_request):
+    if jobId:
+      self._result = {'configuration': {'query': {'destinationTable': {
+          'projectId': 'prj', 'datasetId': 'ds', 'tableId': 'anon'}}}}
+    else:
+      self._result = self.table
+    return self
+
+  def execute(self):
+    return self._result
+  # pylint: enable=g-bad-name
+
+
+class ExtractLocalTest(googletest.TestCase):
+
+  def setUp(self):
+    self.tmpdir = tempfile.mkdtemp()
+    self.client = bigquery_client.BigqueryClient(
+        api='http', api_version='', project_id='prj', max_rows_per_request=2,
+        wait_printer_factory=bigquery_client.BigqueryClient.QuietWaitPrinter)
+    self.table = bigquery_client.ApiClientHelper.TableReference.Create(
+        projectId='prj', datasetId='ds', tableId='tbl')
+
+  def tearDown(self):
+    shutil.rmtree(self.tmpdir)
+
+  def testCsv(self):
+    fields = [{'name': 'n', 'type': 'INTEGER'}, {'name': 's'},
+              {'name': 't', 'type': 'TIMESTAMP'}]
+    rows = [[str(i), u'r\xe9,%d' % (i,), None] for i in xrange(7)]
+    rows[1][2] = '1.5E9'
+    rows[2][1] = None
+    rows[3][2] = '-5364662400'
+    self.client._apiclient = _FakeTableDataApi(fields, rows)
+    filename = os.path.join(self.tmpdir, 'out.csv.gz')
+    result = self.client.ExtractLocal(self.table, filename, shard_rows=3,
+                                      max_concurrent_reads=2)
+    self.assertEquals(7, result['rows'])
+    self.assertEquals(os.path.getsize(filename), result['bytesWritten'])
+    self.assertEquals(
+        ['n,s,t', '0,"r\xc3\xa9,0",', '1,"r\xc3\xa9,1",2017-07-14 02:40:00 UTC',
+         '2,,', '3,"r\xc3\xa9,3",1800-01-01 00:00:00 UTC'] +
+        ['%d,"r\xc3\xa9,%d",' % (i, i) for i in xrange(4, 7)],
+        gzip.open(filename).read().splitlines())
+    self.assertEquals([0, 2, 3, 5, 6],
+                      sorted(self.client.apiclient.start_indexes))
+
+    fields.append({'name': 'r', 'type': 'RECORD', 'fields': []})
+    self.assertRaisesRegexp(
+        bigquery_client.BigqueryClientError, 'nested',
+        self.client.ExtractLocal, self.table, filename)
+
+  def testJson(self):
+    fields = [{'name': 'f', 'type': 'FLOAT'},
+              {'name': 'r', 'type': 'RECORD', 'mode': 'REPEATED', 'fields': [
+                  {'name': 'b', 'type': 'BOOLEAN'}, {'name': 'i'}]},
+              {'name': 't', 'type': 'TIMESTAMP'}]
+    rows = [['1.5', [{'v': {'f': [{'v': 'true'}, {'v': '7'}]}}],
+             '-62135596799.5'],
+            [None, [], None]]
+    self.client._apiclient = _FakeTableDataApi(fields, rows)
+    filename = os.path.join(self.tmpdir, 'out.json')
+    job = bigquery_client.ApiClientHelper.JobReference.Create(
+        projectId='prj', jobId='job')
+    result = self.client.ExtractLocal(
+        job, filename, destination_format='NEWLINE_DELIMITED_JSON')
+    self.assertEquals(2, result['rows'])
+    self.assertEquals(
+        ['{"f":1.5,"r":[{"b":true,"i":"7"}],'
+         '"t":"0001-01-01 00:00:00.500000 UTC"}',
+         '{"f":null,"r":[],"t":null}'],
+        open(filename).read().splitlines())
+
+  def testStdoutHasOnlyRows(self):
+    fields = [{'name': 'n', 'type': 'INTEGER'}]
+    self.client._apiclient = _FakeTableDataApi(
+        fields, [[str(i)] for i in xrange(5)])
+    self.client.wait_printer_factory = (
+        bigquery_client.BigqueryClient.VerboseWaitPrinter)
+    stdout = sys.stdout
+    sys.stdout = StringIO.StringIO()
+    try:
+      self.client.ExtractLocal(self.table, '-', shard_rows=2)
+      output = sys.stdout.getvalue()
+    finally:
+      sys.stdout = stdout
+    self.assertEquals('n\n0\n1\n2\n3\n4\n', output)
+
+  def testColumnar(self):
+    fields = [{'name': 'n', 'type': 'INTEGER'},
+              {'name': 't', 'type': 'TIMESTAMP'},
+              {'name': 'r', 'type': 'RECORD', 'mode': 'REPEATED',
+               'fields': [{'name': 'i'}]}]
+    rows = [[str(i), '1.5E9', [{'v': {'f': [{'v': str(i)}]}}]]
+            for i in xrange(7)]
+    rows[2][0] = None
+    self.client._apiclient = _FakeTableDataApi(fields, rows)
+    filename = os.path.join(self.tmpdir, 'out.col')
+    result = self.client.ExtractLocal(
+        self.table, filename, destination_format='COLUMNAR', shard_rows=3)
+    self.assertEquals(7, result['rows'])
+    self.assertEquals(os.path.getsize(filename), result['bytesWritten'])
+    reader = table_formatter.ColumnarReader(filename)
+    try:
+      self.assertEquals(['n', 't', 'r'],
+                        [field['name'] for field in reader.fields])
+      self.assertEquals([0, 1, None, 3, 4, 5, 6], reader.ReadColumn('n'))
+      self.assertEquals([1.5e9] * 7, reader.ReadColumn('t'))
+      self.assertEquals({'v': {'f': [{'v': '6'}]}},
+                        json.loads(reader.ReadColumn('r')[-1])[0])
+    finally:
+      reader.Close()
+
+    self.assertRaisesRegexp(
+        bigquery_client.BigqueryClientError, 'compressed',
+        self.client.ExtractLocal, self.table, filename + '.gz',
+        destination_format='COLUMNAR')
+
+
+class IterSchemaAndRowsTest(googletest.TestCase):
+
+  def testReadsPagesAsRowsAreIterated(self):
+    client = bigquery_client.BigqueryClient(
+        api='http', api_version='', project_id='prj', max_rows_per_request=2)
+    client._apiclient = _FakeTableDataApi(
+        [{'name': 'n', 'type': 'INTEGER'}], [[str(i)] for i in xrange(5)])
+    table = {'projectId': 'prj', 'datasetId': 'ds', 'tableId': 'tbl'}
+    fields, rows = client.IterSchemaAndRows(table, start_row=1, max_rows=3)
+    self.assertEquals([{'name': 'n', 'type': 'INTEGER'}], fields)
+    self.assertEquals([1], client.apiclient.start_indexes)
+    self.assertEquals([['1'], ['2'], ['3']], list(rows))
+    self.assertEquals([1, 3], client.apiclient.start_indexes)
+    self.assertEquals(client.ReadSchemaAndRows(table, start_row=1),
+                      (fields, [['1'], ['2'], ['3'], ['4']]))
+
+
+class RowPagerTest(googletest.TestCase):
+
+  def testReadsPagesOnDemandAndAhead(self):
+    client = bigquery_client.BigqueryClient(
+        api='http', api_version='', project_id='prj', max_rows_per_request=10)
+    client._apiclient = _FakeTableDataApi(
+        [{'name': 'n', 'type': 'INTEGER'}], [[str(i)] for i in xrange(5)])
+    pager = client.GetRowPager(
+        bigquery_client.ApiClientHelper.TableReference.Create(
+            projectId='prj', datasetId='ds', tableId='tbl'), 2)
+    self.assertEquals([['0'], ['1']], pager.GetPage(0))
+    self.assertEquals([{'name': 'n', 'type': 'INTEGER'}], pager.schema)
+    self.assertEquals(None, pager.row_count)
+    # The page from row 2 was read ahead while the first was shown, and
+    # the page from row 4 while that one was.
+    self.assertEquals([['2'], ['3']], pager.GetPage(2))
+    self.assertEquals([['4']], pager.GetPage(4))
+    self.assertEquals(5, pager.row_count)
+    self.assertTrue(pager.IsLastPage(4))
+    # The server may return fewer rows than asked for, so the end of the
+    # table is only known when a read returns none.
+    self.assertEquals([0, 2, 4, 5], client.apiclient.start_indexes)
+    # Pages already shown aren't read again, and pages past the end are
+    # empty.
+    self.assertEquals([['0'], ['1']], pager.GetPage(0))
+    self.assertEquals([], pager.GetPage(20))
+    self.assertEquals([0, 2, 4, 5, 20], client.apiclient.start_indexes)
+    self.assertEquals(5, pager.row_count)
+
+  def testPagesStartAtAnyRow(self):
+    client = bigquery_client.BigqueryClient(
+        api='http', api_version='', project_id='prj', max_rows_per_request=10)
+    client._apiclient = _FakeTableDataApi(
+        [{'name': 'n', 'type': 'INTEGER'}], [[str(i)] for i in xrange(5)])
+    pager = client.GetRowPager(
+        bigquery_client.ApiClientHelper.TableReference.Create(
+            projectId='prj', datasetId='ds', tableId='tbl'), 2)
+    self.assertEquals([['1'], ['2']], pager.GetPage(1))
+    self.assertEquals([['3'], ['4']], pager.GetPage(3))
+    self.assertFalse(pager.IsLastPage(3))
+    self.assertEquals([], pager.GetPage(5))
+    self.assertEquals([1, 3, 5], client.apiclient.start_indexes)
+
+  def testCloseDoesNotWaitForReadAhead(self):
+    release = threading.Event()
+    reads = []
+
+    class Reader(object):
+
+      def ReadSchemaAndRows(self, start_row, max_rows):
+        reads.append(start_row)
+        if start_row:
+          release.wait()
+        return [], [[str(i)] for i in xrange(start_row,
+                                             start_row + max_rows)]
+
+    pager = bigquery_client.RowPager(Reader(), 2)
+    self.assertEquals([['0'], ['1']], pager.GetPage(0))
+    pager.Close()
+    # The page being read ahead is dropped, and read again if asked for.
+    release.set()
+    self.assertEquals([['2'], ['3']], pager.GetPage(2))
+    self.assertEquals([0, 2, 2], sorted(reads)[:3])
+
+
+class _FakeMetadataApi(object):
+  """An apiclient stand-in that serves the metadata of tables in a dataset.
+
+  Each table's info is a dict with an etag that changes when it's patched.
+  The requests made are recorded as (method, tableId) pairs.
+  """
+
+  def __init__(self, table_ids):
+    self.tables_info = dict(
+        (table_id, {'kind': 'bigquery#table', 'etag': '1',
+                    'tableReference': {'projectId': 'prj', 'datasetId': 'ds',
+                                       'tableId': table_id}})
+        for table_id in table_ids)
+    self.requests = []
+    self._request = None
+    self._result = None
+
+  # pylint: disable=g-bad-name
+  def tables(self):
+    return self
+
+  def datasets(self):
+    return self
+
+  def tabledata(self):
+    return self
+
+  def get(self, tableId=None, **unused_request):
+    self._request = ('get', tableId)
+    if tableId is None:
+      self._result = {'kind': 'bigquery#dataset', 'etag': '1',
+                      'datasetReference': {'projectId': 'prj',
+                                           'datasetId': 'ds'}}
+    elif tableId not in self.tables_info:
+      self._result = bigquery_client.BigqueryNotFoundError(
+          'Not found', {}, [])
+    else:
+      self._result = self.tables_info[tableId]
+    return self
+
+  def list(self, **unused_request):
+    self._request = ('list', None)
+    self._result = {'etag': str(len(self.tables_info)), 'tables': [
+        self.tables_info[table_id] for table_id in sorted(self.tables_info)]}
+    return self
+
+  def patch(self, body=None, tableId=None, **unused_request):
+    self._request = ('patch', tableId)
+    info = self.tables_info[tableId]
+    info.update(body)
+    info['etag'] = str(int(info['etag']) + 1)
+    self._result = info
+    return self
+
+  def delete(self, tableId=None, **unused_request):
+    self._request = ('delete', tableId)
+    self._result = self.tables_info.pop(tableId)
+    return self
+
+  def insertAll(self, body=None, tableId=None, **unused_request):
+    self._request = ('insertAll', tableId)
+    info = self.tables_info[tableId]
+    info['numRows'] = str(int(info.get('numRows', 0)) + len(body['rows']))
+    self._result = {'kind': 'bigquery#tableDataInsertAllResponse'}
+    return self
+
+  def execute(self):
+    self.requests.append(self._request)
+    if isinstance(self._result, Exception):
+      raise self._result
+    return json.loads(json.dumps(self._result))
+
+  def ExecuteIfModified(self, etag):
+    self._request = (self._request[0] + ' if modified', self._request[1])
+    result = self.execute()
+    return None if result.get('etag') == etag else result
+  # pylint: enable=g-bad-name
+
+
+class MetadataCacheTest(googletest.TestCase):
+
+  def setUp(self):
+    self.now = 0
+    self.client = bigquery_client.BigqueryClient(
+        api='http', api_version='', project_id='prj')
+    self.client._apiclient = _FakeMetadataApi(['a', 'b'])
+    self.client._metadata_cache = bigquery_client._MetadataCache(
+        clock=lambda: self.now)
+    self.dataset = bigquery_client.ApiClientHelper.DatasetReference.Create(
+        projectId='prj', datasetId='ds')
+    self.table = bigquery_client.ApiClientHelper.TableReference.Create(
+        projectId='prj', datasetId='ds', tableId='a')
+
+  def testReusesAndRevalidatesMetadata(self):
+    info = self.client.GetObjectInfo(self.table)
+    self.assertEquals('1', info['etag'])
+    # Callers get copies, which they may change.
+    info['etag'] = 'changed'
+    self.assertTrue(self.client.TableExists(self.table))
+    self.assertEquals({}, self.client.GetTableSchema(dict(self.table)))
+    self.assertEquals('1', self.client.GetObjectInfo(self.table)['etag'])
+    self.assertEquals([('get', 'a')], self.client.apiclient.requests)
+    # Once the time-to-live passes, an unchanged table is revalidated.
+    self.now = 31
+    self.assertEquals('1', self.client.GetObjectInfo(self.table)['etag'])
+    self.assertEquals('1', self.client.GetObjectInfo(self.table)['etag'])
+    self.assertEquals([('get', 'a'), ('get if modified', 'a')],
+                      self.client.apiclient.requests)
+    # A table changed by someone else is read again.
+    self.client.apiclient.tables_info['a']['etag'] = '7'
+    self.now = 62
+    self.assertEquals('7', self.client.GetObjectInfo(self.table)['etag'])
+    # Tables that don't exist aren't cached.
+    missing = bigquery_client.ApiClientHelper.TableReference.Create(
+        projectId='prj', datasetId='ds', tableId='c')
+    self.assertFalse(self.client.TableExists(missing))
+    self.assertFalse(self.client.TableExists(missing))
+    self.assertEquals(2, self.client.apiclient.requests.count(('get', 'c')))
+
+  def testChangesInvalidateMetadata(self):
+    self.assertEquals(
+        ['a', 'b'], [table['tableReference']['tableId']
+                     for table in self.client.ListTables(self.dataset)])
+    self.client.GetObjectInfo(self.table)
+    self.client.UpdateTable(self.table, description='new')
+    self.assertEquals('new',
+                      self.client.GetObjectInfo(self.table)['description'])
+    self.client.DeleteTable(self.table)
+    self.assertEquals(
+        ['b'], [table['tableReference']['tableId']
+                for table in self.client.ListTables(self.dataset)])
+    self.assertFalse(self.client.TableExists(self.table))
+    self.assertEquals(
+        [('list', None), ('get', 'a'), ('patch', 'a'), ('get', 'a'),
+         ('delete', 'a'), ('list', None), ('get', 'a')],
+        self.client.apiclient.requests)
+
+  def testInsertsInvalidateMetadata(self):
+    self.assertEquals(None, self.client.GetObjectInfo(self.table).get(
+        'numRows'))
+    self.client.InsertTableRows(
+        dict(self.table), [bigquery_client.InsertEntry(None, {'n': 1})])
+    self.assertEquals('1', self.client.GetObjectInfo(self.table)['numRows'])
+    self.assertEquals([('get', 'a'), ('insertAll', 'a'), ('get', 'a')],
+                      self.client.apiclient.requests)
+
+  def testEvictsLeastRecentlyUsed(self):
+    cache = bigquery_client._MetadataCache(max_entries=2)
+    reads = []
+
+    def Get(name):
+      cache.Get('project', bigquery_client.ApiClientHelper.ProjectReference(
+          projectId=name), lambda: reads.append(name) or {'name': name})
+    for name in 'abacab':
+      Get(name)
+    self.assertEquals(['a', 'b', 'c', 'b'], reads)
+
+
+class MetadataIndexTest(googletest.TestCase):
+
+  def setUp(self):
+    self.now = 0
+    self.tmpdir = tempfile.mkdtemp()
+    self.filename = os.path.join(self.tmpdir, 'index')
+    self.index = bigquery_client.MetadataIndex(self.filename,
+                                               clock=lambda: self.now)
+
+  def tearDown(self):
+    shutil.rmtree(self.tmpdir)
+
+  def testFreshnessAndInvalidation(self):
+    table = {'tableReference': {'projectId': 'prj', 'datasetId': 'ds',
+                                'tableId': 't1'}}
+    self.index.Update(
+        infos=[(('prj', 'ds'), {'id': 'ds'}), (('prj', 'ds', 't1'), table)],
+        listings=[(('prj',), []), (('prj', 'ds'), [
+            {'tableReference': {'projectId': 'prj', 'datasetId': 'ds',
+                                'tableId': 't2'}}])])
+    self.now = 10
+    self.assertEquals(table, self.index.GetInfo(('prj', 'ds', 't1'), 10))
+    self.assertEquals(None, self.index.GetInfo(('prj', 'ds', 't1'), 9))
+    self.assertEquals(None, self.index.GetInfo(('prj', 'ds', 't3')))
+    self.assertEquals([], self.index.GetListing(('prj',)))
+    self.assertEquals(['t1', 't2'], self.index.GetChildIds(('prj', 'ds')))
+    self.assertEquals(['ds'], self.index.GetChildIds(('prj',)))
+    self.assertEquals([], self.index.GetChildIds(()))
+    # The index is shared with later readers of the same file.
+    index = bigquery_client.MetadataIndex(self.filename)
+    self.assertEquals(table, index.GetInfo(('prj', 'ds', 't1')))
+    self.assertEquals(0600, os.stat(self.filename).st_mode & 0777)
+    # Invalidating a table drops it and the listing of its dataset, and
+    # invalidating a dataset drops what's in it too.
+    self.index.Invalidate(('prj', 'ds', 't1'))
+    self.assertEquals(None, self.index.GetInfo(('prj', 'ds', 't1')))
+    self.assertEquals(None, self.index.GetListing(('prj', 'ds')))
+    self.assertEquals({'id': 'ds'}, self.index.GetInfo(('prj', 'ds')))
+    self.index.Update(infos=[(('prj', 'ds', 't1'), table)])
+    self.index.Invalidate(('prj', 'ds'))
+    self.assertEquals([], self.index.GetChildIds(('prj', 'ds')))
+    self.assertEquals(None, self.index.GetListing(('prj',)))
+
+  def testClientUsesFreshMetadata(self):
+    client = bigquery_client.BigqueryClient(
+        api='http', api_version='', project_id='prj',
+        metadata_index_file=self.filename)
+    client._apiclient = _FakeMetadataApi(['a', 'b'])
+    dataset = bigquery_client.ApiClientHelper.DatasetReference.Create(
+        projectId='prj', datasetId='ds')
+    self.assertEquals({'datasets': 1, 'projects': 0, 'tables': 2},
+                      client.RefreshMetadataIndex(dataset))
+    self.assertEquals(
+        [('get', None), ('list', None), ('get', 'a'), ('get', 'b')],
+        client.apiclient.requests)
+    # Another client, as in a later bq command, skips the requests while
+    # the metadata is fresh enough.
+    client = bigquery_client.BigqueryClient(
+        api='http', api_version='', project_id='prj',
+        metadata_index_file=self.filename, metadata_index_max_age=3600)
+    client._apiclient = _FakeMetadataApi(['a', 'b'])
+    table = bigquery_client.ApiClientHelper.TableReference.Create(
+        projectId='prj', datasetId='ds', tableId='a')
+    self.assertTrue(client.TableExists(table))
+    self.assertTrue(client.DatasetExists(dataset))
+    self.assertEquals(2, len(client.ListTables(dataset, max_results=2)))
+    self.assertEquals(['a', 'b'], [info['tableReference']['tableId']
+                                   for info in client.ListTables(dataset)])
+    self.assertEquals([], client.apiclient.requests)
+    # A shorter listing is read from the server, which says if there is
+    # more.
+    client.ListTables(dataset, max_results=1)
+    self.assertEquals([('list', None)], client.apiclient.requests)
+    # Changes made by the client are reflected in the index.
+    client.DeleteTable(table)
+    self.assertFalse(client.TableExists(table))
+    self.assertEquals(['b'], client.GetMetadataIndex().GetChildIds(
+        ('prj', 'ds')))
+
+
+class StreamingUploadTest(googletest.TestCase):
+
+  def _Upload(self, media, acknowledge=lambda begin, end: end):
+    """Reads media the way HttpRequest.next_chunk does, until the end."""
+    chunks = []
+    progress = 0
+    while True:
+      size = media.size()
+      data = media.getbytes(progress, media.chunksize())
+      end = acknowledge(progress, progress + len(data))
+      chunks.append(data[:end - progress])
+      progress = end
+      if size is not None and progress == size:
+        return ''.join(chunks)
+      # A short chunk ends the upload, so the size must be known by then.
+      self.assertEquals(media.chunksize(), len(data))
+
+  def testRoundTrip(self):
+    rand = random.Random(0)
+    contents = ''.join('%d,%s\n' % (i, rand.choice(['a', 'bb', 'ccc']))
+                       for i in xrange(20000))
+    with tempfile.NamedTemporaryFile() as f:
+      f.write(contents)
+      f.flush()
+      self.assertFalse(bigquery_client._IsGzipFile(f))
+      for chunksize in (1024, 4096, 100000):
+        media = bigquery_client._StreamingUpload(
+            bigquery_client._FileSlice(f.name), 6, chunksize=chunksize)
+        media._READ_SIZE = 1000
+        compressed = self._Upload(media)
+        self.assertEquals(contents, zlib.decompress(compressed, 31))
+        self.assertEquals(len(contents), media.stats.bytes_read)
+        self.assertEquals(len(compressed), media.stats.bytes_sent)
+        self.assertTrue(media.stats.compression_ratio > 2)
+
+      # The server may accept only part of a chunk.
+      media = bigquery_client._StreamingUpload(
+          bigquery_client._FileSlice(f.name), 1, chunksize=1024)
+      compressed = self._Upload(
+          media, acknowledge=lambda begin, end: min(end, begin + 1000))
+      self.assertEquals(contents, zlib.decompress(compressed, 31))
+      self.assertRaises(bigquery_client.BigqueryClientError,
+                        media.getbytes, 0, 1024)
+
+
+class SplitFileTest(googletest.TestCase):
+
+  def _Split(self, contents, split_size, **kwds):
+    with tempfile.NamedTemporaryFile() as f:
+      f.write(contents)
+      f.flush()
+      shards = bigquery_client._SplitFile(f.name, split_size, **kwds)
+      return [shard.read() for shard in shards]
+
+  def testSplitsOnLines(self):
+    contents = ''.join('%d,x\n' % (i,) for i in xrange(1000))
+    shards = self._Split(contents, 100)
+    self.assertEquals(contents, ''.join(shards))
+    for shard in shards:
+      self.assertTrue(shard.endswith('\n'))
+    for shard in shards[:-1]:
+      self.assertTrue(100 <= len(shard) < 110)
+    self.assertEquals(['a\nb\n', 'c'], self._Split('a\nb\nc', 3))
+    self.assertEquals([], self._Split('', 3))
+
+  def testSkipsLeadingRows(self):
+    shards = self._Split('h1\nh2\n1\n2\n3\n', 2, skip_leading_rows=2)
+    self.assertEquals(['1\n', '2\n', '3\n'], shards)
+    self.assertEquals([], self._Split('h1\n', 2, skip_leading_rows=2))
+
+  def testKeepsQuotedNewlines(self):
+    record = '1,"multi\nline ""quoted""\n value",x\n'
+    contents = 'header\n' + record * 50
+    shards = self._Split(contents, 10, skip_leading_rows=1, quote='"')
+    self.assertEquals([record] * 50, shards)
+    # Without quote handling, every newline ends a record.
+    self.assertEquals(150, len(self._Split(record * 50, 1)))
+
+
+class ValidateLoadTest(googletest.TestCase):
+
+  def setUp(self):
+    self.client = bigquery_client.BigqueryClient(api='http', api_version='')
+    self.directory = tempfile.mkdtemp()
+    self.table = bigquery_client.ApiClientHelper.TableReference.Create(
+        projectId='prj', datasetId='ds', tableId='tbl')
+    self._chunk_size = bigquery_client._VALIDATE_CHUNK_SIZE
+    bigquery_client._VALIDATE_CHUNK_SIZE = 64
+
+  def tearDown(self):
+    bigquery_client._VALIDATE_CHUNK_SIZE = self._chunk_size
+    shutil.rmtree(self.directory)
+
+  def _Write(self, contents, name='data', opener=open):
+    filename = os.path.join(self.directory, name)
+    f = opener(filename, 'wb')
+    f.write(contents)
+    f.close()
+    return filename
+
+  def testTypes(self):
+    self.assertTrue(bigquery_client._IsInteger('-12'))
+    self.assertFalse(bigquery_client._IsInteger('1.5'))
+    self.assertFalse(bigquery_client._IsInteger(str(2 ** 63)))
+    self.assertFalse(bigquery_client._IsInteger(True))
+    self.assertTrue(bigquery_client._IsFloat('1e5'))
+    self.assertTrue(bigquery_client._IsBoolean('FALSE'))
+    self.assertFalse(bigquery_client._IsBoolean('maybe'))
+    self.assertTrue(bigquery_client._IsTimestamp('2013-01-02 03:04:05.6 UTC'))
+    self.assertTrue(bigquery_client._IsTimestamp('1357095845'))
+    self.assertFalse(bigquery_client._IsTimestamp('yesterday'))
+
+  def testCsv(self):
+    rows = ['%d,"name %d",%s' % (i, i, 't' if i % 2 else 'f')
+            for i in xrange(100)]
+    rows[10] = '10,"name, with comma",t,extra'
+    rows[50] = 'fifty,"name",f'
+    rows[70] = '70,"multi\nline",t'
+    filename = self._Write('id,name,flag\n' + '\n'.join(rows) + '\n')
+    schema = 'id:integer,name,flag:boolean'
+    self.assertRaisesRegexp(
+        bigquery_client.BigqueryClientError, r'more than 2 bad records',
+        self.client.ValidateLoad, self.table, filename, schema=schema,
+        skip_leading_rows=1, max_bad_records=2, processes=1)
+    for processes in (1, 3):
+      rows, bad_records = self.client.ValidateLoad(
+          self.table, filename, schema=schema, skip_leading_rows=1,
+          max_bad_records=3, processes=processes)
+      self.assertEquals(100, rows)
+      self.assertEquals(3, len(bad_records))
+      self.assertTrue('Too many fields' in bad_records[0].message)
+      self.assertTrue("'fifty' as INTEGER" in bad_records[1].message)
+      self.assertTrue('allow_quoted_newlines' in bad_records[2].message)
+      self.assertEquals(filename, bad_records[0].source)
+
+    _, bad_records = self.client.ValidateLoad(
+        self.table, filename, schema=schema, skip_leading_rows=1,
+        max_bad_records=2, allow_quoted_newlines=True, processes=3)
+    self.assertEquals(2, len(bad_records))
+
+  def testJson(self):
+    schema = os.path.join(self.directory, 'schema.json')
+    with open(schema, 'w') as f:
+      json.dump([{'name': 'id', 'type': 'INTEGER', 'mode': 'REQUIRED'},
+                 {'name': 'tags', 'type': 'STRING', 'mode': 'REPEATED'},
+                 {'name': 'owner', 'type': 'RECORD',
+                  'fields': [{'name': 'since', 'type': 'TIMESTAMP'}]}], f)
+    records = [
+        '{"id": 1, "tags": ["a"], "owner": {"since": "2013-01-01"}}',
+        '{"id": "2", "tags": []}',
+        '{"tags": ["b"]}',
+        '{"id": 4, "owner": {"since": "soon"}}',
+        '{"id": 5, "colour": "red"}',
+        '{"id": 6, "tags": "c"}',
+        '',
+        '[7]',
+        ]
+    filename = self._Write('\n'.join(records) + '\n', opener=gzip.open)
+    _, bad_records = self.client.ValidateLoad(
+        self.table, filename, schema=schema, max_bad_records=10,
+        source_format='NEWLINE_DELIMITED_JSON')
+    self.assertEquals(
+        ['Missing required field id',
+         'Could not parse "soon" as TIMESTAMP for field owner.since',
+         'No such field: colour',
+         'Expected an array for repeated field tags',
+         'Not a JSON object'],
+        [record.message for record in bad_records])
+
+
+class InferSchemaTest(googletest.TestCase):
+
+  def setUp(self):
+    self.directory = tempfile.mkdtemp()
+    self._scan_size = bigquery_client._SAMPLE_SCAN_SIZE
+
+  def tearDown(self):
+    bigquery_client._SAMPLE_SCAN_SIZE = self._scan_size
+    shutil.rmtree(self.directory)
+
+  def _Write(self, contents, name='data'):
+    filename = os.path.join(self.directory, name)
+    with open(filename, 'wb') as f:
+      f.write(contents)
+    return filename
+
+  def testCsv(self):
+    rows = ['%d,%s,"note %d\nmore",%s,2013-01-%02d,' % (
+        i, i * 1.5, i, 'true' if i % 2 else 'FALSE', i % 28 + 1)
+            for i in xrange(200)]
+    filename = self._Write(
+        'id,Score (avg),note,flag,day,id\n' + '\n'.join(rows) + '\n')
+    expected = [
+        {'name': 'id', 'type': 'INTEGER'},
+        {'name': 'Score__avg_', 'type': 'FLOAT'},
+        {'name': 'note', 'type': 'STRING'},
+        {'name': 'flag', 'type': 'BOOLEAN'},
+        {'name': 'day', 'type': 'TIMESTAMP'},
+        {'name': 'id_2', 'type': 'STRING'},
+        ]
+    # Both a single pass and sampling at offsets should see whole records.
+    for scan_size in (self._scan_size, 0):
+      bigquery_client._SAMPLE_SCAN_SIZE = scan_size
+      self.assertEquals(expected, bigquery_client.BigqueryClient.InferSchema(
+          filename, sample_rows=20, skip_leading_rows=1,
+          allow_quoted_newlines=True, rand=random.Random(1)))
+    self.assertEquals(
+        ['field_1', 'field_2'],
+        [field['name'] for field in bigquery_client.BigqueryClient.InferSchema(
+            self._Write('1,a\n2,b\n', name='headless'))])
+
+  def testInferredTypesAreStrict(self):
+    for value in ('12', '-12', '+0'):
+      self.assertTrue(bigquery_client._IsInferredInteger(value), value)
+    for value in (' 12', '12 ', '\t12', '1.0', str(2 ** 63), '', '-'):
+      self.assertFalse(bigquery_client._IsInferredInteger(value), value)
+    for value in ('1.5', '-.5', '5.', '1e5', '+1.5E-3', '12'):
+      self.assertTrue(bigquery_client._IsInferredFloat(value), value)
+    for value in ('nan', 'NaN', 'inf', '-Infinity', ' 1.5', '1.5 ', '1e999',
+                  '.', '1e', '0x10', '1_000'):
+      self.assertFalse(bigquery_client._IsInferredFloat(value), value)
+    self.assertTrue(bigquery_client._IsInferredTimestamp('2013-01-02 03:04'))
+    self.assertFalse(bigquery_client._IsInferredTimestamp(' 2013-01-02'))
+
+    filename = self._Write('a,b,c,d\n1, 2,nan,true\n3,4 ,1.5, false\n')
+    self.assertEquals(
+        [{'name': 'a', 'type': 'INTEGER'}, {'name': 'b', 'type': 'STRING'},
+         {'name': 'c', 'type': 'STRING'}, {'name': 'd', 'type': 'STRING'}],
+        bigquery_client.BigqueryClient.InferSchema(
+            filename, skip_leading_rows=1))
+
+  def testSampleRecords(self):
+    filename = self._Write(
+        'header\n' + ''.join('%d\n' % (i,) for i in xrange(1000)))
+    leading, sample = bigquery_client._SampleRecords(
+        filename, 10, skip_leading_rows=1, rand=random.Random(2))
+    self.assertEquals(['header\n'], leading)
+    self.assertEquals(10, len(sample))
+    self.assertEquals(sorted(sample, key=int), sample)
+    self.assertNotEquals(['%d\n' % (i,) for i in xrange(10)], sample)
+
+  def testJson(self):
+    records = [
+        '{"id": 1, "tags": ["a"], "owner": {"name": "x", '
+        '"since": "2013-01-01"}}',
+        '{"id": 2.5, "tags": [], "owner": {"since": "2013-01-02 00:00:00"}}',
+        '{"ID": 3, "visits": [{"at": 1, "ok": true}], "tags": null}',
+        '{"id": 4, "extra": null}',
+        ]
+    filename = self._Write('\n'.join(records) + '\n')
+    self.assertEquals(
+        [{'name': 'id', 'type': 'FLOAT'},
+         {'name': 'tags', 'type': 'STRING', 'mode': 'REPEATED'},
+         {'name': 'owner', 'type': 'RECORD', 'fields': [
+             {'name': 'name', 'type': 'STRING'},
+             {'name': 'since', 'type': 'TIMESTAMP'}]},
+         {'name': 'visits', 'type': 'RECORD', 'mode': 'REPEATED', 'fields': [
+             {'name': 'at', 'type': 'INTEGER'},
+             {'name': 'ok', 'type': 'BOOLEAN'}]},
+         {'name': 'extra', 'type': 'STRING'}],
+        bigquery_client.BigqueryClient.InferSchema(
+            filename, source_format='NEWLINE_DELIMITED_JSON'))
+    self.assertRaisesRegexp(
+        bigquery_client.BigqueryClientError, 'both objects and other values',
+        bigquery_client.BigqueryClient.InferSchema,
+        self._Write('{"a": {"b": 1}}\n{"a": 2}\n', name='mixed'),
+        source_format='NEWLINE_DELIMITED_JSON')
+
+
+class _FakeUploadServer(object):
+  """An httplib2.Http stand-in implementing resumable media uploads."""
+
+  def __init__(self, faults=None):
+    # Maps the (1-based) number of a media request to an exception to
+    # raise instead of handling it.
+    self.faults = faults or {}
+    self.sessions = 0
+    self.media_requests = 0
+    self.data = ''
+
+  def request(self, uri, method='GET', body=None, headers=None, **unused):
+    if uri == 'start':
+      self.sessions += 1
+      return httplib2.Response({'status': 200, 'location': 'session'}), ''
+    self.media_requests += 1
+    if self.media_requests in self.faults:
+      raise self.faults[self.media_requests]
+    content_range = headers['Content-Range']
+    if not content_range.startswith('bytes */'):
+      if hasattr(body, 'read'):
+        body = body.read()
+      begin = int(content_range.split(' ')[1].split('-')[0])
+      self.data = self.data[:begin] + body
+      total = content_range.split('/')[1]
+      if total != '*' and len(self.data) == int(total):
+        return httplib2.Response({'status': 200}), '{"status": "done"}'
+    return httplib2.Response({
+        'status': 308, 'range': 'bytes=0-%d' % (len(self.data) - 1,)}), ''
+
+
+class WaitPrinterTest(googletest.TestCase):
+
+  def _Output(self, printer_class, stats):
+    """Returns what a printer prints on stdout and stderr for an upload."""
+    stdout, stderr = sys.stdout, sys.stderr
+    sys.stdout, sys.stderr = StringIO.StringIO(), StringIO.StringIO()
+    try:
+      printer = printer_class()
+      printer.PrintUpload(stats)
+      stats.Finish()
+      printer.PrintUpload(stats)
+      printer.Done()
+      return sys.stdout.getvalue(), sys.stderr.getvalue()
+    finally:
+      sys.stdout, sys.stderr = stdout, stderr
+
+  def testOnlyVerbosePrinterPrintsUploadsOnStderr(self):
+    stdout, stderr = self._Output(
+        bigquery_client.BigqueryClient.VerboseWaitPrinter,
+        bigquery_client.UploadStats('data.csv'))
+    self.assertEquals('', stdout)
+    self.assertEquals(2, stderr.count('\rUploading data.csv ...'))
+    self.assertTrue(stderr.endswith('\n'))
+    for printer_class in (bigquery_client.BigqueryClient.TransitionWaitPrinter,
+                          bigquery_client.BigqueryClient.QuietWaitPrinter):
+      self.assertEquals(('', ''), self._Output(
+          printer_class, bigquery_client.UploadStats('data.csv')))
+
+
+class ExecuteUploadTest(googletest.TestCase):
+
+  def setUp(self):
+    self.directory = tempfile.mkdtemp()
+    self.client = bigquery_client.BigqueryClient(
+        api='http', api_version='', upload_chunk_size=256 * 1024,
+        upload_session_dir=os.path.join(self.directory, 'sessions'),
+        wait_printer_factory=bigquery_client.BigqueryClient.QuietWaitPrinter)
+    self.filename = os.path.join(self.directory, 'data')
+    with open(self.filename, 'wb') as f:
+      f.write(os.urandom(1000000))
+    self._sleep = time.sleep
+    time.sleep = lambda unused_secs: None
+
+  def tearDown(self):
+    time.sleep = self._sleep
+    shutil.rmtree(self.directory)
+
+  def _Upload(self, server):
+    media = http_request.MediaFileUpload(
+        self.filename, chunksize=256 * 1024, resumable=True)
+    request = bigquery_client.BigqueryHttp(
+        bigquery_client.BigqueryModel(), server,
+        lambda unused_resp, content: json.loads(content), 'start',
+        method='POST', body='{}', headers={}, resumable=media)
+    stats = bigquery_client.UploadStats(self.filename)
+    return self.client._ExecuteUpload(request, stats, 'key'), stats
+
+  def testRetriesFailedChunks(self):
+    server = _FakeUploadServer({2: socket.error('reset')})
+    response, stats = self._Upload(server)
+    self.assertEquals({'status': 'done'}, response)
+    self.assertEquals(open(self.filename, 'rb').read(), server.data)
+    self.assertEquals(1000000, stats.bytes_sent)
+
+  def testResumesInterruptedUpload(self):
+    server = _FakeUploadServer({3: KeyboardInterrupt()})
+    self.assertRaises(KeyboardInterrupt, self._Upload, server)
+    session_files = os.listdir(os.path.join(self.directory, 'sessions'))
+    self.assertEquals(1, len(session_files))
+
+    response, stats = self._Upload(server)
+    self.assertEquals({'status': 'done'}, response)
+    self.assertEquals(1, server.sessions)
+    self.assertEquals(512 * 1024, stats.resumed_bytes)
+    self.assertEquals(open(self.filename, 'rb').read(), server.data)
+    self.assertEquals([], os.listdir(os.path.join(self.directory, 'sessions')))
+
+  def testApiclientKeepsResumableUploadState(self):
+    # If this fails after upgrading apiclient, check that _ResumableUpload
+    # still works with it, and add its version to
+    # _RESUMABLE_UPLOAD_APICLIENT_VERSIONS.
+    media = http_request.MediaFileUpload(
+        self.filename, chunksize=256 * 1024, resumable=True)
+    request = bigquery_client.BigqueryHttp(
+        bigquery_client.BigqueryModel(), _FakeUploadServer(),
+        lambda unused_resp, content: json.loads(content), 'start',
+        method='POST', body='{}', headers={}, resumable=media)
+    upload = bigquery_client._ResumableUpload(request)
+    self.assertTrue(upload.supported,
+                    'Resumable uploads are not supported with apiclient %s' % (
+                        bigquery_client.apiclient.__version__,))
+    self.assertEquals((None, 0), (upload.uri, upload.progress))
+    upload.Resume('session', 1024)
+    self.assertEquals(('session', 1024), (upload.uri, upload.progress))
+    self.assertTrue(request._in_error_state)
+    upload.Restart()
+    self.assertEquals((None, 0), (upload.uri, upload.progress))
+    self.assertFalse(request._in_error_state)
+
+    self.assertFalse(
+        bigquery_client._ResumableUpload(request, version='0.0').supported)
+
+  def testUnsupportedApiclientDoesNotSaveSessions(self):
+    versions = bigquery_client._RESUMABLE_UPLOAD_APICLIENT_VERSIONS
+    bigquery_client._RESUMABLE_UPLOAD_APICLIENT_VERSIONS = ()
+    try:
+      server = _FakeUploadServer({2: socket.error('reset')})
+      response, _ = self._Upload(server)
+    finally:
+      bigquery_client._RESUMABLE_UPLOAD_APICLIENT_VERSIONS = versions
+    self.assertEquals({'status': 'done'}, response)
+    self.assertEquals(open(self.filename, 'rb').read(), server.data)
+    self.assertFalse(os.path.exists(os.path.join(self.directory, 'sessions')))
+
+  def _UploadThroughPipe(self, source, compression_level):
+    """Streams the contents of source from a pipe, returning what arrived."""
+    read_fd, write_fd = os.pipe()
+
+    def Write():
+      with os.fdopen(write_fd, 'wb') as f:
+        f.write(open(source, 'rb').read())
+
+    writer = threading.Thread(target=Write)
+    writer.start()
+    stream = os.fdopen(read_fd, 'rb')
+    server = _FakeUploadServer({2: socket.error('reset')})
+    media = bigquery_client._StreamingUpload(
+        stream, compression_level, chunksize=256 * 1024)
+    request = bigquery_client.BigqueryHttp(
+        bigquery_client.BigqueryModel(), server,
+        lambda unused_resp, content: json.loads(content), 'start',
+        method='POST', body='{}', headers={}, resumable=media)
+    try:
+      response = self.client._ExecuteUpload(request, media.stats, None)
+    finally:
+      writer.join()
+      stream.close()
+    self.assertEquals({'status': 'done'}, response)
+    # A stream can't be resumed by a later run, so no session is saved.
+    self.assertFalse(os.path.exists(os.path.join(self.directory, 'sessions')))
+    return server.data
+
+  def testStreamsPipes(self):
+    contents = open(self.filename, 'rb').read()
+    self.assertEquals(contents, self._UploadThroughPipe(self.filename, None))
+    self.assertEquals(contents, zlib.decompress(
+        self._UploadThroughPipe(self.filename, 6), 31))
+    # Data that is already gzipped is not compressed again.
+    gzipped = os.path.join(self.directory, 'data.gz')
+    with gzip.open(gzipped, 'wb') as f:
+      f.write(contents)
+    self.assertEquals(open(gzipped, 'rb').read(),
+                      self._UploadThroughPipe(gzipped, 6))
+
+
+class InsertSpoolTest(googletest.TestCase):
+
+  def setUp(self):
+    self.directory = tempfile.mkdtemp()
+
+  def tearDown(self):
+    shutil.rmtree(self.directory)
+
+  def testReplayUnacknowledged(self):
+    spool = bigquery_client.InsertSpool(self.directory)
+    first = spool.Append('{"a":1}')
+    spool.Append('{"a":2}')
+    spool.Sync({'offset': 16})
+    spool.Acknowledge(first)
+    spool.Close()
+
+    spool = bigquery_client.InsertSpool(self.directory)
+    self.assertEquals({'offset': 16}, spool.checkpoint)
+    self.assertEquals(['{"a":2}'],
+                      [record for _, record in spool.ReadPending()])
+
+  def testUnsyncedRecordsAreDiscarded(self):
+    spool = bigquery_client.InsertSpool(self.directory)
+    spool.Append('synced')
+    spool.Sync()
+    spool.Append('lost')
+    spool.Close()
+
+    spool = bigquery_client.InsertSpool(self.directory)
+    self.assertEquals(['synced'],
+                      [record for _, record in spool.ReadPending()])
+    offset = spool.Append('new')
+    spool.Sync()
+    self.assertEquals([(offset, 'new')], list(spool.ReadPending())[1:])
+
+  def testAcknowledgedSegmentsAreRemoved(self):
+    spool = bigquery_client.InsertSpool(self.directory, segment_size=5)
+    offsets = [spool.Append('record %d' % (i,)) for i in xrange(5)]
+    spool.Sync()
+    self.assertEquals(5, len(os.listdir(self.directory)) - 1)
+    spool.Acknowledge(offsets[2])
+    self.assertEquals(2, len(os.listdir(self.directory)) - 1)
+    self.assertEquals(['record 3', 'record 4'],
+                      [record for _, record in spool.ReadPending()])
+    self.assertRaises(bigquery_client.BigqueryClientError,
+                      spool.Acknowledge, offsets[-1] + 1)
+
+  def testQuarantine(self):
+    spool = bigquery_client.InsertSpool(self.directory)
+    spool.Append('good')
+    offset = spool.Append('bad')
+    spool.Sync()
+    path = spool.Quarantine(offset, ['bad'])
+    self.assertEquals(self.directory, os.path.dirname(path))
+    self.assertEquals('bad\n', open(path).read())
+    self.assertEquals([], list(spool.ReadPending()))
+
 
 if __name__ == '__main__':
   googletest.main()
@@ -9,12 +9,16 @@
 import cmd
 import codecs
 import datetime
+import glob
 import httplib
+import io
+import itertools
 import json
 import os
 import pdb
 import pipes
 import platform
+import random
 import shlex
 import sys
 import time
@@ -109,16 +113,25 @@ flags.DEFINE_boolean(
     'of informational printing.')
 flags.DEFINE_enum(
     'format', None,
-    ['none', 'json', 'prettyjson', 'csv', 'sparse', 'pretty'],
+    ['none', 'json', 'prettyjson', 'ndjson', 'csv', 'columnar', 'sparse',
+     'pretty'],
     'Format for command output. Options include:'
     '\n pretty: formatted table output'
     '\n sparse: simpler table output'
     '\n prettyjson: easy-to-read JSON format'
     '\n json: maximally compact JSON'
+    '\n ndjson: a compact JSON object per row, as read by bq insert'
     '\n csv: csv format with header'
+    '\n columnar: a binary file of typed columns, for query and head '
+    'results redirected to a file'
     '\nThe first three are intended to be human-readable, and the latter '
-    'three are for passing to another program. If no format is selected, '
+    'five are for passing to another program. If no format is selected, '
     'one will be chosen based on the command run.')
+flags.DEFINE_integer(
+    'max_column_width', None,
+    'For pretty and sparse output, abbreviate longer entries to this many '
+    'characters.',
+    lower_bound=1)
 flags.DEFINE_multistring(
     'job_property', None,
     'Additional key-value pairs to include in the properties field of '
@@ -149,6 +162,34 @@ flags.DEFINE_string(
 flags.DEFINE_integer(
     'max_rows_per_request', None,
     'Specifies the max number of rows to return per read.')
+flags.DEFINE_integer(
+    'max_concurrent_jobs', 4,
+    'The maximum number of jobs to run at once for commands that start '
+    'several jobs, such as loading more than one local file.',
+    lower_bound=1)
+flags.DEFINE_integer(
+    'upload_chunk_size', 8 * 1024 * 1024,
+    'The number of bytes to send in each request when uploading a local '
+    'file. Must be a multiple of 262144 (256 KiB).',
+    lower_bound=256 * 1024)
+flags.DEFINE_string(
+    'upload_session_dir', None,
+    'If set, a directory in which to save the progress of uploads of local '
+    'files, for example ~/.bigquery.v2.uploads, so that rerunning an '
+    'interrupted load of an unchanged file resumes the upload where it '
+    'stopped. The progress of an upload is deleted once it completes.')
+flags.DEFINE_string(
+    'metadata_index_file', None,
+    'If set, a file in which to save the metadata of the projects, '
+    'datasets and tables that commands read, for example '
+    '~/.bigquery.v2.index, for later commands and for completion of names '
+    'in the shell. See "bq help index".')
+flags.DEFINE_integer(
+    'metadata_index_max_age', 0,
+    'The age in seconds of the oldest metadata in --metadata_index_file '
+    'that commands such as ls and show use instead of asking the server. '
+    'If 0, the server is always asked.',
+    lower_bound=0)
 
 
 FLAGS = flags.FLAGS
@@ -206,6 +247,13 @@ _DELIMITER_MAP = {
     'tab': '\t',
     '\\t': '\t',
     }
+# The number of rows normalized together for printing, and the number of
+# minutes whose text is cached for formatting TIMESTAMPs.
+_EXPAND_PAGE_ROWS = 1000
+_EXPAND_CACHED_MINUTES = 100000
+# The lines of each screen of --pager output that aren't rows: the borders
+# and header of a pretty table, and the prompt.
+_PAGER_OVERHEAD_LINES = 5
 
 # These aren't relevant for user-facing docstrings:
 # pylint: disable=g-doc-return-or-yield
@@ -393,48 +441,101 @@ def _GetCredentialsFromFlags():
 
 
 def _GetFormatterFromFlags(secondary_format='sparse'):
-  if FLAGS['format'].present:
-    return table_formatter.GetFormatter(FLAGS.format)
-  else:
-    return table_formatter.GetFormatter(secondary_format)
+  table_format = FLAGS.format if FLAGS['format'].present else secondary_format
+  return table_formatter.GetFormatter(
+      table_format, max_column_width=FLAGS.max_column_width)
 
 
 def _ExpandForPrinting(fields, rows, formatter):
-  """Expand entries that require special bq-specific formatting."""
+  """Expand entries that require special bq-specific formatting.
 
-  def NormalizeTimestamp(entry):
-    try:
-      date = datetime.datetime.utcfromtimestamp(float(entry))
-      return date.strftime('%Y-%m-%d %H:%M:%S')
-    except ValueError:
-      return '<date out of range for display>'
-
-  column_normalizers = {}
-  for i, field in enumerate(fields):
-    if field['type'].upper() == 'TIMESTAMP':
-      column_normalizers[i] = NormalizeTimestamp
+  Rows are normalized a page at a time and a column at a time, so that
+  the work for each column is chosen once per page instead of per entry.
 
-  def NormalizeNone():
-    if isinstance(formatter, table_formatter.JsonFormatter):
-      return None
-    elif isinstance(formatter, table_formatter.CsvFormatter):
-      return ''
-    else:
-      return 'NULL'
+  Args:
+    fields: The schema fields of the rows.
+    rows: An iterable of rows.
+    formatter: The TableFormatter the rows are for.
 
-  def NormalizeEntry(i, entry):
-    if entry is None:
-      return NormalizeNone()
-    elif i in column_normalizers:
-      return column_normalizers[i](entry)
-    return entry
+  Returns:
+    An iterable of the normalized rows.
+  """
+  if isinstance(formatter, table_formatter.ColumnarFormatter):
+    # The columns are typed by the schema, so the values are stored
+    # as they were read.
+    return rows
+  if isinstance(formatter, table_formatter.JsonFormatter):
+    null = None
+  elif isinstance(formatter, table_formatter.CsvFormatter):
+    null = ''
+  else:
+    null = 'NULL'
+
+  # TIMESTAMPs are formatted from a cache of the text of each minute,
+  # without building a datetime for each one.
+  minutes = {}
+
+  def FormatMinute(minute):
+    # Unlike strftime, isoformat handles years before 1900.
+    text = datetime.datetime.utcfromtimestamp(minute * 60).isoformat(' ')[:17]
+    if len(minutes) >= _EXPAND_CACHED_MINUTES:
+      minutes.clear()
+    minutes[minute] = text
+    return text
+
+  def NormalizeTimestamps(column):
+    normalized = []
+    append = normalized.append
+    for entry in column:
+      if entry is None:
+        append(null)
+        continue
+      try:
+        seconds = float(entry)
+        # Round to microseconds as utcfromtimestamp does: the fraction
+        # left after truncating toward zero is rounded half away from
+        # zero, so that -0.0000005 is a microsecond before the epoch.
+        whole_seconds = int(seconds)
+        microseconds = round((seconds - whole_seconds) * 1e6)
+        if microseconds < 0:
+          whole_seconds -= 1
+          microseconds += 1e6
+        if microseconds >= 1e6:
+          whole_seconds += 1
+        minute, second = divmod(whole_seconds, 60)
+        text = minutes.get(minute) or FormatMinute(minute)
+        append('%s%02d' % (text, second))
+      except (ValueError, OverflowError):
+        append('<date out of range for display>')
+    return normalized
+
+  def NormalizeNones(column):
+    return [null if entry is None else entry for entry in column]
+
+  column_normalizers = [
+      NormalizeTimestamps if field['type'].upper() == 'TIMESTAMP'
+      else NormalizeNones for field in fields]
+  if not fields or (null is None and
+                    NormalizeTimestamps not in column_normalizers):
+    return rows
+
+  def ExpandPages():
+    rows_iter = iter(rows)
+    while True:
+      page = list(itertools.islice(rows_iter, _EXPAND_PAGE_ROWS))
+      if not page:
+        return
+      columns = [normalize(column) for normalize, column
+                 in zip(column_normalizers, zip(*page))]
+      for row in zip(*columns):
+        yield list(row)
 
-  return ([NormalizeEntry(i, e) for i, e in enumerate(row)] for row in rows)
+  return ExpandPages()
 
 
 def _PrintDryRunInfo(job):
   num_bytes = job['statistics']['query']['totalBytesProcessed']
-  if FLAGS.format in ['prettyjson', 'json']:
+  if FLAGS.format in ['prettyjson', 'json', 'ndjson']:
     _PrintFormattedJsonObject(job)
   elif FLAGS.format == 'csv':
     print num_bytes
@@ -486,6 +587,74 @@ def _PromptWithDefault(message):
   return raw_input(message).lower()
 
 
+def _GetTerminalLines():
+  """Returns the height of the terminal on stdout, or 24 if unknown."""
+  try:
+    import fcntl  # pylint: disable=g-import-not-at-top
+    import struct  # pylint: disable=g-import-not-at-top
+    import termios  # pylint: disable=g-import-not-at-top
+    lines, _ = struct.unpack(
+        'hh', fcntl.ioctl(sys.stdout.fileno(), termios.TIOCGWINSZ, '1234'))
+  except (ImportError, IOError, AttributeError, ValueError):
+    lines = 0
+  return lines or int(os.environ.get('LINES', 0)) or 24
+
+
+def _CanPage():
+  """Returns whether rows can be paged through interactively."""
+  return (not FLAGS.headless and sys.stdin.isatty() and
+          sys.stdout.isatty())
+
+
+def _PageRows(client, reference, start_row):
+  """Shows the rows of a table or job a screen at a time.
+
+  Each screen is read when it is first shown, and the next one is read
+  ahead while the user looks at it. Returns when the user quits, or at
+  the end of input.
+
+  Args:
+    client: The BigqueryClient to read the rows with.
+    reference: The TableReference or JobReference to read.
+    start_row: The row to show first.
+  """
+  pager = client.GetRowPager(
+      reference, max(1, _GetTerminalLines() - _PAGER_OVERHEAD_LINES))
+  usage = 'Enter: next, p: previous, g <row>: go to row, q: quit'
+  first_row = start_row
+  try:
+    while True:
+      rows = pager.GetPage(first_row)
+      if rows:
+        Factory.ClientTablePrinter.GetTablePrinter().PrintTable(
+            pager.schema or [], rows)
+        position = 'Rows %d-%d' % (first_row, first_row + len(rows) - 1)
+      else:
+        position = 'No rows from row %d' % (first_row,)
+      if pager.row_count is not None:
+        position += ' of %d' % (pager.row_count,)
+      try:
+        command = raw_input('%s. %s: ' % (position, usage)).strip().lower()
+      except EOFError:
+        print
+        return
+      if command in ('', 'n'):
+        if pager.IsLastPage(first_row):
+          print 'No more rows.'
+        else:
+          first_row += pager.page_rows
+      elif command == 'p':
+        first_row = max(0, first_row - pager.page_rows)
+      elif command == 'q':
+        return
+      elif command[:1] == 'g' and command[1:].strip().isdigit():
+        first_row = int(command[1:])
+      else:
+        print usage + '.'
+  finally:
+    pager.Close()
+
+
 def _PromptYN(message):
   """Prompts user with message, returning the key 'y', 'n', or '' on enter."""
   response = None
@@ -527,11 +696,12 @@ class TablePrinter(object):
       setattr(self, key, value)
 
   def PrintTable(self, fields, rows):
+    """Print rows, any iterable of rows, as they are read from rows."""
     formatter = _GetFormatterFromFlags(secondary_format='pretty')
     formatter.AddFields(fields)
-    rows = _ExpandForPrinting(fields, rows, formatter)
-    formatter.AddRows(rows)
-    formatter.Print()
+    formatter.Begin()
+    formatter.WriteRows(_ExpandForPrinting(fields, rows, formatter))
+    formatter.End()
 
 
 class Factory(object):
@@ -586,7 +756,9 @@ class Client(object):
     client_args = {}
     global_args = ('credential_file', 'job_property',
                    'project_id', 'dataset_id', 'trace', 'sync',
-                   'api', 'api_version')
+                   'api', 'api_version', 'max_concurrent_jobs',
+                   'upload_chunk_size', 'upload_session_dir',
+                   'metadata_index_file', 'metadata_index_max_age')
     for name in global_args:
       client_args[name] = KwdsOrFlags(name)
     client_args['wait_printer_factory'] = _GetWaitPrinterFactoryFromFlags()
@@ -777,6 +949,26 @@ class NewCmd(appcommands.Cmd):
 class BigqueryCmd(NewCmd):
   """Bigquery-specific NewCmd wrapper."""
 
+  # Whether the command prints table rows, and so accepts
+  # --format=columnar. Other output is not a table, so would be
+  # written to the terminal in a binary format.
+  prints_table_rows = False
+
+  def Run(self, argv):
+    """Run this command, if the global flags suit it."""
+    try:
+      self._ValidateFormat()
+    except app.UsageError, e:
+      return BigqueryCmd.ProcessError(e, name=self._command_name)
+    return super(BigqueryCmd, self).Run(argv)
+
+  def _ValidateFormat(self):
+    if FLAGS.format == 'columnar' and not self.prints_table_rows:
+      raise app.UsageError(
+          '--format=columnar is only for the rows printed by head and '
+          'query. For extract, use --destination_format=COLUMNAR with '
+          '--local.')
+
   def RunSafely(self, args, kwds):
     """Run this command, printing information about any exceptions raised."""
     try:
@@ -895,9 +1087,41 @@ class BigqueryCmd(NewCmd):
     reference = BigqueryClient.ConstructObjectReference(job)
     print 'Successfully started %s %s' % (self._command_name, reference)
 
+  def PrintJobGroup(self, group):
+    """Print the outcome of each job in a JobGroup, and the totals.
+
+    Args:
+      group: the bigquery_client.JobGroup to print.
+
+    Returns:
+      1 if any job in the group failed, otherwise None.
+    """
+    summary = group.Summary()
+    if FLAGS.format in ['prettyjson', 'json', 'ndjson']:
+      _PrintFormattedJsonObject(summary)
+    elif FLAGS.format != 'none':
+      formatter = _GetFormatterFromFlags()
+      formatter.AddColumns(('Source', 'Job', 'State', 'Input Bytes',
+                            'Seconds'))
+      for entry in summary['jobs']:
+        formatter.AddRow((entry['name'], entry.get('jobId', ''),
+                          entry['state'], entry['inputBytes'],
+                          entry['durationSeconds']))
+      formatter.Print()
+      if FLAGS.format in [None, 'sparse', 'pretty']:
+        print '%d of %d jobs succeeded, %d input bytes in %.1fs.' % (
+            summary['succeeded'], len(summary['jobs']),
+            summary['inputBytes'], summary['durationSeconds'])
+        for entry in summary['jobs']:
+          if 'error' in entry:
+            print 'Error in %s: %s' % (entry['name'], entry['error'])
+    if summary['failed']:
+      return 1
+
 
 class _Load(BigqueryCmd):
-  usage = """load <destination_table> <source> <schema>"""
+  usage = ("""load <destination_table> <source> <schema>  OR  """
+           """load --manifest=<file>""")
 
   def __init__(self, name, fv):
     super(_Load, self).__init__(name, fv)
@@ -954,18 +1178,81 @@ class _Load(BigqueryCmd):
         '\n NEWLINE_DELIMITED_JSON'
         '\n DATASTORE_BACKUP',
         flag_values=fv)
+    flags.DEFINE_boolean(
+        'compress', False,
+        'Whether to gzip local files as they are uploaded. Files that '
+        'are already gzipped are uploaded as they are.',
+        flag_values=fv)
+    flags.DEFINE_integer(
+        'compression_level', 6,
+        'The gzip compression level to use with --compress, from 1 '
+        '(fastest) to 9 (smallest).',
+        lower_bound=1, upper_bound=9, flag_values=fv)
+    flags.DEFINE_integer(
+        'split_size', None,
+        'If set, split local files into shards of about this many bytes, '
+        'each holding whole rows, and load the shards concurrently as '
+        'separate jobs.',
+        lower_bound=1, flag_values=fv)
+    flags.DEFINE_integer(
+        'max_uris_per_job', 10000,
+        'The most gs:// uris to load with one job. Longer lists of uris are '
+        'loaded concurrently by several jobs.',
+        lower_bound=1, flag_values=fv)
+    flags.DEFINE_boolean(
+        'validate', False,
+        'Whether to check local files against the schema before uploading '
+        'them, and stop if there are more bad records than '
+        '--max_bad_records allows.',
+        flag_values=fv)
+    flags.DEFINE_boolean(
+        'autodetect_schema_locally', False,
+        'If no schema is given, infer one from a sample of the rows of '
+        'the local CSV or NEWLINE_DELIMITED_JSON files being loaded. CSV '
+        'columns are named after the header row skipped by '
+        '--skip_leading_rows, if any.',
+        flag_values=fv)
+    flags.DEFINE_integer(
+        'autodetect_sample_rows', 1000,
+        'The number of rows to sample from each local file with '
+        '--autodetect_schema_locally.',
+        lower_bound=1, flag_values=fv)
+    flags.DEFINE_string(
+        'manifest', None,
+        'The name of a JSON file listing many loads to run concurrently, '
+        'in place of <destination_table>, <source> and <schema>. Other '
+        'load flags apply to the entries that do not set them.',
+        flag_values=fv)
+    flags.DEFINE_integer(
+        'manifest_retries', 2,
+        'The number of times to retry each failed job of a --manifest '
+        'load, with a new job id.',
+        lower_bound=0, flag_values=fv)
+    flags.DEFINE_string(
+        'summary_file', None,
+        'If set, and the load runs more than one job, write a JSON summary '
+        'of the jobs, with their durations and input bytes, to this file.',
+        flag_values=fv)
 
-  def RunWithArgs(self, destination_table, source, schema=None):
+  def RunWithArgs(self, destination_table=None, source=None, schema=None):
     """Perform a load operation of source into destination_table.
 
     Usage:
       load <destination_table> <source> [<schema>]
+      load --manifest=<file>
 
     The <destination_table> is the fully-qualified table name of table to
     create, or append to if the table already exists.
 
-    The <source> argument can be a path to a single local file, or a
-    comma-separated list of URIs.
+    The <source> argument can be a comma-separated list of local files
+    or glob patterns, or a comma-separated list of URIs. Each local file
+    is uploaded as its own load job, with up to --max_concurrent_jobs
+    running at once, and a summary of the jobs is printed. With
+    --split_size, large local files are also split into shards that are
+    loaded as separate jobs. Lists of more than --max_uris_per_job URIs
+    are likewise loaded by several concurrent jobs. A <source> of "-"
+    uploads standard input as it is read, so that data can be piped
+    straight into a table.
 
     The <schema> argument should be either the name of a JSON file or a text
     schema. This schema should be omitted if the table already has one.
@@ -984,20 +1271,49 @@ class _Load(BigqueryCmd):
     ambiguous; one can use name:string to force interpretation as a
     text schema.
 
+    With --autodetect_schema_locally, a schema is inferred from a sample
+    of the rows of local files when <schema> is omitted.
+
+    With --manifest, the loads are read from a JSON file holding a list
+    of entries, each an object with a "destination_table", a "source"
+    (a string or a list of strings), and optionally a "schema" (a list of
+    fields or a text schema), a "name" to report the job by, and options
+    of the load such as "source_format", "write_disposition" or
+    "skip_leading_rows". The loads run concurrently, failed jobs are
+    retried, and a summary of all the jobs is printed.
+
     Examples:
       bq load ds.new_tbl ./info.csv ./info_schema.json
+      bq load ds.daily './logs/2013-*.csv' ./info_schema.json
+      bq load --compress ds.new_tbl ./big.csv ./info_schema.json
+      bq load --split_size=536870912 ds.new_tbl ./huge.csv ./info_schema.json
+      bq load --autodetect_schema_locally --skip_leading_rows=1 ds.new_tbl \
+          ./info.csv
+      zcat ./logs/*.gz | bq load --compress ds.logs - ./info_schema.json
+      bq load --manifest=./nightly.json --summary_file=./nightly_summary.json
       bq load ds.new_tbl gs://mybucket/info.csv ./info_schema.json
       bq load ds.small gs://mybucket/small.csv name:integer,value:string
       bq load ds.small gs://mybucket/small.csv field1,field2,field3
 
     Arguments:
       destination_table: Destination table name.
-      source: Name of local file to import, or a comma-separated list of
-        URI paths to data to import.
+      source: Comma-separated list of local files or glob patterns to
+        import, "-" for standard input, or a comma-separated list of URI
+        paths to data to import.
       schema: Either a text schema or JSON file, as above.
     """
     client = Client.Get()
-    table_reference = client.GetTableReference(destination_table)
+    if self.manifest:
+      if destination_table or source or schema:
+        raise app.UsageError(
+            'Cannot specify a destination table, source or schema '
+            'with --manifest.')
+      if self.split_size or self.validate or self.autodetect_schema_locally:
+        raise app.UsageError(
+            'Cannot specify --split_size, --validate or '
+            '--autodetect_schema_locally with --manifest.')
+    elif not destination_table or not source:
+      raise app.UsageError('Need a destination table and a source to load.')
     opts = {
         'encoding': self.encoding,
         'skip_leading_rows': self.skip_leading_rows,
@@ -1014,13 +1330,46 @@ class _Load(BigqueryCmd):
       opts['quote'] = _NormalizeFieldDelimiter(self.quote)
     if self.allow_jagged_rows is not None:
       opts['allow_jagged_rows'] = self.allow_jagged_rows
+    if self.compress:
+      opts['compression_level'] = self.compression_level
+    if self.split_size:
+      opts['split_size'] = self.split_size
+    if self.max_uris_per_job:
+      opts['max_uris_per_job'] = self.max_uris_per_job
+    if self.manifest:
+      job_id = opts.pop('job_id')
+      job = client.LoadManifest(self.manifest, job_id=job_id,
+                                retries=self.manifest_retries, **opts)
+      return self._PrintLoadJobs(job)
+    table_reference = client.GetTableReference(destination_table)
+    if self.autodetect_schema_locally and not schema:
+      schema = client.InferSchema(
+          source, sample_rows=self.autodetect_sample_rows, **opts)
+      if not FLAGS.quiet and FLAGS.format in [None, 'sparse', 'pretty']:
+        print 'Inferred schema:'
+        print client.FormatSchema({'fields': schema})
+    if self.validate:
+      _, bad_records = client.ValidateLoad(
+          table_reference, source, schema=schema, **opts)
+      for bad_record in bad_records:
+        print 'Warning: bad record in %s' % (bad_record,)
     job = client.Load(table_reference, source, schema=schema, **opts)
+    if isinstance(job, bigquery_client.JobGroup):
+      return self._PrintLoadJobs(job)
     if not FLAGS.sync:
       self.PrintJobStartInfo(job)
 
+  def _PrintLoadJobs(self, group):
+    """Print a JobGroup of loads, also writing it to --summary_file."""
+    if self.summary_file:
+      with open(self.summary_file, 'w') as f:
+        json.dump(group.Summary(), f, sort_keys=True, indent=2)
+    return self.PrintJobGroup(group)
+
 
 class _Query(BigqueryCmd):
   usage = """query <sql>"""
+  prints_table_rows = True
 
   def __init__(self, name, fv):
     super(_Query, self).__init__(name, fv)
@@ -1048,6 +1397,12 @@ class _Query(BigqueryCmd):
         'rpc', False,
         'If true, use rpc-style query API instead of jobs.insert().',
         flag_values=fv)
+    flags.DEFINE_boolean(
+        'pager', False,
+        'Shows the rows a screen at a time, reading each screen as it is '
+        'shown, when the query runs synchronously in a terminal. '
+        '--max_rows is ignored.',
+        flag_values=fv)
     flags.DEFINE_boolean(
         'replace', False,
         'If true, erase existing contents before loading new data.',
@@ -1107,6 +1462,9 @@ class _Query(BigqueryCmd):
       if self.batch:
         raise app.UsageError(
             'batch cannot be specified in rpc mode.')
+      if self.pager:
+        raise app.UsageError(
+            'pager cannot be specified in rpc mode.')
       kwds['max_results'] = self.max_rows
       fields, rows = client.RunQueryRpc(query, **kwds)
       Factory.ClientTablePrinter.GetTablePrinter().PrintTable(fields, rows)
@@ -1128,15 +1486,18 @@ class _Query(BigqueryCmd):
         _PrintDryRunInfo(job)
       elif not FLAGS.sync:
         self.PrintJobStartInfo(job)
+      elif self.pager and _CanPage():
+        _PageRows(client, JobReference.Create(**job['jobReference']),
+                  self.start_row)
       else:
-        fields, rows = client.ReadSchemaAndJobRows(job['jobReference'],
+        fields, rows = client.IterSchemaAndJobRows(job['jobReference'],
                                                    start_row=self.start_row,
                                                    max_rows=self.max_rows)
         Factory.ClientTablePrinter.GetTablePrinter().PrintTable(fields, rows)
 
 
 class _Extract(BigqueryCmd):
-  usage = """extract <source_table> <destination_uri>"""
+  usage = """extract [--local [-j]] <source_table> <destination_uri>"""
 
   def __init__(self, name, fv):
     super(_Extract, self).__init__(name, fv)
@@ -1147,10 +1508,34 @@ class _Extract(BigqueryCmd):
         short_name='F', flag_values=fv)
     flags.DEFINE_enum(
         'destination_format', None,
-        ['CSV', 'NEWLINE_DELIMITED_JSON'],
+        ['CSV', 'NEWLINE_DELIMITED_JSON', 'COLUMNAR'],
         'The format with which to write the extracted data. Tables with '
-        'nested or repeated fields cannot be extracted to CSV.',
+        'nested or repeated fields cannot be extracted to CSV. COLUMNAR, '
+        'the binary format of --format=columnar, needs --local.',
+        flag_values=fv)
+    flags.DEFINE_boolean(
+        'local', False,
+        'Reads the rows directly and writes them to a local file, or to '
+        'stdout if the destination is "-", instead of running an extract '
+        'job. A destination ending in .gz is gzipped.',
         flag_values=fv)
+    flags.DEFINE_boolean(
+        'job', False,
+        'With --local, extracts the results of a query job.',
+        short_name='j', flag_values=fv)
+    flags.DEFINE_boolean(
+        'compress', None,
+        'With --local, whether to gzip the output. Defaults to whether the '
+        'destination ends in .gz.',
+        flag_values=fv)
+    flags.DEFINE_boolean(
+        'print_header', True,
+        'With --local, whether to write a header row to a CSV file.',
+        flag_values=fv)
+    flags.DEFINE_integer(
+        'max_concurrent_reads', 4,
+        'With --local, the number of ranges of rows to read at once.',
+        lower_bound=1, flag_values=fv)
 
   def RunWithArgs(self, source_table, destination_uri):
     """Perform an extract operation of source_table into destination_uri.
@@ -1158,17 +1543,67 @@ class _Extract(BigqueryCmd):
     Usage:
       extract <source_table> <destination_uri>
 
+    If <destination_uri> contains "{table}", <source_table> may instead
+    be a dataset, or a table id pattern such as ds.events_* where "*"
+    and "?" match any characters. Every matching table is then extracted
+    by its own job, with "{table}" replaced by the table id, up to
+    --max_concurrent_jobs at once, and a summary of the jobs is printed.
+    As for ls, a name without a "." is a table when --dataset_id is set;
+    name a dataset as project:dataset or dataset.* then.
+
+    With --local, the rows are instead read directly, in ranges of rows
+    read up to --max_concurrent_reads at once, and written in order to the
+    local file <destination_uri>, and the rows per second are reported.
+
     Examples:
       bq extract ds.summary gs://mybucket/summary.csv
+      bq extract ds 'gs://mybucket/backup/{table}/*.csv'
+      bq extract 'ds.events_2013*' 'gs://mybucket/events/{table}.json'
+      bq extract --local ds.summary summary.csv.gz
+      bq extract --local -j --destination_format=NEWLINE_DELIMITED_JSON \\
+          job_1234 - | head
 
     Arguments:
-      source_table: Source table to extract.
-      destination_uri: Google Storage uri.
+      source_table: Source table to extract, or a dataset or table
+        pattern as above, or with --local -j a query job.
+      destination_uri: Google Storage uri, or with --local a local file.
     """
     client = Client.Get()
+    if self.j and not self.local:
+      raise app.UsageError('Cannot specify -j without --local.')
+    if self.destination_format == 'COLUMNAR' and not self.local:
+      raise app.UsageError(
+          'Cannot specify --destination_format=COLUMNAR without --local.')
+    if self.local:
+      if self.j:
+        source = client.GetJobReference(source_table)
+      else:
+        source = client.GetTableReference(source_table)
+      result = client.ExtractLocal(
+          source, destination_uri,
+          destination_format=self.destination_format,
+          print_header=self.print_header,
+          field_delimiter=_NormalizeFieldDelimiter(self.field_delimiter),
+          compress=self.compress,
+          max_concurrent_reads=self.max_concurrent_reads)
+      if not FLAGS.quiet:
+        # Keep stdout for the rows when they are written there.
+        output = sys.stderr if destination_uri == '-' else sys.stdout
+        print >>output, 'Wrote %d rows (%d bytes) in %.1fs, %d rows/s.' % (
+            result['rows'], result['bytesWritten'],
+            result['durationSeconds'], result['rowsPerSecond'])
+      return
     kwds = {
         'job_id': _GetJobIdFromFlags(),
         }
+    if '{table}' in destination_uri:
+      dataset_reference, table_pattern = _GetTablesToExtract(
+          client, source_table)
+      group = client.ExtractTables(
+          dataset_reference, table_pattern, destination_uri,
+          field_delimiter=_NormalizeFieldDelimiter(self.field_delimiter),
+          destination_format=self.destination_format, **kwds)
+      return self.PrintJobGroup(group)
     table_reference = client.GetTableReference(source_table)
     job = client.Extract(
         table_reference, destination_uri,
@@ -1178,6 +1613,34 @@ class _Extract(BigqueryCmd):
       self.PrintJobStartInfo(job)
 
 
+def _GetTablesToExtract(client, identifier):
+  """Returns the dataset and table id pattern that identifier names.
+
+  Args:
+    client: The BigqueryClient that fills in the default project and
+      dataset.
+    identifier: A table, a dataset, or a table id pattern.
+
+  Returns:
+    A tuple of the DatasetReference of the tables and the pattern their
+    table ids match.
+
+  Raises:
+    app.UsageError: if identifier names neither tables nor a dataset.
+  """
+  if glob.has_magic(identifier):
+    reference = client.GetTableReference(identifier)
+  else:
+    # As for ls, a table is preferred over a dataset of the same name.
+    reference = client.GetReference(identifier)
+  if isinstance(reference, TableReference):
+    return reference.GetDatasetReference(), reference.tableId
+  elif isinstance(reference, DatasetReference):
+    return reference, '*'
+  raise app.UsageError(
+      'Cannot determine the tables to extract from %s.' % (identifier,))
+
+
 class _List(BigqueryCmd):
   usage = """ls [(-j|-p|-d)] [-a] [-n <number>] [<identifier>]"""
 
@@ -1627,7 +2090,7 @@ class _Show(BigqueryCmd):
 
     # The JSON formats are handled separately so that they don't print
     # the record as a list of one record.
-    if FLAGS.format in ['prettyjson', 'json']:
+    if FLAGS.format in ['prettyjson', 'json', 'ndjson']:
       _PrintFormattedJsonObject(object_info)
     elif FLAGS.format in [None, 'sparse', 'pretty']:
       formatter = _GetFormatterFromFlags()
@@ -1654,6 +2117,7 @@ class _Show(BigqueryCmd):
 
 class _Head(BigqueryCmd):
   usage = """head [-n <max rows>] [-j] [-t] <identifier>"""
+  prints_table_rows = True
 
   def __init__(self, name, fv):
     super(_Head, self).__init__(name, fv)
@@ -1673,6 +2137,11 @@ class _Head(BigqueryCmd):
         'max_rows', 100,
         'The number of rows to print when showing table data.',
         short_name='n', flag_values=fv)
+    flags.DEFINE_boolean(
+        'pager', False,
+        'Shows the rows a screen at a time, reading each screen as it is '
+        'shown, when run in a terminal. --max_rows is ignored.',
+        flag_values=fv)
 
   def RunWithArgs(self, identifier=''):
     """Displays rows in a table.
@@ -1682,6 +2151,7 @@ class _Head(BigqueryCmd):
       bq head -j job
       bq head -n 10 dataset.table
       bq head -s 5 -n 10 dataset.table
+      bq head --pager dataset.table
     """
     client = Client.Get()
     if self.j and self.t:
@@ -1692,12 +2162,19 @@ class _Head(BigqueryCmd):
     else:
       reference = client.GetTableReference(identifier)
 
+    if self.pager and _CanPage():
+      if not isinstance(reference, (JobReference, TableReference)):
+        raise app.UsageError(
+            "Invalid identifier '%s' for head." % (identifier,))
+      _PageRows(client, reference, self.s)
+      return
+
     if isinstance(reference, JobReference):
-      fields, rows = client.ReadSchemaAndJobRows(dict(reference),
+      fields, rows = client.IterSchemaAndJobRows(dict(reference),
                                                  start_row=self.s,
                                                  max_rows=self.n)
     elif isinstance(reference, TableReference):
-      fields, rows = client.ReadSchemaAndRows(dict(reference),
+      fields, rows = client.IterSchemaAndRows(dict(reference),
                                               start_row=self.s,
                                               max_rows=self.n)
     else:
@@ -1711,6 +2188,34 @@ class _Insert(BigqueryCmd):
 
   def __init__(self, name, fv):
     super(_Insert, self).__init__(name, fv)
+    flags.DEFINE_string(
+        'spool_dir', None,
+        'Directory of a durable spool for the inserted rows. Rows are '
+        'written to the spool before they are sent, and acknowledged once '
+        'inserted. A later insert using the same spool first resends any '
+        'unacknowledged rows, with their original insertIds, and resumes '
+        'reading the same file where the previous insert stopped. Rows '
+        'rejected with errors are moved to a .rejected file in the spool.',
+        flag_values=fv)
+    flags.DEFINE_boolean(
+        'follow', False,
+        'Keep running, inserting lines as they are appended to the file, '
+        'like "tail -f". Rotated and truncated files are followed. Lines '
+        'that are not valid rows are skipped, and with --spool_dir kept in '
+        'a .rejected file there. Stop with Control-C.',
+        short_name='f', flag_values=fv)
+    flags.DEFINE_float(
+        'linger', 1.0,
+        'With --follow, the maximum number of seconds a row waits for more '
+        'rows to join its insert request.',
+        lower_bound=0, flag_values=fv)
+    flags.DEFINE_string(
+        'checkpoint_file', None,
+        'With --follow, a file recording how far into the followed file '
+        'rows have been inserted, so that a restarted insert resumes '
+        'there. Not needed with --spool_dir, which keeps its own '
+        'checkpoint.',
+        flag_values=fv)
 
   def RunWithArgs(self, identifier='', filename=None):
     """Inserts rows in a table.
@@ -1722,7 +2227,13 @@ class _Insert(BigqueryCmd):
     Examples:
       bq insert dataset.table /tmp/mydata.json
       echo '{"a":1, "b":2}' | bq insert dataset.table
+      bq insert --spool_dir=/var/spool/bq dataset.table /tmp/mydata.json
+      bq insert -f --checkpoint_file=/tmp/app.ckpt dataset.table /tmp/app.log
     """
+    if self.follow:
+      if not filename:
+        raise app.UsageError('Must provide a file to insert with --follow.')
+      return self._DoFollow(identifier, filename)
     if filename:
       with open(filename, 'r') as json_file:
         return self._DoInsert(identifier, json_file)
@@ -1732,32 +2243,146 @@ class _Insert(BigqueryCmd):
   def _DoInsert(self, identifier, json_file):
     """Insert the contents of the file into a table."""
     client = Client.Get()
+    spool = self._OpenSpool()
+    try:
+      batcher = _InsertBatcher(
+          client, self._GetTableDict(client, identifier), spool=spool)
+      self._ReplaySpool(batcher, spool)
+      if batcher.errors is None:
+        self._InsertLines(json_file, batcher, spool)
+      if batcher and batcher.errors is None:
+        batcher.Flush()
+    finally:
+      if spool:
+        spool.Close()
+    return self._PrintResult(batcher.result, batcher.errors,
+                             batcher.rejected_file)
+
+  def _DoFollow(self, identifier, filename):
+    """Insert lines appended to filename until interrupted."""
+    client = Client.Get()
+    spool = self._OpenSpool()
+    try:
+      batcher = _InsertBatcher(
+          client, self._GetTableDict(client, identifier), spool=spool,
+          checkpoint_file=self.checkpoint_file)
+      if spool:
+        checkpoint = spool.checkpoint
+      else:
+        checkpoint = _ReadCheckpoint(self.checkpoint_file)
+      follower = _FileFollower(os.path.abspath(filename), checkpoint)
+      self._ReplaySpool(batcher, spool)
+      try:
+        while batcher.errors is None:
+          lines = follower.ReadLines()
+          self._AddFollowedLines(batcher, spool, lines)
+          if batcher and batcher.Age() >= self.linger:
+            batcher.Flush()
+          if not lines:
+            time.sleep(min(self.linger, _FileFollower.POLL_INTERVAL) or
+                       _FileFollower.POLL_INTERVAL)
+      except KeyboardInterrupt:
+        pass
+      if batcher and batcher.errors is None:
+        batcher.Flush()
+      follower.Close()
+    finally:
+      if spool:
+        spool.Close()
+    return self._PrintResult(batcher.result, batcher.errors,
+                             batcher.rejected_file)
+
+  def _AddFollowedLines(self, batcher, spool, lines):
+    """Adds the rows of lines read by a _FileFollower to batcher.
+
+    Unlike in a single insert, a line that isn't a valid row doesn't end
+    the insert, since the file would be read from before it again on
+    every restart. It is set aside, and the checkpoint moves past it.
+
+    Args:
+      batcher: The _InsertBatcher to add the rows to.
+      spool: The InsertSpool of batcher, or None.
+      lines: A list of (line, checkpoint) pairs.
+    """
+    for line, checkpoint in lines:
+      try:
+        entry = bigquery_client.JsonToInsertEntry(None, line)
+      except bigquery_client.BigqueryClientError, e:
+        self._RejectLine(batcher, spool, line, checkpoint, e)
+      else:
+        if spool:
+          entry, spool_offset = _SpoolEntry(spool, entry, line)
+          batcher.Add(entry, spool_offset=spool_offset,
+                      checkpoint=checkpoint)
+        else:
+          batcher.Add(entry, checkpoint=checkpoint)
+        if batcher.IsFull():
+          batcher.Flush()
+      if batcher.errors:
+        break
+
+  def _RejectLine(self, batcher, spool, line, checkpoint, error):
+    """Sets aside a followed line that isn't a valid row.
+
+    With a spool, the line is quarantined in it. Otherwise it is only
+    printed on stderr.
+
+    Args:
+      batcher: The _InsertBatcher of the rows read so far.
+      spool: The InsertSpool of batcher, or None.
+      line: The line.
+      checkpoint: The checkpoint just past the line.
+      error: The error parsing the line.
+    """
+    message = '%s, line ending at byte %d: %s' % (
+        checkpoint['source'], checkpoint['offset'], error)
+    line = line.rstrip('\r\n')
+    if not spool:
+      print >>sys.stderr, 'Skipped invalid row. %s\n%s' % (message, line)
+      batcher.Skip(checkpoint)
+      return
+    # Quarantining acknowledges every record before the line, so the
+    # rows before it are sent first.
+    if batcher:
+      batcher.Flush()
+      if batcher.errors:
+        return
+    spool.Sync(checkpoint)
+    rejected_file = spool.Quarantine(spool.offset, [line])
+    print >>sys.stderr, 'Skipped invalid row, moved to %s. %s' % (
+        rejected_file, message)
+
+  def _GetTableDict(self, client, identifier):
     reference = client.GetReference(identifier)
     _Typecheck(reference, (TableReference,),
                'Must provide a table identifier for insert.')
-    reference = dict(reference)
-    batch = []
-    def Flush():
-      result = client.InsertTableRows(reference, batch)
-      del batch[:]
-      return result, result.get('insertErrors', None)
-    result = {}
-    errors = None
-    lineno = 1
-    for line in json_file:
-      try:
-        batch.append(bigquery_client.JsonToInsertEntry(None, line))
-        lineno += 1
-      except bigquery_client.BigqueryClientError, e:
-        raise app.UsageError('Line %d: %s' % (lineno, str(e)))
-      if (FLAGS.max_rows_per_request and
-          len(batch) == FLAGS.max_rows_per_request):
-        result, errors = Flush()
-      if errors: break
-    if batch and errors is None:
-      result, errors = Flush()
-
-    if FLAGS.format in ['prettyjson', 'json']:
+    return dict(reference)
+
+  def _OpenSpool(self):
+    if self.spool_dir:
+      return bigquery_client.InsertSpool(self.spool_dir)
+    return None
+
+  def _ReplaySpool(self, batcher, spool):
+    """Resends the rows a previous insert left unacknowledged in spool."""
+    if not spool:
+      return
+    for spool_offset, record in spool.ReadPending():
+      # The row is resent with its original insertId, so that it is not
+      # inserted twice if it reached the server before.
+      insert_id, _, line = record.partition('\t')
+      batcher.Add(bigquery_client.JsonToInsertEntry(insert_id, line),
+                  spool_offset=spool_offset)
+      if batcher.IsFull():
+        batcher.Flush()
+      if batcher.errors:
+        break
+
+  def _PrintResult(self, result, errors, rejected_file=None):
+    if rejected_file and not FLAGS.quiet:
+      print >>sys.stderr, 'Rows with errors were moved to %s.' % (
+          rejected_file,)
+    if FLAGS.format in ['prettyjson', 'json', 'ndjson']:
       _PrintFormattedJsonObject(result)
     elif FLAGS.format in [None, 'sparse', 'pretty']:
       if errors:
@@ -1768,6 +2393,245 @@ class _Insert(BigqueryCmd):
             print '\t%s: %s' % (error['reason'], error['message'])
     return 1 if errors else 0
 
+  def _InsertLines(self, json_file, batcher, spool):
+    """Parses each line of json_file and passes it to batcher."""
+    source = None
+    source_offset = 0
+    if spool and json_file is not sys.stdin:
+      source = os.path.abspath(json_file.name)
+      checkpoint = spool.checkpoint or {}
+      if (checkpoint.get('source') == source and
+          checkpoint.get('offset', 0) <= os.path.getsize(source)):
+        source_offset = checkpoint['offset']
+        json_file.seek(source_offset)
+    lineno = 1
+    for line in json_file:
+      try:
+        entry = bigquery_client.JsonToInsertEntry(None, line)
+        lineno += 1
+      except bigquery_client.BigqueryClientError, e:
+        raise app.UsageError('Line %d: %s' % (lineno, str(e)))
+      source_offset += len(line)
+      if spool:
+        entry, spool_offset = _SpoolEntry(spool, entry, line)
+        batcher.Add(entry, spool_offset=spool_offset,
+                    checkpoint={'source': source, 'offset': source_offset})
+      else:
+        batcher.Add(entry)
+      if batcher.IsFull():
+        batcher.Flush()
+      if batcher.errors:
+        break
+
+
+class _InsertBatcher(object):
+  """Groups rows into insertAll requests, optionally through a spool.
+
+  When a spool is given, it is synced before each request is sent, and
+  the rows are acknowledged once the request succeeds. If it returns
+  insertErrors, the rows that were not inserted are quarantined in the
+  spool instead, so that later inserts do not resend them, and
+  rejected_file is the file they were written to.
+  When a checkpoint_file is given, the checkpoint of the last row of each
+  successful request is written to it.
+  """
+
+  def __init__(self, client, reference, spool=None, checkpoint_file=None):
+    self._client = client
+    self._reference = reference
+    self._spool = spool
+    self._checkpoint_file = checkpoint_file
+    self._batch = []
+    self._batch_start_time = None
+    self._spool_offset = None
+    self._checkpoint = None
+    self.result = {}
+    self.errors = None
+    self.rejected_file = None
+
+  def __len__(self):
+    return len(self._batch)
+
+  def IsFull(self):
+    return bool(FLAGS.max_rows_per_request and
+                len(self._batch) >= FLAGS.max_rows_per_request)
+
+  def Age(self):
+    """Returns the number of seconds the oldest pending row has waited."""
+    if not self._batch:
+      return 0
+    return time.time() - self._batch_start_time
+
+  def Add(self, entry, spool_offset=None, checkpoint=None):
+    """Adds an InsertEntry, recording its spool and input positions."""
+    if not self._batch:
+      self._batch_start_time = time.time()
+    self._batch.append(entry)
+    if spool_offset is not None:
+      self._spool_offset = spool_offset
+    if checkpoint is not None:
+      self._checkpoint = checkpoint
+
+  def Skip(self, checkpoint):
+    """Records that the input up to checkpoint holds no more rows."""
+    if self._batch:
+      self._checkpoint = checkpoint
+    elif self._checkpoint_file:
+      _WriteCheckpoint(self._checkpoint_file, checkpoint)
+
+  def Flush(self):
+    """Sends the pending rows, returning the insertAll result."""
+    if self._spool:
+      if self._checkpoint is not None:
+        self._spool.Sync(self._checkpoint)
+      else:
+        self._spool.Sync()
+    self.result = self._client.InsertTableRows(self._reference, self._batch)
+    self.errors = self.result.get('insertErrors', None)
+    if self.errors and self._spool and self._spool_offset is not None:
+      # The rows are kept as JSON lines, ready to be inserted again.
+      rejected = sorted(set(entry['index'] for entry in self.errors))
+      self.rejected_file = self._spool.Quarantine(
+          self._spool_offset,
+          [json.dumps(self._batch[index].record, separators=(',', ':'))
+           for index in rejected])
+    del self._batch[:]
+    if not self.errors:
+      if self._spool and self._spool_offset is not None:
+        self._spool.Acknowledge(self._spool_offset)
+      if self._checkpoint_file and self._checkpoint is not None:
+        _WriteCheckpoint(self._checkpoint_file, self._checkpoint)
+    return self.result
+
+
+def _SpoolEntry(spool, entry, line):
+  """Appends the row parsed from line to spool, with a new insertId.
+
+  Args:
+    spool: The InsertSpool to append to.
+    entry: The InsertEntry parsed from line.
+    line: The JSON line of the row.
+
+  Returns:
+    A tuple of the InsertEntry with its insertId, and its spool offset.
+  """
+  insert_id = 'bqrow_%016x' % (random.getrandbits(64),)
+  offset = spool.Append('%s\t%s' % (insert_id, line.rstrip('\r\n')))
+  return entry._replace(insert_id=insert_id), offset
+
+
+def _ReadCheckpoint(filename):
+  """Returns the checkpoint stored in filename, or None."""
+  if not filename or not os.path.exists(filename):
+    return None
+  with open(filename) as f:
+    try:
+      return json.load(f)
+    except ValueError, e:
+      raise app.UsageError('Invalid checkpoint file %s: %s' % (filename, e))
+
+
+def _WriteCheckpoint(filename, checkpoint):
+  """Atomically replaces the contents of filename with checkpoint."""
+  temp_filename = filename + '.tmp'
+  with open(temp_filename, 'w') as f:
+    json.dump(checkpoint, f)
+    f.flush()
+    os.fsync(f.fileno())
+  bigquery_client._ReplaceFile(temp_filename, filename)
+
+
+class _FileFollower(object):
+  """Reads complete lines as they are appended to a file.
+
+  Rotation is followed: when the path is replaced by a new file, the rest
+  of the old file is read before switching to the new one, and when the
+  file is truncated, reading starts over from its beginning. Each line is
+  returned with a checkpoint ({'source', 'inode', 'offset'}) from which a
+  new _FileFollower can resume just after that line.
+  """
+
+  POLL_INTERVAL = 0.5
+  _READ_SIZE = 1024 * 1024
+
+  def __init__(self, path, checkpoint=None):
+    self.path = path
+    self._file = None
+    self._inode = None
+    self._offset = 0
+    self._partial = ''
+    checkpoint = checkpoint or {}
+    if checkpoint.get('source') == path:
+      self._Open(checkpoint.get('inode'), checkpoint.get('offset', 0))
+    else:
+      self._Open()
+
+  def _Open(self, inode=None, offset=0):
+    """Opens self.path, resuming at offset if it is still the same file."""
+    try:
+      new_file = io.open(self.path, 'rb', buffering=0)
+    except IOError:
+      # The file may be missing briefly while it is being rotated.
+      return False
+    self.Close()
+    stat = os.fstat(new_file.fileno())
+    self._file = new_file
+    self._inode = stat.st_ino
+    self._offset = 0
+    self._partial = ''
+    if inode == stat.st_ino and offset <= stat.st_size:
+      self._offset = offset
+      self._file.seek(offset)
+    return True
+
+  def _Checkpoint(self):
+    return {'source': self.path, 'inode': self._inode, 'offset': self._offset}
+
+  def _ReadAvailable(self, final=False):
+    """Returns the complete lines currently available in the open file."""
+    data = self._file.read(self._READ_SIZE)
+    if data:
+      lines = (self._partial + data).split('\n')
+      self._partial = lines.pop()
+    elif final and self._partial:
+      # The old file of a rotation ended without a trailing newline.
+      self._offset += len(self._partial)
+      line, self._partial = self._partial, ''
+      return [(line, self._Checkpoint())]
+    else:
+      return []
+    results = []
+    for line in lines:
+      self._offset += len(line) + 1
+      results.append((line, self._Checkpoint()))
+    return results
+
+  def ReadLines(self):
+    """Returns a list of (line, checkpoint) for newly available lines."""
+    if self._file is None and not self._Open():
+      return []
+    lines = self._ReadAvailable()
+    if lines:
+      return lines
+    try:
+      stat = os.stat(self.path)
+    except OSError:
+      return []
+    if stat.st_ino != self._inode:
+      lines = self._ReadAvailable(final=True)
+      if not lines:
+        self._Open()
+    elif stat.st_size < self._offset + len(self._partial):
+      self._file.seek(0)
+      self._offset = 0
+      self._partial = ''
+    return lines
+
+  def Close(self):
+    if self._file is not None:
+      self._file.close()
+      self._file = None
+
 
 class _Wait(BigqueryCmd):
   usage = """wait [<job_id>] [<secs>]"""
@@ -1809,6 +2673,99 @@ class _Wait(BigqueryCmd):
     client.WaitJob(job_reference=job_reference, wait=secs)
 
 
+class _Index(BigqueryCmd):
+  usage = """index (refresh [<project or dataset>] | clear)"""
+
+  def RunWithArgs(self, action, identifier=''):
+    """Manage the local index of project, dataset and table metadata.
+
+    The index is kept in --metadata_index_file, which must be set.
+    Commands save the metadata they read in it, and use what it holds
+    instead of asking the server when it is no older than
+    --metadata_index_max_age seconds. The shell completes names of
+    projects, datasets and tables from it.
+
+    Examples:
+      bq --metadata_index_file=~/.bigquery.v2.index index refresh
+      bq index refresh myproject:
+      bq index refresh mydataset
+      bq --metadata_index_max_age=3600 ls mydataset
+      bq index clear
+
+    Arguments:
+      action: 'refresh' to read metadata from the server into the index,
+        or 'clear' to empty it.
+      identifier: With refresh, the project or dataset to read. If none
+        is given, all projects are read.
+    """
+    client = Client.Get()
+    index = client.GetMetadataIndex()
+    if index is None:
+      raise app.UsageError(
+          'There is no metadata index; set --metadata_index_file.')
+    if action == 'clear' and not identifier:
+      index.Clear()
+      return
+    if action != 'refresh':
+      raise app.UsageError('Usage: %s' % (self.usage,))
+    reference = None
+    if identifier:
+      reference = client.GetReference(identifier)
+      # As with ls, 'foo' with dataset_id set means the dataset foo.
+      if isinstance(reference, TableReference):
+        try:
+          reference = client.GetDatasetReference(identifier)
+        except bigquery_client.BigqueryError:
+          pass
+    _Typecheck(reference, (types.NoneType, ProjectReference, DatasetReference),
+               'Invalid identifier "%s" for index refresh.' % (identifier,))
+    counts = client.RefreshMetadataIndex(reference)
+    if not FLAGS.quiet:
+      print 'Indexed %d datasets and %d tables in %s.' % (
+          counts['datasets'], counts['tables'], index.filename)
+
+
+def _CompleteIdentifier(client, word):
+  """Returns the names in the metadata index that start with word.
+
+  Names are completed as they would be read: 'ds.t' is a table of the
+  default project, and 't' a table of the default dataset.
+
+  Args:
+    client: The BigqueryClient whose metadata index to read.
+    word: The beginning of a project, dataset or table identifier.
+
+  Returns:
+    A sorted list of identifiers.
+  """
+  index = client.GetMetadataIndex()
+  if index is None:
+    return []
+  project_id, colon, rest = word.rpartition(':')
+  candidates = []
+  if colon and '.' in rest:
+    dataset_id = rest.partition('.')[0]
+    candidates.extend('%s:%s.%s' % (project_id, dataset_id, table_id)
+                      for table_id in index.GetChildIds(
+                          (project_id, dataset_id)))
+  elif colon:
+    candidates.extend('%s:%s' % (project_id, dataset_id)
+                      for dataset_id in index.GetChildIds((project_id,)))
+  elif '.' in word and client.project_id:
+    dataset_id = word.partition('.')[0]
+    candidates.extend('%s.%s' % (dataset_id, table_id)
+                      for table_id in index.GetChildIds(
+                          (client.project_id, dataset_id)))
+  elif client.project_id:
+    candidates.extend(index.GetChildIds((client.project_id,)))
+    if client.dataset_id:
+      candidates.extend(index.GetChildIds(
+          (client.project_id, client.dataset_id)))
+  # Project ids may themselves hold ':' and '.', as in domain.com:proj.
+  candidates.extend(project_id + ':' for project_id in index.GetChildIds(()))
+  return sorted(set(name for name in candidates if name.startswith(word)))
+
+
 # pylint: disable=g-bad-name
 class CommandLoop(cmd.Cmd):
   """Instance of cmd.Cmd built to work with NewCmd."""
@@ -1860,9 +2817,17 @@ class CommandLoop(cmd.Cmd):
   def postloop(self):
     print 'Goodbye.'
 
-  def completedefault(self, unused_text, line, unused_begidx, unused_endidx):
+  def completedefault(self, text, line, unused_begidx, endidx):
     if not line:
       return []
+    # readline splits words at ':', so text may be only the end of the
+    # identifier being completed. It also only takes str completions;
+    # identifiers are ASCII.
+    word = line[:endidx].rpartition(' ')[2]
+    completions = [str(name[len(word) - len(text):])
+                   for name in _CompleteIdentifier(Client.Get(), word)]
+    if completions:
+      return completions
     else:
       command_name = line.partition(' ')[0].lower()
       usage = ''
@@ -2164,6 +3129,7 @@ def main(argv):
         'cp': _Copy,
         'extract': _Extract,
         'head': _Head,
+        'index': _Index,
         'init': _Init,
         'insert': _Insert,
         'load': _Load,
@@ -0,0 +1,464 @@
+#!/usr/bin/env python
+# Copyright 2012 Google Inc. All Rights Reserved.
+
+"""Tests for bq.py."""
+
+
+
+import datetime
+import json
+import os
+import random
+import shutil
+import tempfile
+
+from google.apputils import googletest
+import gflags as flags
+
+import bigquery_client
+import bq
+import table_formatter
+
+
+class _FakeInsertClient(object):
+  """Records insertAll requests and returns the queued results."""
+
+  def __init__(self, *results):
+    self.requests = []
+    self._results = list(results)
+
+  def InsertTableRows(self, unused_reference, inserts):
+    self.requests.append(list(inserts))
+    if self._results:
+      return self._results.pop(0)
+    return {}
+
+
+class InsertSpoolTest(googletest.TestCase):
+
+  def setUp(self):
+    self.directory = tempfile.mkdtemp()
+    self.command = bq._Insert('insert', flags.FlagValues())
+    self.reference = {'projectId': 'prj', 'datasetId': 'ds',
+                      'tableId': 'tbl'}
+
+  def tearDown(self):
+    shutil.rmtree(self.directory)
+
+  def _SpoolRows(self, *lines):
+    """Spools lines as an insert that crashed before acknowledging them."""
+    spool = bigquery_client.InsertSpool(self.directory)
+    entries = []
+    for line in lines:
+      entry, _ = bq._SpoolEntry(
+          spool, bigquery_client.JsonToInsertEntry(None, line), line)
+      entries.append(entry)
+    spool.Sync()
+    spool.Close()
+    return entries
+
+  def testReplayKeepsInsertIds(self):
+    entries = self._SpoolRows('{"a":1}\n', '{"a":2}\n')
+    self.assertEquals(2, len(set(entry.insert_id for entry in entries)))
+
+    client = _FakeInsertClient()
+    spool = bigquery_client.InsertSpool(self.directory)
+    batcher = bq._InsertBatcher(client, self.reference, spool=spool)
+    self.command._ReplaySpool(batcher, spool)
+    batcher.Flush()
+    self.assertEquals([entries], client.requests)
+    self.assertEquals([], list(spool.ReadPending()))
+
+  def testRejectedRowsAreQuarantined(self):
+    self._SpoolRows('{"a":1}', '{"a":2}', '{"a":3}')
+    client = _FakeInsertClient({'insertErrors': [
+        {'index': 1, 'errors': [{'reason': 'invalid', 'message': 'bad'}]},
+        {'index': 2, 'errors': [{'reason': 'stopped', 'message': ''}]},
+        ]})
+    spool = bigquery_client.InsertSpool(self.directory)
+    batcher = bq._InsertBatcher(client, self.reference, spool=spool)
+    self.command._ReplaySpool(batcher, spool)
+    batcher.Flush()
+    self.assertTrue(batcher.errors)
+    self.assertEquals(['{"a":2}', '{"a":3}'],
+                      open(batcher.rejected_file).read().splitlines())
+    spool.Close()
+
+    spool = bigquery_client.InsertSpool(self.directory)
+    self.assertEquals([], list(spool.ReadPending()))
+
+  def testFollowQuarantinesInvalidLines(self):
+    path = os.path.join(self.directory, 'app.log')
+    with open(path, 'wb') as f:
+      f.write('{"a":1}\n{"a":\n{"a":2}\n')
+    follower = bq._FileFollower(path)
+    lines = follower.ReadLines()
+    follower.Close()
+    client = _FakeInsertClient()
+    spool = bigquery_client.InsertSpool(os.path.join(self.directory, 'spool'))
+    batcher = bq._InsertBatcher(client, self.reference, spool=spool)
+    self.command._AddFollowedLines(batcher, spool, lines)
+    batcher.Flush()
+    self.assertEquals([[{'a': 1}], [{'a': 2}]],
+                      [[entry.record for entry in request]
+                       for request in client.requests])
+    rejected = [name for name in os.listdir(spool.directory)
+                if name.endswith('.rejected')]
+    self.assertEquals(['{"a":'], open(os.path.join(
+        spool.directory, rejected[0])).read().splitlines())
+    # The checkpoint is past all three lines.
+    self.assertEquals(lines[2][1], spool.checkpoint)
+    spool.Close()
+    self.assertEquals([], list(bigquery_client.InsertSpool(
+        spool.directory).ReadPending()))
+
+
+class GetTablesToExtractTest(googletest.TestCase):
+
+  def _Get(self, identifier, dataset_id=''):
+    client = bigquery_client.BigqueryClient(
+        api='http', api_version='', project_id='prj', dataset_id=dataset_id)
+    dataset, pattern = bq._GetTablesToExtract(client, identifier)
+    return '%s:%s' % (dataset.projectId, dataset.datasetId), pattern
+
+  def testBareNameIsTableWithDefaultDataset(self):
+    self.assertEquals(('prj:ds', 'tbl'), self._Get('tbl', dataset_id='ds'))
+    self.assertEquals(('prj:other', '*'),
+                      self._Get('prj:other', dataset_id='ds'))
+    self.assertEquals(('prj:other', '*'),
+                      self._Get('other.*', dataset_id='ds'))
+
+  def testBareNameIsDatasetWithoutDefaultDataset(self):
+    self.assertEquals(('prj:ds', '*'), self._Get('ds'))
+
+  def testTablesAndPatterns(self):
+    self.assertEquals(('prj:ds', 'tbl'), self._Get('ds.tbl'))
+    self.assertEquals(('other:ds', 'events_2013*'),
+                      self._Get('other:ds.events_2013*'))
+
+
+class ColumnarFormatTest(googletest.TestCase):
+
+  def setUp(self):
+    self.format = bq.FLAGS.format
+    bq.FLAGS.format = 'columnar'
+
+  def tearDown(self):
+    bq.FLAGS.format = self.format
+
+  def testCommandsThatPrintRows(self):
+    bq._Head('head', flags.FlagValues())._ValidateFormat()
+    bq._Query('query', flags.FlagValues())._ValidateFormat()
+
+  def testOtherCommandsRejectColumnar(self):
+    for command in (bq._List('ls', flags.FlagValues()),
+                    bq._Show('show', flags.FlagValues()),
+                    bq._Extract('extract', flags.FlagValues()),
+                    bq._Repl('shell', flags.FlagValues())):
+      self.assertRaises(bq.app.UsageError, command._ValidateFormat)
+    self.assertEquals(1, bq._List('ls', flags.FlagValues()).Run(['ls']))
+
+
+class MetadataIndexCommandTest(googletest.TestCase):
+
+  def setUp(self):
+    self.directory = tempfile.mkdtemp()
+    self.client = bigquery_client.BigqueryClient(
+        api='http', api_version='', project_id='prj', dataset_id='ds',
+        metadata_index_file=os.path.join(self.directory, 'index'))
+    index = self.client.GetMetadataIndex()
+
+    def Table(dataset_id, table_id):
+      return {'tableReference': {'projectId': 'prj', 'datasetId': dataset_id,
+                                 'tableId': table_id}}
+    index.Update(
+        infos=[(('prj', 'ds', 'events'), Table('ds', 'events'))],
+        listings=[((), [{'projectReference': {'projectId': 'prj'}},
+                        {'projectReference': {'projectId': 'other'}}]),
+                  (('prj',), [{'datasetReference': {'projectId': 'prj',
+                                                    'datasetId': 'ds'}},
+                              {'datasetReference': {'projectId': 'prj',
+                                                    'datasetId': 'dw'}}]),
+                  (('prj', 'ds'), [Table('ds', 'logs')]),
+                  (('prj', 'dw'), [Table('dw', 'sales')])])
+    bq.Client.client = self.client
+    self.quiet = bq.FLAGS.quiet
+    bq.FLAGS.quiet = True
+
+  def tearDown(self):
+    bq.FLAGS.quiet = self.quiet
+    bq.Client.Delete()
+    shutil.rmtree(self.directory)
+
+  def testCompleteIdentifiers(self):
+    complete = lambda word: bq._CompleteIdentifier(self.client, word)
+    # Datasets of the default project and tables of the default dataset.
+    self.assertEquals(['ds', 'dw', 'events', 'logs', 'other:', 'prj:'],
+                      complete(''))
+    self.assertEquals(['dw'], complete('dw'))
+    self.assertEquals(['events'], complete('e'))
+    self.assertEquals(['dw.sales'], complete('dw.'))
+    self.assertEquals(['prj:ds', 'prj:dw'], complete('prj:d'))
+    self.assertEquals(['prj:ds.events', 'prj:ds.logs'], complete('prj:ds.'))
+    self.assertEquals(['other:'], complete('oth'))
+    self.assertEquals([], bq._CompleteIdentifier(
+        bigquery_client.BigqueryClient(api='http', api_version='',
+                                       project_id='prj'), 'd'))
+
+  def testClear(self):
+    bq._Index('index', flags.FlagValues()).RunWithArgs('clear')
+    self.assertEquals([], bq._CompleteIdentifier(self.client, ''))
+
+  def testRefresh(self):
+    references = []
+    self.client.RefreshMetadataIndex = lambda reference: (
+        references.append(reference) or
+        {'projects': 0, 'datasets': 1, 'tables': 0})
+    command = bq._Index('index', flags.FlagValues())
+    command.RunWithArgs('refresh', 'dw')
+    command.RunWithArgs('refresh', 'other:')
+    command.RunWithArgs('refresh')
+    self.assertEquals(['prj:dw', 'other', None],
+                      [reference and str(reference)
+                       for reference in references])
+
+  def testUsageErrors(self):
+    command = bq._Index('index', flags.FlagValues())
+    self.assertRaises(bq.app.UsageError, command.RunWithArgs, 'rebuild')
+    self.assertRaises(bq.app.UsageError, command.RunWithArgs, 'refresh',
+                      'ds.logs')
+    bq.Client.client = bigquery_client.BigqueryClient(
+        api='http', api_version='', project_id='prj')
+    self.assertRaises(bq.app.UsageError, command.RunWithArgs, 'clear')
+
+
+class _FakePager(object):
+  """A RowPager over rows [0, row_count) that records the pages read."""
+
+  page_rows = 5
+  schema = []
+  row_count = 20
+
+  def __init__(self):
+    self.pages = []
+
+  def GetPage(self, start_row):
+    self.pages.append(start_row)
+    return [[i] for i in xrange(start_row,
+                                min(start_row + self.page_rows,
+                                    self.row_count))]
+
+  def IsLastPage(self, start_row):
+    return start_row + self.page_rows >= self.row_count
+
+  def Close(self):
+    pass
+
+
+class PageRowsTest(googletest.TestCase):
+
+  def setUp(self):
+    self.client = bigquery_client.BigqueryClient(
+        api='http', api_version='', project_id='prj')
+    self.pager = _FakePager()
+    self.client.GetRowPager = lambda reference, page_rows: self.pager
+    self.printer = bq.Factory.ClientTablePrinter._TABLE_PRINTER
+    bq.Factory.ClientTablePrinter._TABLE_PRINTER = bq.TablePrinter(
+        PrintTable=lambda fields, rows: None)
+
+  def tearDown(self):
+    bq.Factory.ClientTablePrinter._TABLE_PRINTER = self.printer
+    del bq.raw_input
+
+  def _PageRows(self, start_row, *commands):
+    commands = list(commands) + ['q']
+    bq.raw_input = lambda prompt: commands.pop(0)
+    bq._PageRows(self.client, None, start_row)
+    return self.pager.pages
+
+  def testStartsAtStartRow(self):
+    self.assertEquals([7, 12, 7, 2, 0], self._PageRows(7, '', 'p', 'p', 'p'))
+
+  def testGoToRow(self):
+    self.assertEquals([0, 13, 18, 18], self._PageRows(0, 'g 13', 'n', 'n'))
+
+
+class FileFollowerTest(googletest.TestCase):
+
+  def setUp(self):
+    self.directory = tempfile.mkdtemp()
+    self.path = os.path.join(self.directory, 'app.log')
+
+  def tearDown(self):
+    shutil.rmtree(self.directory)
+
+  def _Append(self, data, path=None):
+    with open(path or self.path, 'ab') as f:
+      f.write(data)
+
+  def _ReadLines(self, follower):
+    return [line for line, _ in follower.ReadLines()]
+
+  def testReadsCompleteLines(self):
+    self._Append('a\nb')
+    follower = bq._FileFollower(self.path)
+    self.assertEquals(['a'], self._ReadLines(follower))
+    self.assertEquals([], self._ReadLines(follower))
+    self._Append('c\n')
+    self.assertEquals(['bc'], self._ReadLines(follower))
+    follower.Close()
+
+  def testRotation(self):
+    self._Append('a\n')
+    follower = bq._FileFollower(self.path)
+    self.assertEquals(['a'], self._ReadLines(follower))
+    self._Append('b\nc')
+    os.rename(self.path, self.path + '.1')
+    self._Append('d\n')
+    # The rest of the old file, including its unterminated last line, is
+    # read before the new file.
+    self.assertEquals(['b'], self._ReadLines(follower))
+    self.assertEquals(['c'], self._ReadLines(follower))
+    self.assertEquals([], self._ReadLines(follower))
+    self.assertEquals(['d'], self._ReadLines(follower))
+    follower.Close()
+
+  def testTruncation(self):
+    self._Append('a\nb\n')
+    follower = bq._FileFollower(self.path)
+    self.assertEquals(['a', 'b'], self._ReadLines(follower))
+    open(self.path, 'wb').close()
+    self.assertEquals([], self._ReadLines(follower))
+    self._Append('c\n')
+    self.assertEquals(['c'], self._ReadLines(follower))
+    follower.Close()
+
+  def testRestartFromCheckpoint(self):
+    self._Append('a\nb\nc\n')
+    follower = bq._FileFollower(self.path)
+    lines = follower.ReadLines()
+    follower.Close()
+    self.assertEquals(['a', 'b', 'c'], [line for line, _ in lines])
+
+    filename = os.path.join(self.directory, 'app.ckpt')
+    bq._WriteCheckpoint(filename, lines[0][1])
+    bq._WriteCheckpoint(filename, lines[1][1])
+    checkpoint = bq._ReadCheckpoint(filename)
+    self.assertEquals(lines[1][1], checkpoint)
+    self.assertEquals(['app.ckpt', 'app.log'], sorted(os.listdir(
+        self.directory)))
+    follower = bq._FileFollower(self.path, checkpoint)
+    self.assertEquals(['c'], self._ReadLines(follower))
+    follower.Close()
+
+    # A checkpoint of a file that has since been rotated away is ignored.
+    os.rename(self.path, self.path + '.1')
+    self._Append('d\n')
+    follower = bq._FileFollower(self.path, checkpoint)
+    self.assertEquals(['d'], self._ReadLines(follower))
+    follower.Close()
+
+  def testInvalidLinesAreSkipped(self):
+    self._Append('{"a":1}\nnot json\n{"a":2}\n')
+    follower = bq._FileFollower(self.path)
+    lines = follower.ReadLines()
+    follower.Close()
+    filename = os.path.join(self.directory, 'app.ckpt')
+    client = _FakeInsertClient()
+    batcher = bq._InsertBatcher(
+        client, {'projectId': 'prj', 'datasetId': 'ds', 'tableId': 'tbl'},
+        checkpoint_file=filename)
+    command = bq._Insert('insert', flags.FlagValues())
+    command._AddFollowedLines(batcher, None, lines)
+    batcher.Flush()
+    self.assertEquals([[{'a': 1}, {'a': 2}]],
+                      [[entry.record for entry in request]
+                       for request in client.requests])
+    self.assertEquals(lines[2][1], bq._ReadCheckpoint(filename))
+    # A checkpoint is also written past an invalid last line.
+    self._Append('not json either\n')
+    follower = bq._FileFollower(self.path, lines[2][1])
+    lines = follower.ReadLines()
+    follower.Close()
+    command._AddFollowedLines(batcher, None, lines)
+    self.assertEquals(lines[0][1], bq._ReadCheckpoint(filename))
+
+  def testInvalidCheckpoint(self):
+    self.assertEquals(None, bq._ReadCheckpoint(None))
+    filename = os.path.join(self.directory, 'app.ckpt')
+    self.assertEquals(None, bq._ReadCheckpoint(filename))
+    self._Append('{', filename)
+    self.assertRaises(bq.app.UsageError, bq._ReadCheckpoint, filename)
+
+
+class ExpandForPrintingTest(googletest.TestCase):
+
+  def _Expand(self, fields, rows, table_format='pretty'):
+    formatter = table_formatter.GetFormatter(table_format)
+    return [list(row) for row in bq._ExpandForPrinting(fields, rows, formatter)]
+
+  def _Reference(self, entry):
+    """Formats entry as the row-at-a-time implementation did."""
+    try:
+      return datetime.datetime.utcfromtimestamp(
+          float(entry)).isoformat(' ')[:19]
+    except (ValueError, OverflowError):
+      return '<date out of range for display>'
+
+  def testTimestampsMatchUtcfromtimestamp(self):
+    rand = random.Random(0)
+    entries = ['0', '1.5E9', '-1.5', '-0.0000004', '-0.0000006',
+               '1.9999995', '-1.9999995', '59.9999999', '-60.0000001',
+               '-62135596800', '253402300799', '253402300800', '1e30',
+               'nan', 'inf', '-2208988800.5']
+    entries.extend('%.6f' % (rand.uniform(-2e9, 4e9),) for _ in xrange(2000))
+    entries.extend(repr(rand.uniform(-1, 1) * 10 ** rand.randint(-7, 3))
+                   for _ in xrange(2000))
+    self.assertEquals(
+        [[self._Reference(entry)] for entry in entries],
+        self._Expand([{'name': 't', 'type': 'TIMESTAMP'}],
+                     [[entry] for entry in entries]))
+
+  def testTimestampRoundsAwayFromZero(self):
+    # Half a microsecond before the epoch rounds to the microsecond
+    # before it, as utcfromtimestamp does.
+    self.assertEquals(
+        [['1969-12-31 23:59:59'], ['1970-01-01 00:00:00']],
+        self._Expand([{'name': 't', 'type': 'TIMESTAMP'}],
+                     [['-0.0000005'], ['0.0000005']]))
+
+  def testTimestampsBefore1900(self):
+    # Unlike the strftime of the row-at-a-time implementation.
+    self.assertEquals([['1800-01-01 00:00:00']], self._Expand(
+        [{'name': 't', 'type': 'TIMESTAMP'}], [['-5364662400']]))
+
+  def testNulls(self):
+    fields = [{'name': 's', 'type': 'STRING'},
+              {'name': 't', 'type': 'TIMESTAMP'}]
+    rows = [[None, None], ['a', '0']]
+    for table_format, null in (('pretty', 'NULL'), ('csv', ''),
+                               ('json', None)):
+      self.assertEquals([[null, null], ['a', '1970-01-01 00:00:00']],
+                        self._Expand(fields, rows, table_format))
+
+  def testRepeatedAndNestedFields(self):
+    fields = [{'name': 'r', 'type': 'INTEGER', 'mode': 'REPEATED'},
+              {'name': 'n', 'type': 'RECORD', 'fields': [
+                  {'name': 't', 'type': 'TIMESTAMP'}]}]
+    rows = [[['1', '2'], {'t': '0'}], [[], None]]
+    self.assertEquals([[['1', '2'], {'t': '0'}], [[], 'NULL']],
+                      self._Expand(fields, rows))
+    self.assertEquals([[['1', '2'], {'t': '0'}], [[], None]],
+                      self._Expand(fields, rows, 'json'))
+
+  def testPages(self):
+    fields = [{'name': 'i', 'type': 'INTEGER'}]
+    rows = [[i] for i in xrange(bq._EXPAND_PAGE_ROWS * 2 + 1)]
+    rows[-1] = [None]
+    expanded = self._Expand(fields, iter(rows))
+    self.assertEquals(rows[:-1], expanded[:-1])
+    self.assertEquals(['NULL'], expanded[-1])
+
+
+if __name__ == '__main__':
+  googletest.main()
@@ -74,24 +74,103 @@ Machine Consumption
 
     [{"foo":"a","longer header":3},...,{"foo":"abc","longer header":123}]
 
+  NdjsonFormatter: Prints each row as a compact JSON object on its
+    own line, with keys in column order, as read by bq insert. Example:
+
+    {"foo":"a","longer header":3}
+    ...
+    {"foo":"abc","longer header":123}
+
+  ColumnarFormatter: Writes a binary file that stores each column
+    of a group of rows together, typed by the table's schema, so that
+    it can be read back through a memory map without parsing text.
+    ColumnarReader reads these files. The layout, with all numbers
+    little-endian, is:
+
+      "BQCOL1\0\0"
+      row group 1: for each column, its buffers
+      ...
+      row group N
+      footer: JSON describing the fields and the buffers
+      footer length: 8 byte unsigned integer
+      "BQCOL1\0\0"
+
+    Every column has a validity bitmap, with bit i set if value i is
+    not null, and a data buffer of 8 byte integers (INTEGER, and
+    TIMESTAMP in microseconds), 8 byte floats (FLOAT) or bytes
+    (BOOLEAN). Other columns are UTF-8 strings, with a buffer of n + 1
+    8 byte offsets into the data; nested and repeated values are stored
+    as JSON strings. Buffers start at multiples of 8 bytes.
+
 Additional formatters can be added by subclassing TableFormatter and
 overriding the following methods:
   __len__, __unicode__, AddRow, column_names, AddColumn
+
+Tables can also be written a row at a time, by calling Begin, then
+WriteRow for each row, then End. Formatters that can write a row as
+soon as it arrives override those methods; the others keep the rows
+and print the whole table from End.
 """
 
 
 
+import codecs
 import cStringIO
 import csv
 import itertools
 import json
+import mmap
+import os
+import re
+import struct
 import sys
+import unicodedata
 
 
 class FormatterException(Exception):
   pass
 
 
+# Characters below U+0300 all take one column of a terminal.
+_MAYBE_NOT_NARROW = re.compile(u'[^\x00-\u02ff]')
+_PADDING = [u' ' * n for n in xrange(128)]
+_CHAR_WIDTHS = {}
+
+
+def _DisplayWidth(text):
+  """Return the number of columns text takes in a terminal.
+
+  East Asian wide and fullwidth characters take two columns, and
+  combining characters none.
+
+  Args:
+    text: A single line of text.
+
+  Returns:
+    The width of text.
+  """
+  if not _MAYBE_NOT_NARROW.search(text):
+    return len(text)
+  width = 0
+  for c in text:
+    char_width = _CHAR_WIDTHS.get(c)
+    if char_width is None:
+      if unicodedata.combining(c):
+        char_width = 0
+      elif unicodedata.east_asian_width(c) in ('W', 'F'):
+        char_width = 2
+      else:
+        char_width = 1
+      _CHAR_WIDTHS[c] = char_width
+    width += char_width
+  return width
+
+
+def _Padding(width):
+  """Return width spaces."""
+  return _PADDING[width] if width < len(_PADDING) else u' ' * width
+
+
 class TableFormatter(object):
   """Interface for table formatters."""
 
@@ -120,12 +199,45 @@ class TableFormatter(object):
   def __unicode__(self):
     raise NotImplementedError('__unicode__ must be implemented by subclass')
 
-  def Print(self):
+  def Print(self, output=None):
     if self:
+      output = output or sys.stdout
       # TODO(user): Make encoding a customizable attribute on
       # the TableFormatter.
-      encoding = sys.stdout.encoding or 'utf8'
-      print unicode(self).encode(encoding, 'backslashreplace')
+      encoding = getattr(output, 'encoding', None) or 'utf8'
+      print >>output, unicode(self).encode(encoding, 'backslashreplace')
+
+  def Begin(self, output=None):
+    """Begin writing this table to output, a row at a time.
+
+    The columns must be added before Begin. Rows are then passed to
+    WriteRow, and End finishes the table. By default the rows are kept
+    and End prints the whole table.
+
+    Args:
+      output: (optional, default: sys.stdout) File to write to.
+    """
+    self._output = output or sys.stdout
+
+  def WriteRow(self, row):
+    """Write a row (an iterable) to the output given to Begin."""
+    self.AddRow(row)
+
+  def WriteRows(self, rows):
+    """Write all rows to the output given to Begin."""
+    for row in rows:
+      self.WriteRow(row)
+
+  def End(self):
+    """Finish writing the table started by Begin."""
+    self.Print(self._output)
+
+  def _Write(self, text):
+    """Write text to the output given to Begin, in its encoding."""
+    if isinstance(text, str):
+      text = text.decode('utf8')
+    encoding = getattr(self._output, 'encoding', None) or 'utf8'
+    self._output.write(text.encode(encoding, 'backslashreplace'))
 
   def AddRow(self, row):
     """Add a new row (an iterable) to this formatter."""
@@ -177,12 +289,22 @@ class PrettyFormatter(TableFormatter):
       junction_char: (default: +) Character to use for table junctions.
       horizontal_char: (default: -) Character to use for horizontal lines.
       vertical_char: (default: |) Character to use for vertical lines.
+      max_column_width: (default: None) If set, longer entries are
+        abbreviated to this width.
+      sample_rows: (default: 1000) When the table is written a row at a
+        time, the number of rows kept to size the columns before any
+        are written.
     """
     super(PrettyFormatter, self).__init__(**kwds)
 
     self.junction_char = kwds.get('junction_char', '+')
     self.horizontal_char = kwds.get('horizontal_char', '-')
     self.vertical_char = kwds.get('vertical_char', '|')
+    self.max_column_width = kwds.get('max_column_width')
+    self.sample_rows = kwds.get('sample_rows', 1000)
+    self._streaming = False
+    # Templates for single-line rows, by column alignments.
+    self._line_templates = {}
 
     self.rows = []
     self.row_heights = []
@@ -197,7 +319,7 @@ class PrettyFormatter(TableFormatter):
   def __unicode__(self):
     if self or not self.skip_header_when_empty:
       lines = itertools.chain(
-          self.FormatHeader(), self.FormatRows(), self.FormatHrule())
+          self.FormatHeader(), self.FormatRows(), self.FormatFooter())
     else:
       lines = []
     return '\n'.join(lines)
@@ -242,9 +364,35 @@ class PrettyFormatter(TableFormatter):
 
   @staticmethod
   def Abbreviate(s, width):
-    """Abbreviate a string to at most width characters."""
+    """Abbreviate a string to at most width columns."""
+    if _DisplayWidth(s) <= width:
+      return s
     suffix = '.' * min(width, 3)
-    return s if len(s) <= width else s[:width - len(suffix)] + suffix
+    if not _MAYBE_NOT_NARROW.search(s):
+      return s[:width - len(suffix)] + suffix
+    kept = 0
+    kept_width = 0
+    for c in s:
+      kept_width += _DisplayWidth(c)
+      if kept_width > width - len(suffix):
+        break
+      kept += 1
+    return s[:kept] + suffix
+
+  @staticmethod
+  def _PadLine(line, width, align):
+    """Pad a line that fits in width columns to exactly width + 2."""
+    padding = width - _DisplayWidth(line)
+    if align == 'l':
+      return u' %s%s ' % (line, _Padding(padding))
+    elif align == 'r':
+      return u' %s%s ' % (_Padding(padding), line)
+    elif align == 'c':
+      left_padding, right_padding = PrettyFormatter.CenteredPadding(
+          width, width - padding)
+      return u' %s%s%s ' % (
+          _Padding(left_padding), line, _Padding(right_padding))
+    raise FormatterException('Unknown alignment: %s' % (align,))
 
   @staticmethod
   def FormatCell(entry, cell_width, cell_height=1, align='c', valign='t'):
@@ -281,33 +429,24 @@ class PrettyFormatter(TableFormatter):
     if len(entry_lines) > cell_height:
       raise FormatterException('Too many lines (%s) for a cell of size %s' % (
           len(entry_lines), cell_height))
+    blank_line = _Padding(cell_width + 2)
     if valign == 't':
       top_lines = []
-      bottom_lines = itertools.repeat(' ' * (cell_width + 2),
+      bottom_lines = itertools.repeat(blank_line,
                                       cell_height - len(entry_lines))
     elif valign == 'c':
       top_padding, bottom_padding = PrettyFormatter.CenteredPadding(
           cell_height, len(entry_lines))
-      top_lines = itertools.repeat(' ' * (cell_width + 2), top_padding)
-      bottom_lines = itertools.repeat(' ' * (cell_width + 2), bottom_padding)
+      top_lines = itertools.repeat(blank_line, top_padding)
+      bottom_lines = itertools.repeat(blank_line, bottom_padding)
     elif valign == 'b':
       bottom_lines = []
-      top_lines = itertools.repeat(' ' * (cell_width + 2),
+      top_lines = itertools.repeat(blank_line,
                                    cell_height - len(entry_lines))
     else:
       raise ValueError('Unknown value for valign: %s' % (valign,))
-    content_lines = []
-    for line in entry_lines:
-      if align == 'c':
-        left_padding, right_padding = PrettyFormatter.CenteredPadding(
-            cell_width, len(line))
-        content_lines.append(' %s%s%s ' % (
-            ' ' * left_padding, line, ' ' * right_padding))
-      elif align in ('l', 'r'):
-        fmt = ' %*s ' if align == 'r' else ' %-*s '
-        content_lines.append(fmt % (cell_width, line))
-      else:
-        raise FormatterException('Unknown alignment: %s' % (align,))
+    content_lines = [PrettyFormatter._PadLine(line, cell_width, align)
+                     for line in entry_lines]
     return itertools.chain(top_lines, content_lines, bottom_lines)
 
   def FormatRow(self, entries, row_height,
@@ -333,18 +472,55 @@ class PrettyFormatter(TableFormatter):
     """
     column_alignments = column_alignments or self.column_alignments
     column_widths = column_widths or self.column_widths
-
-    # pylint: disable=g-long-lambda
-    curried_format = lambda entry, width, align: self.__class__.FormatCell(
-        unicode(entry), width, cell_height=row_height, align=align)
-    printed_rows = itertools.izip(*itertools.imap(
-        curried_format, entries, column_widths, column_alignments))
+    texts = [entry if isinstance(entry, unicode) else unicode(entry)
+             for entry in entries]
+    if row_height == 1 and not any(u'\n' in text for text in texts):
+      return [self._FormatLine(texts, column_widths, column_alignments)]
+
+    format_cell = self.__class__.FormatCell
+    printed_rows = itertools.izip(*[
+        format_cell(text, width, cell_height=row_height, align=align)
+        for text, width, align
+        in itertools.izip(texts, column_widths, column_alignments)])
     return (self.vertical_char.join(itertools.chain([''], cells, ['']))
             for cells in printed_rows)
 
+  def _FormatLine(self, texts, column_widths, column_alignments):
+    """Format a row of single-line entries as one line."""
+    column_alignments = tuple(column_alignments)
+    template = self._line_templates.get(column_alignments)
+    if template is None:
+      # Each column has a slot for the entry and each padding it gets.
+      cells = []
+      for align in column_alignments:
+        if align not in ('l', 'c', 'r'):
+          raise FormatterException('Unknown alignment: %s' % (align,))
+        cells.append(u' %s%s%s ' if align == 'c' else u' %s%s ')
+      vertical_char = self.vertical_char.replace('%', '%%')
+      template = u''.join((vertical_char, vertical_char.join(cells),
+                           vertical_char))
+      self._line_templates[column_alignments] = template
+    values = []
+    for text, width, align in itertools.izip(
+        texts, column_widths, column_alignments):
+      padding = width - _DisplayWidth(text)
+      if padding < 0:
+        text = self.Abbreviate(text, width)
+        padding = width - _DisplayWidth(text)
+      if align == 'l':
+        values.extend((text, _Padding(padding)))
+      elif align == 'r':
+        values.extend((_Padding(padding), text))
+      else:
+        left_padding, right_padding = self.CenteredPadding(
+            width, width - padding)
+        values.extend(
+            (_Padding(left_padding), text, _Padding(right_padding)))
+    return template % tuple(values)
+
   def HeaderLines(self):
     """Return an iterator over the row(s) for the column names."""
-    aligns = itertools.repeat('c')
+    aligns = ['c'] * len(self.column_names)
     return self.FormatRow(self.column_names, self.header_height,
                           column_alignments=aligns)
 
@@ -359,29 +535,105 @@ class PrettyFormatter(TableFormatter):
     return itertools.chain(
         self.FormatHrule(), self.HeaderLines(), self.FormatHrule())
 
+  def FormatFooter(self):
+    """Return a list of the lines that close this table."""
+    return self.FormatHrule()
+
   def FormatRows(self):
     """Return an iterator over all the rows in this table."""
     return itertools.chain(*itertools.imap(
         self.FormatRow, self.rows, self.row_heights))
 
-  def AddRow(self, row):
-    """Add a row to this table.
+  def _Measure(self, row):
+    """Return the height of row and the width of each of its entries.
 
     Args:
       row: A list of length equal to the number of columns in this table.
 
+    Returns:
+      A tuple of the number of lines and the list of column widths
+      that row needs.
+
     Raises:
       FormatterException: If the row length is invalid.
     """
     if len(row) != len(self.column_names):
       raise FormatterException('Invalid row length: %s' % (len(row),))
-    split_rows = [unicode(entry).split('\n') for entry in row]
-    self.row_heights.append(max(len(lines) for lines in split_rows))
-    column_widths = (max(len(line) for line in entry) for entry in split_rows)
+    texts = [entry if isinstance(entry, unicode) else unicode(entry)
+             for entry in row]
+    if any(u'\n' in text for text in texts):
+      split_rows = [text.split(u'\n') for text in texts]
+      height = max(len(lines) for lines in split_rows)
+      widths = [max(_DisplayWidth(line) for line in lines)
+                for lines in split_rows]
+    else:
+      height = 1
+      widths = [_DisplayWidth(text) for text in texts]
+    if self.max_column_width:
+      widths = [min(width, self.max_column_width) for width in widths]
+    return height, widths
+
+  def AddRow(self, row):
+    """Add a row to this table.
+
+    Args:
+      row: A list of length equal to the number of columns in this table.
+
+    Raises:
+      FormatterException: If the row length is invalid.
+    """
+    row_height, column_widths = self._Measure(row)
+    self.row_heights.append(row_height)
     self.column_widths = [max(width, current) for width, current
                           in itertools.izip(column_widths, self.column_widths)]
     self.rows.append(row)
 
+  def WriteRow(self, row):
+    """Write a row, once the first sample_rows rows have sized the columns.
+
+    Later rows are written as they arrive. If one is too wide for a
+    column, the table is closed and started again under a new header
+    with wider columns, so only the sample is ever kept.
+
+    Args:
+      row: A list of length equal to the number of columns in this table.
+
+    Raises:
+      FormatterException: If the row length is invalid.
+    """
+    if not self._streaming:
+      self.AddRow(row)
+      if len(self) >= self.sample_rows:
+        self._WriteSample()
+      return
+    row_height, column_widths = self._Measure(row)
+    if any(width > current for width, current
+           in itertools.izip(column_widths, self.column_widths)):
+      lines = list(self.FormatFooter())
+      self.column_widths = [
+          max(width, current) for width, current
+          in itertools.izip(column_widths, self.column_widths)]
+      self._WriteLines(itertools.chain(lines, self.FormatHeader()))
+    self._WriteLines(self.FormatRow(row, row_height))
+
+  def End(self):
+    # As with Print, nothing is written for a table without rows.
+    if not self._streaming and self:
+      self._WriteSample()
+    if self._streaming:
+      self._WriteLines(self.FormatFooter())
+    self._streaming = False
+
+  def _WriteSample(self):
+    """Write the header and the rows kept so far, and stop keeping rows."""
+    self._WriteLines(itertools.chain(self.FormatHeader(), self.FormatRows()))
+    self.rows = []
+    self.row_heights = []
+    self._streaming = True
+
+  def _WriteLines(self, lines):
+    self._Write(u''.join(line + u'\n' for line in lines))
+
   def AddColumn(self, column_name, align='l', **kwds):
     """Add a column to this table.
 
@@ -399,7 +651,10 @@ class PrettyFormatter(TableFormatter):
     if align not in ('l', 'c', 'r'):
       raise FormatterException('Invalid column alignment: %s' % (align,))
     lines = column_name.split('\n')
-    self.column_widths.append(max(len(line) for line in lines))
+    width = max(_DisplayWidth(line) for line in lines)
+    if self.max_column_width:
+      width = min(width, self.max_column_width)
+    self.column_widths.append(width)
     self.column_alignments.append(align)
     self.column_names.append(column_name)
     self.header_height = max(len(lines), self.header_height)
@@ -419,17 +674,14 @@ class SparsePrettyFormatter(PrettyFormatter):
     default_kwds.update(kwds)
     super(SparsePrettyFormatter, self).__init__(**default_kwds)
 
-  def __unicode__(self):
-    if self or not self.skip_header_when_empty:
-      lines = itertools.chain(self.FormatHeader(), self.FormatRows())
-    else:
-      lines = []
-    return '\n'.join(lines)
-
   def FormatHeader(self):
     """Return an iterator over the header lines for this table."""
     return itertools.chain(self.HeaderLines(), self.FormatHrule())
 
+  def FormatFooter(self):
+    """Return a list of the lines that close this table, which is empty."""
+    return []
+
 
 class CsvFormatter(TableFormatter):
   """Formats output as CSV with header lines.
@@ -445,21 +697,51 @@ class CsvFormatter(TableFormatter):
     self._header = []
     self._table = csv.writer(
         self._buffer, quoting=csv.QUOTE_MINIMAL, lineterminator='\n')
+    self._row_count = 0
 
   def __nonzero__(self):
-    return bool(self._buffer.tell())
+    return bool(self._row_count)
 
   def __len__(self):
-    return len(unicode(self).splitlines())
+    # The number of rows, as for the other formatters. Before, this was
+    # the number of lines of the text, which also counted the header and
+    # each extra line of a multi-line value.
+    return self._row_count
 
   def __unicode__(self):
+    return self._GetValue().decode('utf8')
+
+  def _GetValue(self):
+    """Return the table as UTF-8, without trailing whitespace."""
     if self or not self.skip_header_when_empty:
-      lines = [','.join(self._header), self._buffer.getvalue()]
-    else:
-      lines = []
-    # Note that we need to explicitly decode here to work around
-    # the fact that the CSV module does not work with unicode.
-    return '\n'.join(line.decode('utf8') for line in lines).rstrip()
+      # Note that the CSV module does not work with unicode, so the
+      # rows are kept as UTF-8.
+      return (self._EncodeHeader() + self._buffer.getvalue()).rstrip()
+    return ''
+
+  def _EncodeHeader(self):
+    header = ','.join(self._header)
+    if isinstance(header, unicode):
+      header = header.encode('utf8')
+    return header + '\n'
+
+  def Print(self, output=None):
+    """Print the table, writing the UTF-8 rows as they are when possible."""
+    if not self:
+      return
+    output = output or sys.stdout
+    encoding = getattr(output, 'encoding', None) or 'utf8'
+    if codecs.lookup(encoding).name != 'utf-8':
+      super(CsvFormatter, self).Print(output)
+      return
+    value = self._buffer.getvalue()
+    end = len(value)
+    while end and value[end - 1].isspace():
+      end -= 1
+    output.write(self._EncodeHeader())
+    # A buffer avoids copying all but the trailing whitespace.
+    output.write(buffer(value, 0, end))
+    output.write('\n')
 
   @property
   def column_names(self):
@@ -474,6 +756,31 @@ class CsvFormatter(TableFormatter):
   def AddRow(self, row):
     self._table.writerow([unicode(entry).encode('utf8', 'backslashreplace')
                           for entry in row])
+    self._row_count += 1
+
+  def Begin(self, output=None):
+    super(CsvFormatter, self).Begin(output)
+    # The csv module writes UTF-8, which is passed straight through to a
+    # UTF-8 output.
+    stream = self._output
+    encoding = getattr(stream, 'encoding', None) or 'utf8'
+    if codecs.lookup(encoding).name != 'utf-8':
+      stream = _Utf8Transcoder(stream, encoding)
+    self._stream = stream
+    self._stream_table = csv.writer(
+        stream, quoting=csv.QUOTE_MINIMAL, lineterminator='\n')
+    self._rows_written = 0
+
+  def WriteRow(self, row):
+    # As with Print, nothing is written for a table without rows.
+    if not self._rows_written:
+      self._stream.write(self._EncodeHeader())
+    self._stream_table.writerow(
+        [unicode(entry).encode('utf8', 'backslashreplace') for entry in row])
+    self._rows_written += 1
+
+  def End(self):
+    pass
 
 
 class JsonFormatter(TableFormatter):
@@ -505,6 +812,22 @@ class JsonFormatter(TableFormatter):
       raise FormatterException('Invalid row: %s' % (row,))
     self._table.append(dict(zip(self._field_names, row)))
 
+  def Begin(self, output=None):
+    super(JsonFormatter, self).Begin(output)
+    self._rows_written = 0
+
+  def WriteRow(self, row):
+    if len(row) != len(self._field_names):
+      raise FormatterException('Invalid row: %s' % (row,))
+    self._Write((',' if self._rows_written else '[') + json.dumps(
+        dict(zip(self._field_names, row)), separators=(',', ':'),
+        ensure_ascii=False))
+    self._rows_written += 1
+
+  def End(self):
+    if self._rows_written:
+      self._Write(']\n')
+
 
 class PrettyJsonFormatter(JsonFormatter):
   """Formats output in human-legible JSON."""
@@ -512,6 +835,305 @@ class PrettyJsonFormatter(JsonFormatter):
   def __unicode__(self):
     return json.dumps(self._table, sort_keys=True, indent=2, ensure_ascii=False)
 
+  # The whole table is printed by End, as it is indented as one value.
+
+  def Begin(self, output=None):
+    TableFormatter.Begin(self, output)
+
+  def WriteRow(self, row):
+    TableFormatter.WriteRow(self, row)
+
+  def End(self):
+    TableFormatter.End(self)
+
+
+class NdjsonFormatter(JsonFormatter):
+  """Formats output as newline-delimited JSON, a row per line."""
+
+  _ENCODE = json.JSONEncoder(ensure_ascii=False).encode
+
+  def __init__(self, **kwds):
+    super(NdjsonFormatter, self).__init__(**kwds)
+    self._template = None
+
+  def __unicode__(self):
+    return u'\n'.join(self._table)
+
+  def AddColumn(self, column_name, **kwds):
+    super(NdjsonFormatter, self).AddColumn(column_name, **kwds)
+    self._template = None
+
+  def _FormatRow(self, row):
+    """Return row as a line of JSON, without building a dict for it."""
+    if len(row) != len(self._field_names):
+      raise FormatterException('Invalid row: %s' % (row,))
+    if self._template is None:
+      # The keys are encoded once, leaving a slot for each value.
+      self._template = u'{%s}' % (u','.join(
+          u'%s:%%s' % (self._ENCODE(name).replace(u'%', u'%%'),)
+          for name in self._field_names),)
+    return self._template % tuple(self._ENCODE(entry) for entry in row)
+
+  def AddRow(self, row):
+    self._table.append(self._FormatRow(row))
+
+  def WriteRow(self, row):
+    self._Write(self._FormatRow(row) + u'\n')
+
+  def End(self):
+    pass
+
+
+_COLUMNAR_MAGIC = 'BQCOL1\0\0'
+
+# For each encoding of fixed width values, the struct format character of
+# a value and a function from a value as read from the service to it.
+_COLUMNAR_ENCODINGS = {
+    'int64': ('q', int),
+    'float64': ('d', float),
+    'bool': ('B', lambda value: value in (True, 'true', u'true')),
+    'timestamp_us': ('q', lambda value: int(round(float(value) * 1000000))),
+    }
+_COLUMNAR_FIELD_ENCODINGS = {
+    'INTEGER': 'int64',
+    'FLOAT': 'float64',
+    'BOOLEAN': 'bool',
+    'TIMESTAMP': 'timestamp_us',
+    }
+
+
+def _ColumnarString(value):
+  """Return value as UTF-8, with nested and repeated values as JSON."""
+  if isinstance(value, unicode):
+    return value.encode('utf8')
+  elif isinstance(value, str):
+    return value
+  elif isinstance(value, (dict, list)):
+    return json.dumps(value, separators=(',', ':'), ensure_ascii=False,
+                      sort_keys=True).encode('utf8')
+  return unicode(value).encode('utf8')
+
+
+class ColumnarFormatter(TableFormatter):
+  """Formats output as a binary columnar file; see ColumnarReader."""
+
+  def __init__(self, **kwds):
+    """Initialize a new ColumnarFormatter.
+
+    Keyword arguments:
+      row_group_rows: (default: 65536) The number of rows in each row
+        group, which are held in memory until the group is written.
+    """
+    super(ColumnarFormatter, self).__init__(**kwds)
+    self.row_group_rows = kwds.get('row_group_rows', 65536)
+    self._fields = []
+    self._columns = []
+    self._group_rows = 0
+    self._row_count = 0
+    self._row_groups = []
+    # Buffers of finished row groups that haven't been written yet.
+    self._chunks = []
+    self._offset = len(_COLUMNAR_MAGIC)
+
+  def __len__(self):
+    return self._row_count
+
+  def __unicode__(self):
+    raise FormatterException('Columnar output is binary; use Print.')
+
+  @property
+  def column_names(self):
+    return [field['name'] for field in self._fields]
+
+  def AddField(self, field):
+    if self:
+      raise FormatterException(
+          'Cannot add a new column to an initialized table')
+    field = dict((key, field[key]) for key in ('name', 'type', 'mode')
+                 if key in field)
+    field.setdefault('type', 'STRING')
+    self._fields.append(field)
+    self._columns.append([])
+
+  def AddColumn(self, column_name, **kwds):
+    self.AddField({'name': column_name})
+
+  def AddRow(self, row):
+    if len(row) != len(self._fields):
+      raise FormatterException('Invalid row: %s' % (row,))
+    for column, entry in itertools.izip(self._columns, row):
+      column.append(entry)
+    self._group_rows += 1
+    self._row_count += 1
+    if self._group_rows >= self.row_group_rows:
+      self._EncodeRowGroup()
+
+  def Print(self, output=None):
+    """Write the whole file to output, which must accept bytes."""
+    self._output = output or sys.stdout
+    self._output.write(_COLUMNAR_MAGIC)
+    self.End()
+
+  def Begin(self, output=None):
+    super(ColumnarFormatter, self).Begin(output)
+    self._output.write(_COLUMNAR_MAGIC)
+
+  def WriteRow(self, row):
+    self.AddRow(row)
+    self._WriteChunks()
+
+  def End(self):
+    # Unlike the text formats, a table without rows is still written,
+    # so that readers get its schema.
+    if self._group_rows:
+      self._EncodeRowGroup()
+    self._WriteChunks()
+    footer = json.dumps({
+        'fields': self._fields,
+        'numRows': self._row_count,
+        'rowGroups': self._row_groups,
+        }, separators=(',', ':'))
+    self._output.write(footer)
+    self._output.write(struct.pack('<Q', len(footer)))
+    self._output.write(_COLUMNAR_MAGIC)
+
+  def _WriteChunks(self):
+    for chunk in self._chunks:
+      self._output.write(chunk)
+    self._chunks = []
+
+  def _AddBuffer(self, data):
+    """Queue data to be written, and return its [offset, length]."""
+    location = [self._offset, len(data)]
+    padding = -len(data) % 8
+    self._chunks.append(data)
+    if padding:
+      self._chunks.append('\0' * padding)
+    self._offset += len(data) + padding
+    return location
+
+  def _EncodeRowGroup(self):
+    """Encode the rows added since the last row group as a new one."""
+    count = self._group_rows
+    columns = []
+    for field, values in itertools.izip(self._fields, self._columns):
+      validity = bytearray((count + 7) // 8)
+      for i, entry in enumerate(values):
+        if entry is not None:
+          validity[i >> 3] |= 1 << (i & 7)
+      encoding = 'utf8'
+      if field.get('mode', 'NULLABLE').upper() != 'REPEATED':
+        encoding = _COLUMNAR_FIELD_ENCODINGS.get(field['type'].upper(), 'utf8')
+      column = {'encoding': encoding,
+                'validity': self._AddBuffer(str(validity))}
+      if encoding == 'utf8':
+        strings = [_ColumnarString(entry) for entry in values]
+        offsets = [0]
+        for string in strings:
+          offsets.append(offsets[-1] + len(string))
+        column['offsets'] = self._AddBuffer(
+            struct.pack('<%dq' % (len(offsets),), *offsets))
+        column['data'] = self._AddBuffer(''.join(strings))
+      else:
+        format_char, convert = _COLUMNAR_ENCODINGS[encoding]
+        column['data'] = self._AddBuffer(struct.pack(
+            '<%d%s' % (count, format_char),
+            *[0 if entry is None else convert(entry) for entry in values]))
+      columns.append(column)
+    self._row_groups.append({'numRows': count, 'columns': columns})
+    self._columns = [[] for _ in self._fields]
+    self._group_rows = 0
+
+
+class ColumnarReader(object):
+  """Reads a file written by ColumnarFormatter through a memory map.
+
+  Only the buffers of the columns that are read are paged in.
+  """
+
+  def __init__(self, filename):
+    """Open filename and read its footer.
+
+    Args:
+      filename: The name of a file written by ColumnarFormatter.
+
+    Raises:
+      FormatterException: If the file is not a columnar file.
+    """
+    self._file = open(filename, 'rb')
+    size = os.fstat(self._file.fileno()).st_size
+    trailer_size = 8 + len(_COLUMNAR_MAGIC)
+    if size < len(_COLUMNAR_MAGIC) + trailer_size:
+      self._file.close()
+      raise FormatterException('Not a columnar file: %s' % (filename,))
+    self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+    (footer_length,) = struct.unpack_from('<Q', self._map, size - trailer_size)
+    if (self._map[:len(_COLUMNAR_MAGIC)] != _COLUMNAR_MAGIC or
+        self._map[-len(_COLUMNAR_MAGIC):] != _COLUMNAR_MAGIC or
+        footer_length > size - len(_COLUMNAR_MAGIC) - trailer_size):
+      self.Close()
+      raise FormatterException('Not a columnar file: %s' % (filename,))
+    footer_start = size - trailer_size - footer_length
+    footer = json.loads(self._map[footer_start:footer_start + footer_length])
+    self.fields = footer['fields']
+    self.num_rows = footer['numRows']
+    self._row_groups = footer['rowGroups']
+
+  def Close(self):
+    self._map.close()
+    self._file.close()
+
+  def ReadColumn(self, name):
+    """Return the values of the column called name, in row order.
+
+    INTEGER values are read as ints, FLOAT as floats, BOOLEAN as bools,
+    TIMESTAMP as float seconds since the epoch, and the rest as unicode.
+
+    Args:
+      name: The name of the column.
+
+    Returns:
+      A list of the column's values, with None for nulls.
+
+    Raises:
+      KeyError: If there is no such column.
+    """
+    index = [field['name'] for field in self.fields].index(name)
+    values = []
+    for row_group in self._row_groups:
+      values.extend(self._ReadColumnChunk(
+          row_group['numRows'], row_group['columns'][index]))
+    return values
+
+  def ReadRows(self):
+    """Yield each row as a list of values, a row group at a time."""
+    for row_group in self._row_groups:
+      columns = [self._ReadColumnChunk(row_group['numRows'], column)
+                 for column in row_group['columns']]
+      for row in itertools.izip(*columns):
+        yield list(row)
+
+  def _ReadColumnChunk(self, count, column):
+    start, length = column['validity']
+    validity = bytearray(self._map[start:start + length])
+    encoding = column['encoding']
+    start = column['data'][0]
+    if encoding == 'utf8':
+      offsets = struct.unpack_from(
+          '<%dq' % (count + 1,), self._map, column['offsets'][0])
+      values = [self._map[start + begin:start + end].decode('utf8')
+                for begin, end in itertools.izip(offsets, offsets[1:])]
+    else:
+      format_char, _ = _COLUMNAR_ENCODINGS[encoding]
+      values = struct.unpack_from(
+          '<%d%s' % (count, format_char), self._map, start)
+      if encoding == 'bool':
+        values = [bool(value) for value in values]
+      elif encoding == 'timestamp_us':
+        values = [value / 1e6 for value in values]
+    return [value if validity[i >> 3] & (1 << (i & 7)) else None
+            for i, value in enumerate(values)]
+
 
 class NullFormatter(TableFormatter):
   """Formatter that prints no output at all."""
@@ -545,20 +1167,33 @@ class NullFormatter(TableFormatter):
     self._column_names.append(column_name)
 
 
-def GetFormatter(table_format):
-  """Map a format name to a TableFormatter object."""
-  if table_format == 'csv':
-    table_formatter = CsvFormatter()
-  elif table_format == 'pretty':
-    table_formatter = PrettyFormatter()
-  elif table_format == 'json':
-    table_formatter = JsonFormatter()
-  elif table_format == 'prettyjson':
-    table_formatter = PrettyJsonFormatter()
-  elif table_format == 'sparse':
-    table_formatter = SparsePrettyFormatter()
-  elif table_format == 'none':
-    table_formatter = NullFormatter()
-  else:
+class _Utf8Transcoder(object):
+  """Writes UTF-8 text to a file in another encoding."""
+
+  def __init__(self, output, encoding):
+    self._output = output
+    self._encoding = encoding
+
+  def write(self, data):  # pylint: disable=g-bad-name
+    self._output.write(
+        data.decode('utf8').encode(self._encoding, 'backslashreplace'))
+
+
+# The TableFormatter class of each format name accepted by GetFormatter.
+FORMATTERS = {
+    'csv': CsvFormatter,
+    'pretty': PrettyFormatter,
+    'json': JsonFormatter,
+    'ndjson': NdjsonFormatter,
+    'prettyjson': PrettyJsonFormatter,
+    'sparse': SparsePrettyFormatter,
+    'columnar': ColumnarFormatter,
+    'none': NullFormatter,
+    }
+
+
+def GetFormatter(table_format, **kwds):
+  """Map a format name to a TableFormatter object, built with kwds."""
+  if table_format not in FORMATTERS:
     raise FormatterException('Unknown format: %s' % table_format)
-  return table_formatter
+  return FORMATTERS[table_format](**kwds)
@@ -0,0 +1,343 @@
+#!/usr/bin/env python
+# Copyright 2012 Google Inc. All Rights Reserved.
+
+"""Benchmarks of the table formatters on synthetic tables.
+
+Every format of table_formatter.GetFormatter is timed on each table, in
+its own process, after the rows are normalized by bq._ExpandForPrinting
+as bq does before printing them. For example
+  table_formatter_benchmark.py --scale=10 --output=/tmp/formatters.json
+prints a table of results and writes them as JSON, to compare the
+results of two releases. With --baseline, the formatters of an older
+table_formatter.py are timed alongside, as format@baseline.
+
+The rows are generated a chunk at a time as they are consumed, so that
+the tables need not fit in memory. Each phase times only its own work on
+each chunk: Expand leaves out generating the rows, and Write and AddRows
+leave out generating and expanding them.
+
+The results of the benchmarks recorded in the benchmarks directory came
+from the commands given in their "command".
+"""
+
+
+
+import imp
+import itertools
+import json
+import os
+import platform
+import random
+import resource
+import sys
+import time
+
+from google.apputils import app
+import gflags as flags
+
+import bq
+import table_formatter
+
+flags.DEFINE_integer(
+    'scale', 1,
+    'Scale of the tables: the tall table has 100 * scale rows, and the '
+    'others 20 * scale.',
+    lower_bound=1)
+flags.DEFINE_integer(
+    'rows', None,
+    'If set, the number of rows of every table, instead of one set by '
+    '--scale.',
+    lower_bound=1)
+flags.DEFINE_list(
+    'formats', sorted(table_formatter.FORMATTERS),
+    'The formats to benchmark.')
+flags.DEFINE_list(
+    'tables', None,
+    'The tables to benchmark, out of wide, tall, unicode, multiline and '
+    'timestamps. Defaults to all of them.')
+flags.DEFINE_string(
+    'baseline', None,
+    'An older table_formatter.py whose formatters are also benchmarked.')
+flags.DEFINE_string(
+    'output', None,
+    'File to write the results to, as JSON.')
+
+FLAGS = flags.FLAGS
+
+# The phases of each benchmark, in the order they run.
+_PHASES = ('Generate', 'Expand', 'Write', 'AddRows', 'Print')
+
+# The number of rows generated and expanded before the next phase is
+# timed on them.
+_CHUNK_ROWS = 10000
+
+
+def _BenchmarkTables(scale, rows=None):
+  """Return the synthetic tables by name.
+
+  Args:
+    scale: The tall table has 100 * scale rows, and the others 20 * scale.
+    rows: If not None, the number of rows of every table instead.
+
+  Returns:
+    A dict with 'wide', 'tall', 'unicode', 'multiline' and 'timestamps'
+    tables. Each is a (fields, Rows) tuple, where Rows() returns a new
+    iterator over the rows, which are the same on every call.
+  """
+
+  def Fields(types):
+    return [{'name': 'column_%d' % (i,), 'type': field_type}
+            for i, field_type in enumerate(types)]
+
+  def Table(types, count, make_row):
+    def Rows():
+      rand = random.Random(scale)
+      return (make_row(rand, i) for i in xrange(count))
+    return Fields(types), Rows
+
+  def Word(rand, alphabet, length):
+    return u''.join(rand.choice(alphabet) for _ in xrange(length))
+
+  def Timestamp(rand):
+    # Mostly within a few days, as in logs, and sometimes NULL.
+    if rand.random() < 0.05:
+      return None
+    return '%.6f' % (1.4e9 + rand.random() * 3e5,)
+
+  ascii_letters = u'abcdefghijklmnopqrstuvwxyz'
+  wide_letters = u'\u4f60\u4e0d\u80fd\u6559\u8001\u72d7\u65b0\u628a\u620f'
+  accented = u'\u00e9\u00e8\u00fc\u00f1\u00e7abc'
+  tall_rows = rows or 100 * scale
+  rows = rows or 20 * scale
+  return {
+      'wide': Table(['STRING', 'INTEGER'] * 100, rows, lambda rand, _: [
+          Word(rand, ascii_letters, 8) if i % 2 == 0
+          else rand.randint(0, 10 ** 9) for i in xrange(200)]),
+      'tall': Table(['INTEGER', 'STRING', 'FLOAT'], tall_rows,
+                    lambda rand, i: [
+                        i, Word(rand, ascii_letters, rand.randint(1, 20)),
+                        rand.random()]),
+      'unicode': Table(['STRING'] * 4, rows, lambda rand, _: [
+          Word(rand, wide_letters, 10), Word(rand, accented, 12),
+          Word(rand, wide_letters, 3), Word(rand, ascii_letters, 5)]),
+      'multiline': Table(['STRING', 'INTEGER', 'STRING'], rows,
+                         lambda rand, i: [
+                             u'\n'.join(Word(rand, ascii_letters, 10)
+                                        for _ in xrange(rand.randint(1, 3))),
+                             i, Word(rand, ascii_letters, 30)]),
+      'timestamps': Table(['TIMESTAMP', 'TIMESTAMP', 'STRING'] * 2, rows,
+                          lambda rand, _: [
+                              Timestamp(rand), Timestamp(rand),
+                              Word(rand, ascii_letters, 8)] * 2),
+      }
+
+
+def _MaxRssKiB():
+  usage = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+  # Linux reports KiB and OS X bytes.
+  return usage // 1024 if sys.platform == 'darwin' else usage
+
+
+def _Chunks(rows):
+  """Yields lists of up to _CHUNK_ROWS rows from an iterator of rows."""
+  while True:
+    chunk = list(itertools.islice(rows, _CHUNK_ROWS))
+    if not chunk:
+      return
+    yield chunk
+
+
+def _RunBenchmark(module, table_format, fields, rows):
+  """Time each phase of formatting rows with a formatter, in this process.
+
+  Args:
+    module: The table_formatter module to get the formatter from.
+    table_format: The name of the format.
+    fields: The fields of the table.
+    rows: A function that returns a new iterator over the rows.
+
+  Returns:
+    A dict with the 'seconds' and the growth in the process's memory
+    high-water mark, 'maxRssGrowthKiB', of each phase.
+  """
+  # Rows are expanded as they would be for this release's formatter.
+  expand_formatter = table_formatter.GetFormatter(table_format)
+
+  def Expand(chunk):
+    return list(bq._ExpandForPrinting(fields, chunk, expand_formatter))
+
+  def Timed(prepare, run):
+    """Returns the seconds spent in run(chunk) on each prepared chunk."""
+    seconds = 0
+    for chunk in _Chunks(rows()):
+      chunk = prepare(chunk)
+      start_time = time.time()
+      run(chunk)
+      seconds += time.time() - start_time
+    return seconds
+
+  def Generate():
+    start_time = time.time()
+    for _ in _Chunks(rows()):
+      pass
+    return time.time() - start_time
+
+  def Write():
+    with open(os.devnull, 'wb') as output:
+      writer = module.GetFormatter(table_format)
+      writer.AddFields(fields)
+      start_time = time.time()
+      writer.Begin(output)
+      seconds = time.time() - start_time
+
+      def WriteRows(chunk):
+        for row in chunk:
+          writer.WriteRow(row)
+      seconds += Timed(Expand, WriteRows)
+      start_time = time.time()
+      writer.End()
+      return seconds + time.time() - start_time
+
+  def Print():
+    with open(os.devnull, 'wb') as output:
+      start_time = time.time()
+      formatter.Print(output)
+      return time.time() - start_time
+
+  formatter = module.GetFormatter(table_format)
+  formatter.AddFields(fields)
+  runs = {
+      'Generate': Generate,
+      'Expand': lambda: Timed(lambda chunk: chunk, Expand),
+      'Write': Write,
+      'AddRows': lambda: Timed(Expand, formatter.AddRows),
+      'Print': Print,
+      }
+  result = {}
+  for phase in _PHASES:
+    start_rss = _MaxRssKiB()
+    seconds = runs[phase]()
+    result[phase] = {
+        'seconds': round(seconds, 6),
+        'maxRssGrowthKiB': _MaxRssKiB() - start_rss,
+        }
+  return result
+
+
+def _RunIsolated(function, *args):
+  """Return function(*args), run in a child process where possible.
+
+  Each benchmark runs in its own process, so that its memory high-water
+  mark isn't hidden by an earlier benchmark's, and so that running out
+  of memory only ends that benchmark.
+
+  Returns:
+    A dict with the 'result' of function, or an 'error' describing why
+    there is none.
+  """
+  if not hasattr(os, 'fork'):
+    return {'result': function(*args)}
+  read_fd, write_fd = os.pipe()
+  pid = os.fork()
+  if not pid:
+    os.close(read_fd)
+    try:
+      data = json.dumps({'result': function(*args)})
+    except Exception, e:  # pylint: disable=broad-except
+      data = json.dumps({'error': '%s: %s' % (type(e).__name__, e)})
+    with os.fdopen(write_fd, 'w') as f:
+      f.write(data)
+    os._exit(0)  # pylint: disable=protected-access
+  os.close(write_fd)
+  with os.fdopen(read_fd) as f:
+    data = f.read()
+  _, status = os.waitpid(pid, 0)
+  if data:
+    return json.loads(data)
+  if os.WIFSIGNALED(status):
+    return {'error': 'Killed by signal %d' % (os.WTERMSIG(status),)}
+  return {'error': 'Exited with status %d' % (os.WEXITSTATUS(status),)}
+
+
+def RunBenchmarks(scale, formats, tables=None, rows=None, baseline=None):
+  """Benchmark each format on each synthetic table.
+
+  Args:
+    scale: The scale of the tables, as for _BenchmarkTables.
+    formats: The names of the formats to benchmark.
+    tables: The names of the tables to benchmark, or None for all.
+    rows: The number of rows of every table, as for _BenchmarkTables.
+    baseline: Optional. An older table_formatter module whose formatters
+      are also benchmarked.
+
+  Returns:
+    A dict of results that can be written as JSON, with a list of
+    'results', one per format, table and phase, or with an 'error' if
+    the benchmark of a format and table failed.
+  """
+  modules = [('', table_formatter)]
+  if baseline:
+    modules.append(('@baseline', baseline))
+  results = []
+  for table_name, (fields, table_rows) in sorted(
+      _BenchmarkTables(scale, rows).items()):
+    if tables and table_name not in tables:
+      continue
+    for table_format in formats:
+      for suffix, module in modules:
+        run = _RunIsolated(_RunBenchmark, module, table_format, fields,
+                           table_rows)
+        result = {
+            'format': table_format + suffix,
+            'table': table_name,
+            'columns': len(fields),
+            }
+        if 'error' in run:
+          result['error'] = run['error']
+          results.append(result)
+          continue
+        phases = run['result']
+        row_count = sum(1 for _ in table_rows())
+        for phase in _PHASES:
+          seconds = phases[phase]['seconds']
+          result = dict(result, **{
+              'phase': phase,
+              'rows': row_count,
+              'seconds': seconds,
+              'rowsPerSecond': int(row_count / max(seconds, 1e-6)),
+              'maxRssGrowthKiB': phases[phase]['maxRssGrowthKiB'],
+              })
+          results.append(result)
+  return {
+      'scale': scale,
+      'python': platform.python_version(),
+      'platform': platform.platform(),
+      'time': int(time.time()),
+      'command': ' '.join(sys.argv[1:]),
+      'results': results,
+      }
+
+
+def main(unused_argv):
+  unknown = set(FLAGS.formats) - set(table_formatter.FORMATTERS)
+  if unknown:
+    raise app.UsageError('Unknown formats: %s' % (', '.join(sorted(unknown)),))
+  baseline = None
+  if FLAGS.baseline:
+    baseline = imp.load_source('baseline_table_formatter', FLAGS.baseline)
+  report = RunBenchmarks(FLAGS.scale, FLAGS.formats, tables=FLAGS.tables,
+                         rows=FLAGS.rows, baseline=baseline)
+  if FLAGS.output:
+    with open(FLAGS.output, 'w') as f:
+      json.dump(report, f, indent=2, sort_keys=True)
+  for result in report['results']:
+    if 'error' in result:
+      print '%(format)-19s %(table)-10s failed: %(error)s' % result
+      continue
+    print ('%(format)-19s %(table)-10s %(phase)-8s %(rows)8d rows '
+           '%(seconds)9.3fs %(rowsPerSecond)9d rows/s '
+           '%(maxRssGrowthKiB)7d KiB' % result)
+
+
+if __name__ == '__main__':
+  app.run()
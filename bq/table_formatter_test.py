@@ -20,6 +20,11 @@
 
 
 
+import cStringIO
+import os
+import shutil
+import tempfile
+
 from google.apputils import googletest
 import table_formatter
 
@@ -58,6 +63,25 @@ class TableFormatterTest(googletest.TestCase):
       self.assertTrue(all(ord(c) <= 127 for c in str(formatter)))
       self.assertTrue(any(ord(c) > 127 for c in unicode(formatter)))
 
+  def testWriteRows(self):
+    if type(self) != TableFormatterTest:
+      rows = [[11, u'你不能教老狗新把戏'], [None, 'two\nlines, "quoted"']]
+      printed = cStringIO.StringIO()
+      formatter = self.format_class()
+      formatter.AddColumns(('count', 'message'))
+      formatter.AddRows(rows)
+      formatter.Print(printed)
+
+      for rows in (rows, []):
+        written = cStringIO.StringIO()
+        formatter = self.format_class()
+        formatter.AddColumns(('count', 'message'))
+        formatter.Begin(written)
+        formatter.WriteRows(iter(rows))
+        formatter.End()
+        self.assertEquals(printed.getvalue() if rows else '',
+                          written.getvalue())
+
 
 class PrettyFormatterTest(TableFormatterTest):
 
@@ -143,6 +167,22 @@ class PrettyFormatterTest(TableFormatterTest):
     self.assertRaises(table_formatter.FormatterException,
                       self.PF.FormatCell, 'ab\na', 5)
 
+  def testEastAsianWidth(self):
+    formatter = table_formatter.PrettyFormatter()
+    formatter.AddColumns((u'\u540d\u524d', 'n'))
+    formatter.AddRow([u'\u4f60\u597d\u4e16\u754c', u'e\u0301'])
+    self.assertEquals([8, 1], formatter.column_widths)
+    self.assertEquals([
+        u'+----------+---+',
+        u'|   \u540d\u524d   | n |',
+        u'+----------+---+',
+        u'| \u4f60\u597d\u4e16\u754c | e\u0301 |',
+        u'+----------+---+'], unicode(formatter).splitlines())
+    self.assertEquals(u'\u4f60...',
+                      self.PF.Abbreviate(u'\u4f60\u597d\u4e16', 5))
+    self.assertEquals(u'\u4f60\u597d...',
+                      self.PF.Abbreviate(u'\u4f60\u597d\u4e16\u754c', 7))
+
   def testFormatRow(self):
     formatter = table_formatter.PrettyFormatter()
     formatter.AddColumns(('one', 'two'))
@@ -234,6 +274,41 @@ class PrettyFormatterTest(TableFormatterTest):
     formatter.AddColumns(('a', 'b'))
     self.assertEquals('', str(formatter))
 
+  def testWriteRowsAfterSample(self):
+    output = cStringIO.StringIO()
+    formatter = table_formatter.PrettyFormatter(sample_rows=1)
+    formatter.AddColumns(('a', 'b'))
+    formatter.Begin(output)
+    formatter.WriteRow(['x', 'y'])
+    formatter.WriteRow(['z', 'w'])
+    formatter.WriteRow(['two\nlines', 'v'])
+    self.assertEquals(0, len(formatter))
+    formatter.End()
+    self.assertEquals([
+        '+---+---+',
+        '| a | b |',
+        '+---+---+',
+        '| x | y |',
+        '| z | w |',
+        '+---+---+',
+        '+-------+---+',
+        '|   a   | b |',
+        '+-------+---+',
+        '| two   | v |',
+        '| lines |   |',
+        '+-------+---+'], output.getvalue().splitlines())
+
+  def testMaxColumnWidth(self):
+    formatter = table_formatter.PrettyFormatter(max_column_width=5)
+    formatter.AddColumns(('a', 'longer header'))
+    formatter.AddRow(['abcdefgh', 'b'])
+    self.assertEquals([
+        '+-------+-------+',
+        '|   a   | lo... |',
+        '+-------+-------+',
+        '| ab... | b     |',
+        '+-------+-------+'], str(formatter).splitlines())
+
 
 class SparsePrettyFormatterTest(TableFormatterTest):
 
@@ -277,6 +352,26 @@ class SparsePrettyFormatterTest(TableFormatterTest):
     formatter.AddColumns(('a', 'b'))
     self.assertEquals('', str(formatter))
 
+  def testWriteRowsAfterSample(self):
+    output = cStringIO.StringIO()
+    formatter = table_formatter.SparsePrettyFormatter(sample_rows=2)
+    formatter.AddColumns(('a', 'b'))
+    formatter.Begin(output)
+    formatter.WriteRow(['x', 'y'])
+    self.assertEquals('', output.getvalue())
+    formatter.WriteRow(['xy', 'z'])
+    formatter.WriteRow(['xyz', 'w'])
+    self.assertEquals(0, len(formatter))
+    formatter.End()
+    self.assertEquals([
+        '  a    b  ',
+        ' ---- --- ',
+        '  x    y  ',
+        '  xy   z  ',
+        '   a    b  ',
+        ' ----- --- ',
+        '  xyz   w  '], output.getvalue().splitlines())
+
 
 class PrettyJsonFormatterTest(TableFormatterTest):
 
@@ -311,6 +406,27 @@ class JsonFormatterTest(TableFormatterTest):
     self.assertEquals(table_repr, str(self.formatter))
 
 
+class NdjsonFormatterTest(TableFormatterTest):
+
+  def setUp(self):
+    self.format_class = table_formatter.NdjsonFormatter
+    super(NdjsonFormatterTest, self).setUp()
+
+  def testStr(self):
+    table_repr = '\n'.join((
+        '{"foo":"a","longer header":3}',
+        '{"foo":"abc","longer header":123}'))
+    self.assertEquals(table_repr, str(self.formatter))
+
+  def testTemplate(self):
+    formatter = table_formatter.NdjsonFormatter()
+    formatter.AddColumns(('100%', 'quoted "name"'))
+    formatter.AddRow([None, u'line\nbreak \u00e9'])
+    self.assertEquals(
+        u'{"100%":null,"quoted \\"name\\"":"line\\nbreak \u00e9"}',
+        unicode(formatter))
+
+
 class CsvFormatterTest(TableFormatterTest):
 
   def setUp(self):
@@ -324,6 +440,91 @@ class CsvFormatterTest(TableFormatterTest):
         'abc,123'))
     self.assertEquals(table_repr, str(self.formatter))
 
+  def testLenCountsRows(self):
+    # Not lines: neither the header nor the second line of a value count.
+    self.formatter.AddRow(['two\nlines', 1])
+    self.assertEquals(3, len(self.formatter))
+    self.assertEquals(5, len(unicode(self.formatter).splitlines()))
+    empty = table_formatter.CsvFormatter(skip_header_when_empty=False)
+    empty.AddColumns(('a', 'b'))
+    self.assertEquals(u'a,b', unicode(empty))
+    self.assertEquals(0, len(empty))
+    output = cStringIO.StringIO()
+    self.formatter.Print(output)
+    self.assertEquals(unicode(self.formatter).encode('utf8') + '\n',
+                      output.getvalue())
+
+
+class ColumnarFormatterTest(googletest.TestCase):
+
+  FIELDS = [{'name': 'i', 'type': 'INTEGER'},
+            {'name': 'f', 'type': 'FLOAT'},
+            {'name': 'b', 'type': 'BOOLEAN'},
+            {'name': 't', 'type': 'TIMESTAMP'},
+            {'name': 's', 'type': 'STRING'},
+            {'name': 'r', 'type': 'INTEGER', 'mode': 'REPEATED'}]
+  ROWS = [['1', '1.5', 'true', '1.5E9', u'\u00e9', [{'v': '1'}]],
+          [None, None, None, None, None, []],
+          ['-3', '0', 'false', '0.25', '', [{'v': '2'}, {'v': '3'}]]]
+
+  def setUp(self):
+    self.tmpdir = tempfile.mkdtemp()
+
+  def tearDown(self):
+    shutil.rmtree(self.tmpdir)
+
+  def _Read(self, data):
+    filename = os.path.join(self.tmpdir, 'table.bqcol')
+    with open(filename, 'wb') as f:
+      f.write(data)
+    return table_formatter.ColumnarReader(filename)
+
+  def testRoundTrip(self):
+    printed = cStringIO.StringIO()
+    formatter = table_formatter.ColumnarFormatter(row_group_rows=2)
+    formatter.AddFields(self.FIELDS)
+    formatter.AddRows(self.ROWS)
+    formatter.Print(printed)
+
+    written = cStringIO.StringIO()
+    formatter = table_formatter.GetFormatter('columnar', row_group_rows=2)
+    formatter.AddFields(self.FIELDS)
+    formatter.Begin(written)
+    formatter.WriteRow(self.ROWS[0])
+    formatter.WriteRow(self.ROWS[1])
+    # The first row group is written as soon as it is full.
+    self.assertTrue(len(written.getvalue()) > 64)
+    formatter.WriteRow(self.ROWS[2])
+    formatter.End()
+    self.assertEquals(printed.getvalue(), written.getvalue())
+
+    reader = self._Read(written.getvalue())
+    self.assertEquals(3, reader.num_rows)
+    self.assertEquals(['i', 'f', 'b', 't', 's', 'r'],
+                      [field['name'] for field in reader.fields])
+    self.assertEquals([1, None, -3], reader.ReadColumn('i'))
+    self.assertEquals([1.5, None, 0.0], reader.ReadColumn('f'))
+    self.assertEquals([True, None, False], reader.ReadColumn('b'))
+    self.assertEquals([1.5e9, None, 0.25], reader.ReadColumn('t'))
+    self.assertEquals([u'\u00e9', None, u''], reader.ReadColumn('s'))
+    self.assertEquals(
+        [1, 1.5, True, 1.5e9, u'\u00e9', u'[{"v":"1"}]'],
+        list(reader.ReadRows())[0])
+    reader.Close()
+
+  def testEmptyTable(self):
+    output = cStringIO.StringIO()
+    formatter = table_formatter.ColumnarFormatter()
+    formatter.AddColumns(('a',))
+    formatter.Print(output)
+    reader = self._Read(output.getvalue())
+    self.assertEquals(0, reader.num_rows)
+    self.assertEquals([], reader.ReadColumn('a'))
+    reader.Close()
+
+    self.assertRaises(table_formatter.FormatterException,
+                      self._Read, 'a,b\n1,2\n')
+
 
 class NullFormatterTest(TableFormatterTest):
 
@@ -338,5 +539,15 @@ class NullFormatterTest(TableFormatterTest):
     self.assertEquals('', unicode(self.formatter))
 
 
+class GetFormatterTest(googletest.TestCase):
+
+  def testGetFormatter(self):
+    for table_format, formatter_class in table_formatter.FORMATTERS.items():
+      self.assertEquals(formatter_class,
+                        type(table_formatter.GetFormatter(table_format)))
+    self.assertRaises(table_formatter.FormatterException,
+                      table_formatter.GetFormatter, 'bogus')
+
+
 if __name__ == '__main__':
   googletest.main()